@@ -2,13 +2,74 @@ import json
 import os
 import sys
 import argparse
-from janome.tokenizer import Tokenizer
-from gensim.models import KeyedVectors
-from gensim.models.fasttext import load_facebook_model
-import numpy as np
-from tqdm import tqdm
 
-def add_negative_scores_to_reviews(input_file, output_file, model_path):
+from embedding_store import load_word_vectors
+from sentiment_engine import SentimentScorer, WordSentimentTable
+from morph_tokenizer import BACKENDS, DEFAULT_BACKEND
+from token_cache import CachedTokenizer, TokenCache
+from tokenizer_pool import TokenizerPool
+from analysis_state import AnalysisState, analysis_config
+from metrics import add_metrics_arguments, configure_metrics, metrics, record_analysis_metrics
+from review_record import UniversityTable, encode_review
+from review_io import (is_columnar, is_jsonl, iter_university_data, iter_university_reviews, progress_to_stderr,
+                       review_text, to_review_record, write_review_records)
+
+def score_reviews(reviews, tokenizer, scorer, desc=None, state=None):
+    """
+    口コミのリストにネガティブスコアをまとめて付与する
+
+    テキストのフィールドを結合した口コミ単位のテキストを形態素解析し（解析結果はキャッシュする）、
+    SentimentScorerで全件を一括計算する。テキストがない口コミのスコアは0.0
+
+    Args:
+        reviews (list): 口コミデータのリスト（negative_scoreを追加する）
+        tokenizer (CachedTokenizer): 形態素解析器
+        scorer (SentimentScorer): ネガティブスコアの一括計算器
+        desc (str): 進捗バーの表示名
+        state (AnalysisState): 差分分析の状態（指定した場合は指紋が保存済みの口コミのスコアを再利用する）
+
+    Returns:
+        int: 新しくスコアを計算した口コミ数
+    """
+    texts = [review_text(review) for review in reviews]
+    scores = [None] * len(reviews)
+    if state is not None:
+        with metrics.stage('state'):
+            keys = [state.review_fingerprint([text]) for text in texts]
+            known = state.get_review_scores(keys)
+        scores = [known.get(key) for key in keys]
+    pending = [i for i, score in enumerate(scores) if score is None]
+    
+    pending_texts = [texts[i] for i in pending]
+    with metrics.stage('tokenize'):
+        # テキストがない口コミは解析せず、トークンなし（スコア0.0）とする
+        tokens = iter(tokenizer.tokenize_many([text for text in pending_texts if text], desc=desc))
+        token_lists = [next(tokens) if text else [] for text in pending_texts]
+    metrics.inc('texts_total', sum(1 for text in pending_texts if text))
+    metrics.inc('tokens_total', sum(len(tokens) for tokens in token_lists))
+    with metrics.stage('score'):
+        for i, score in zip(pending, scorer.score_token_lists(token_lists)):
+            scores[i] = float(score)
+    if state is not None and pending:
+        with metrics.stage('state'):
+            state.put_review_scores({keys[i]: scores[i] for i in pending})
+    metrics.inc('reviews_total', len(pending), result='scored')
+    metrics.inc('reviews_total', len(reviews) - len(pending), result='reused')
+    
+    for review, score in zip(reviews, scores):
+        review['negative_score'] = score
+    return len(pending)
+
+def prune_review_scores(state):
+    """すべての口コミを処理した後、入力から消えた（またはテキストが変わった）口コミのスコアを状態ファイルから削除する"""
+    if state is None:
+        return
+    removed = state.prune_review_scores()
+    if removed:
+        print(f"入力にない口コミのスコア {removed}件を状態ファイルから削除しました")
+
+def add_negative_scores_to_reviews(input_file, output_file, model_path, token_cache_path='.token_cache.sqlite3',
+                                   workers=1, tokenizer_backend=DEFAULT_BACKEND, state_path=None):
     """
     merged_reviews.jsonの各口コミにネガティブスコアを追加する
     
@@ -16,14 +77,28 @@ def add_negative_scores_to_reviews(input_file, output_file, model_path):
         input_file (str): 入力JSONファイルのパス（merged_reviews.json）
         output_file (str): 出力JSONファイルのパス
         model_path (str): fastTextモデルのパス
+        token_cache_path (str): 形態素解析結果のキャッシュファイル（Noneの場合はキャッシュしない）
+        workers (int): 形態素解析のワーカープロセス数（1の場合は同じプロセスで解析する）
+        tokenizer_backend (str): 形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+        state_path (str): 差分分析の状態ファイル（指定した場合は新規・変更された口コミだけをスコア計算する）
+
+    入力または出力がJSON Lines（.jsonl、'-'は標準入出力）の場合と、入力が列指向形式
+    （.parquet / .arrow）の場合は、大学1校分ずつ読み込んでスコアを付けたレコードを逐次書き出す
     """
     print("口コミごとのネガティブスコア計算を開始します...")
     
+    streaming = is_jsonl(input_file) or is_jsonl(output_file) or is_columnar(input_file)
+    
     # JSONデータの読み込み
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"{len(data)}件の大学データを読み込みました")
+        if streaming:
+            if input_file != '-' and not os.path.exists(input_file):
+                raise FileNotFoundError(input_file)
+        else:
+            # 口コミはReviewRecord（コンパクトな表現）として読み込む
+            with metrics.stage('load'):
+                data = list(iter_university_data(input_file))
+            print(f"{len(data)}件の大学データを読み込みました")
     except Exception as e:
         print(f"データ読み込みエラー: {e}")
         return
@@ -31,20 +106,9 @@ def add_negative_scores_to_reviews(input_file, output_file, model_path):
     # 事前学習済み fastText 日本語ベクトルのロード
     try:
         print(f"fastTextモデルを読み込んでいます: {model_path}")
-        # fastTextモデルの読み込み方法
-        try:
-            # まずFacebookのfastTextモデルとして読み込みを試みる
-            model = load_facebook_model(model_path)
-            model = model.wv  # word vectorsを取得
-        except Exception as e1:
-            print(f"Facebookモデルとしての読み込みに失敗しました: {e1}")
-            try:
-                # 次にWord2Vecフォーマットとして読み込みを試みる
-                model = KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='utf-8', unicode_errors='ignore')
-            except Exception as e2:
-                print(f"Word2Vecフォーマットとしての読み込みに失敗しました: {e2}")
-                # 最後にバイナリエンコーディングを変えて試みる
-                model = KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='latin1')
+        # 変換済みモデル（.kv）はメモリマップで読み込む
+        with metrics.stage('load_model'):
+            model = load_word_vectors(model_path)
         
         print("モデルの読み込みが完了しました")
         
@@ -55,8 +119,51 @@ def add_negative_scores_to_reviews(input_file, output_file, model_path):
         print(f"モデル読み込みエラー: {e}")
         return
     
-    # 形態素解析器の初期化
-    tokenizer = Tokenizer()
+    # 形態素解析器とスコア計算器の初期化
+    token_cache = TokenCache(token_cache_path) if token_cache_path else None
+    try:
+        if workers > 1:
+            tokenizer = TokenizerPool(workers, token_cache, tokenizer_backend)
+        else:
+            tokenizer = CachedTokenizer(token_cache, tokenizer_backend)
+    except ImportError as e:
+        print(f"形態素解析器の初期化エラー: {e}")
+        if token_cache:
+            token_cache.close()
+        return
+    scorer = SentimentScorer(model, axis)
+    state = None
+    if state_path:
+        state = AnalysisState(state_path, analysis_config(WordSentimentTable.fingerprint(model, axis), tokenizer.version))
+    scored_count = 0
+    
+    if streaming:
+        processed_reviews = 0
+        
+        def scored_records():
+            nonlocal processed_reviews, scored_count
+            universities = UniversityTable()
+            for uni_idx, (university, reviews) in enumerate(iter_university_reviews(input_file)):
+                university_name = university.get('university_name', 'Unknown')
+                print(f"[{uni_idx+1}] {university_name}の口コミを処理中...")
+                # 1校分の口コミをまとめてスコア計算してから書き出す
+                reviews = list(reviews)
+                scored_count += score_reviews(reviews, tokenizer, scorer, desc=f"{university_name}の口コミ処理", state=state)
+                for review in reviews:
+                    processed_reviews += 1
+                    yield to_review_record(university, review, universities)
+        
+        write_review_records(output_file, scored_records())
+        prune_review_scores(state)
+        print(f"処理が完了しました。{processed_reviews}件の口コミにネガティブスコアを追加しました。")
+        print(f"スコア計算: 新規・変更 {scored_count}件, 前回の結果を利用 {processed_reviews - scored_count}件")
+        print(f"形態素解析: キャッシュ利用 {tokenizer.hits}件, 新規解析 {tokenizer.misses}件")
+        record_analysis_metrics(tokenizer, scorer)
+        tokenizer.close()
+        if state:
+            state.close()
+        print(f"結果は {output_file} に保存されました。")
+        return
     
     # 各大学の各口コミにネガティブスコアを追加
     total_reviews = sum(len(uni['reviews']) for uni in data)
@@ -66,60 +173,23 @@ def add_negative_scores_to_reviews(input_file, output_file, model_path):
         university_name = uni['university_name']
         print(f"[{uni_idx+1}/{len(data)}] {university_name}の口コミを処理中...")
         
-        for review in tqdm(uni['reviews'], desc=f"{university_name}の口コミ処理"):
-            # 口コミのテキストを取得（複数のフィールドを結合）
-            review_text = ""
-            text_fields = [
-                'review_content', 'overall_rating_detail',
-                '講義・授業_detail', 'laboratory_seminar_detail', 'career_detail',
-                'access_location_detail', 'facilities_detail', 'friendship_romance_detail',
-                'student_life_detail', 'department_curriculum_detail', 'gender_ratio_detail',
-                'motivation_detail', 'career_path_detail'
-            ]
-            
-            for field in text_fields:
-                if field in review and review[field]:
-                    review_text += review[field] + " "
-            
-            if not review_text.strip():  # テキストが空の場合はスキップ
-                review['negative_score'] = 0.0
-                processed_reviews += 1
-                continue
-            
-            # 1) 形態素解析して単語リスト
-            tokens = [t.surface for t in tokenizer.tokenize(review_text) if t.part_of_speech.startswith('名詞,一般')]
-            
-            # 2) レビュー全体のベクトルを平均ベクトルで近似
-            vecs = []
-            for w in tokens:
-                if w in model:
-                    vecs.append(model[w])
-            
-            # 3) ネガティブスコアを計算
-            if vecs:
-                review_vec = np.mean(vecs, axis=0)
-                # ベクトルのノルムが0でないことを確認
-                review_norm = np.linalg.norm(review_vec)
-                axis_norm = np.linalg.norm(axis)
-                if review_norm > 0 and axis_norm > 0:
-                    # ネガティブ度合い = cos(review_vec, axis)
-                    neg = np.dot(review_vec, axis) / (review_norm * axis_norm)
-                else:
-                    neg = 0.0
-            else:
-                neg = 0.0
-            
-            # 4) 口コミにネガティブスコアを追加
-            review['negative_score'] = float(neg)
-            processed_reviews += 1
+        scored_count += score_reviews(uni['reviews'], tokenizer, scorer, desc=f"{university_name}の口コミ処理", state=state)
+        processed_reviews += len(uni['reviews'])
         
         print(f"{university_name}の口コミ処理が完了しました。進捗: {processed_reviews}/{total_reviews}")
     
     # 更新したデータを保存
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with metrics.stage('write'), open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=encode_review)
+    prune_review_scores(state)
     
     print(f"処理が完了しました。{processed_reviews}件の口コミにネガティブスコアを追加しました。")
+    print(f"スコア計算: 新規・変更 {scored_count}件, 前回の結果を利用 {processed_reviews - scored_count}件")
+    print(f"形態素解析: キャッシュ利用 {tokenizer.hits}件, 新規解析 {tokenizer.misses}件")
+    record_analysis_metrics(tokenizer, scorer)
+    tokenizer.close()
+    if state:
+        state.close()
     print(f"結果は {output_file} に保存されました。")
     return data
 
@@ -127,16 +197,29 @@ if __name__ == "__main__":
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description='merged_reviews.jsonの各口コミにネガティブスコアを追加する')
     parser.add_argument('--input', '-i', default='merged_reviews.json',
-                        help='入力JSONファイルのパス（デフォルト: merged_reviews.json）')
+                        help='入力JSONファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: merged_reviews.json）')
     parser.add_argument('--output', '-o', default='merged_reviews_with_scores.json',
-                        help='出力JSONファイルのパス（デフォルト: merged_reviews_with_scores.json）')
+                        help='出力JSONファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: merged_reviews_with_scores.json）')
     parser.add_argument('--model', '-m', default='cc.ja.300.bin',
-                        help='fastTextモデルのパス（デフォルト: cc.ja.300.bin）')
+                        help='fastTextモデルのパス（embedding_store.pyで変換した.kvも可、デフォルト: cc.ja.300.bin）')
+    parser.add_argument('--token-cache', default='.token_cache.sqlite3',
+                        help='形態素解析結果のキャッシュファイル（デフォルト: .token_cache.sqlite3）')
+    parser.add_argument('--no-token-cache', action='store_true',
+                        help='形態素解析結果をキャッシュしない')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='形態素解析のワーカープロセス数（デフォルト: 1）')
+    parser.add_argument('--tokenizer', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f'形態素解析器（デフォルト: {DEFAULT_BACKEND}）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='前回から追加・変更された口コミだけをスコア計算する')
+    parser.add_argument('--state-file', default='.analysis_state.sqlite3',
+                        help='差分分析の状態ファイル（デフォルト: .analysis_state.sqlite3）')
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
     
     # 入力ファイルの存在確認
-    if not os.path.exists(args.input):
+    if args.input != '-' and not os.path.exists(args.input):
         print(f"エラー: 入力ファイルが見つかりません: {args.input}")
         sys.exit(1)
     
@@ -147,4 +230,7 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # 処理の実行
-    add_negative_scores_to_reviews(args.input, args.output, args.model)
+    with progress_to_stderr(args.output), configure_metrics(args, 'add_negative_scores_to_reviews'):
+        add_negative_scores_to_reviews(args.input, args.output, args.model,
+                                       None if args.no_token_cache else args.token_cache, args.workers, args.tokenizer,
+                                       args.state_file if args.incremental else None)
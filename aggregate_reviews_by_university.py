@@ -1,69 +1,79 @@
 import json
 import os
+import argparse
 
-def aggregate_reviews_by_university():
+from metrics import add_metrics_arguments, configure_metrics, metrics
+from review_io import (TEXT_FIELDS, UNIVERSITY_FIELDS, JsonlWriter, is_columnar, is_jsonl,
+                       iter_university_reviews, progress_to_stderr)
+
+def aggregate_reviews_by_university(input_file='merged_reviews.json', output_file='aggregated_reviews_by_university.json'):
     """
     merged_reviews.jsonから大学別に口コミを統合するプログラム
     各大学の口コミ文章（review_content）を抽出して、大学ごとにまとめます
+
+    入出力がJSON Lines（.jsonl、'-'は標準入出力）の場合は大学1校分ずつ読み込み、
+    口コミテキストを {"university_name", "review"} の1行として逐次書き出します。
+    入力が列指向形式（.parquet / .arrow）の場合は大学名と本文の列だけを読み込みます
     """
     print("大学別口コミ統合処理を開始します...")
     
     # merged_reviews.jsonからデータを読み込む
     try:
-        with open('merged_reviews.json', 'r', encoding='utf-8') as file:
-            merged_data = json.load(file)
-            print(f"{len(merged_data)}件の大学データを読み込みました")
+        if input_file != '-' and not os.path.exists(input_file):
+            raise FileNotFoundError(input_file)
+        universities = iter_university_reviews(input_file, columns=[*UNIVERSITY_FIELDS, *TEXT_FIELDS])
+        if not is_jsonl(input_file) and not is_columnar(input_file):
+            with metrics.stage('load'):
+                universities = list(universities)
+            print(f"{len(universities)}件の大学データを読み込みました")
     except Exception as e:
         print(f"データ読み込みエラー: {e}")
         return
     
+    writer = JsonlWriter(output_file) if is_jsonl(output_file) else None
+    
     # 大学別に口コミを統合するための辞書
     university_reviews = {}
+    total_reviews = 0
     
     # 各大学のデータを処理
-    for university_data in merged_data:
-        university_name = university_data.get('university_name', 'Unknown')
-        reviews = university_data.get('reviews', [])
+    for university, reviews in universities:
+        university_name = university.get('university_name', 'Unknown')
         
-        # この大学の口コミテキストを格納するセット（重複を排除するため）
-        review_texts_set = set()
+        # この大学の口コミテキストを格納する辞書（重複を排除しつつ出現順を保つため）
+        review_texts = {}
         
-        # 各口コミから全ての文章を抽出
-        for review in reviews:
-            # 抽出する詳細情報のフィールド
-            detail_fields = [
-                'review_content',
-                'overall_rating_detail',
-                '講義・授業_detail',
-                'laboratory_seminar_detail',
-                'career_detail',
-                'access_location_detail',
-                'facilities_detail',
-                'friendship_romance_detail',
-                'student_life_detail',
-                'department_curriculum_detail',
-                'gender_ratio_detail',
-                'motivation_detail',
-                'career_path_detail'
-            ]
-            
-            # 各フィールドの値を抽出
-            for field in detail_fields:
-                text = review.get(field, '')
-                if text and text.strip():
-                    review_texts_set.add(text.strip())
+        # 各口コミから全ての文章を抽出（JSON Linesの入力では読み込みもこのステージに含まれる）
+        with metrics.stage('aggregate', university=university_name):
+            for review in reviews:
+                # 各フィールドの値を抽出
+                for field in TEXT_FIELDS:
+                    text = review.get(field, '')
+                    if text and text.strip():
+                        text = text.strip()
+                        if text not in review_texts:
+                            review_texts[text] = None
+                            if writer:
+                                writer.write({"university_name": university_name, "review": text})
         
-        # セットをリストに変換
-        review_texts = list(review_texts_set)
+        total_reviews += len(review_texts)
+        metrics.inc('universities_total')
+        metrics.inc('texts_total', len(review_texts))
         
         # 大学名をキーとして口コミを辞書に追加
-        if university_name not in university_reviews:
-            university_reviews[university_name] = []
-        
-        university_reviews[university_name].extend(review_texts)
+        if not writer:
+            if university_name not in university_reviews:
+                university_reviews[university_name] = []
+            university_reviews[university_name].extend(review_texts)
         
         print(f"{university_name}: {len(review_texts)}件の口コミを統合しました")
     
+    if writer:
+        writer.close()
+        print(f"処理が完了しました。大学データが {output_file} に保存されました。")
+        print(f"合計口コミ数: {total_reviews}件")
+        return
+    
     # 結果を整形
     result = [
         {
@@ -74,12 +84,20 @@ def aggregate_reviews_by_university():
     ]
     
     # 統合したデータを新しいJSONファイルに保存
-    output_file = 'aggregated_reviews_by_university.json'
-    with open(output_file, 'w', encoding='utf-8') as outfile:
+    with metrics.stage('write'), open(output_file, 'w', encoding='utf-8') as outfile:
         json.dump(result, outfile, ensure_ascii=False, indent=2)
     
     print(f"処理が完了しました。{len(result)}件の大学データが {output_file} に保存されました。")
     print(f"合計口コミ数: {sum(len(univ['reviews']) for univ in result)}件")
 
 if __name__ == "__main__":
-    aggregate_reviews_by_university()
+    parser = argparse.ArgumentParser(description='マージした口コミデータを大学別に統合する')
+    parser.add_argument('--input', '-i', default='merged_reviews.json',
+                        help='入力ファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: merged_reviews.json）')
+    parser.add_argument('--output', '-o', default='aggregated_reviews_by_university.json',
+                        help='出力ファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: aggregated_reviews_by_university.json）')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    
+    with progress_to_stderr(args.output), configure_metrics(args, 'aggregate_reviews_by_university'):
+        aggregate_reviews_by_university(args.input, args.output)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import Counter
+
+# 1回のSQLで問い合わせるキーの数（SQLiteの変数の上限より小さくする）
+QUERY_CHUNK = 500
+
+
+def analysis_config(model_fingerprint, tokenizer_version):
+    """
+    スコアを左右する設定（モデル・軸と形態素解析器）を表す文字列を返す
+
+    設定が変わると保存済みの結果は使われず、別のエントリとして計算し直される
+    """
+    return f'{model_fingerprint};{tokenizer_version}'
+
+
+def fingerprint(config, texts):
+    """設定とテキストのリストから、口コミ（テキスト）の指紋を計算する"""
+    return hashlib.sha1('\0'.join([config, *texts]).encode('utf-8')).hexdigest()
+
+
+class AnalysisState:
+    """
+    差分分析の状態を保存するSQLiteファイル（スレッドセーフ）
+
+    - review_scores: 口コミの指紋ごとのネガティブスコア（add_negative_scores_to_reviews.py）
+    - texts: 大学ごとのテキストの指紋・出現回数・スコア・単語数（analyze_university_reviews.py）
+
+    今回の実行で問い合わせた口コミと更新した大学を記録しておき、入力をすべて処理した後に
+    prune_review_scores / prune_universitiesで入力から消えた分を削除する
+    """
+
+    def __init__(self, path='.analysis_state.sqlite3', config=''):
+        """
+        Args:
+            path (str): 状態ファイルのパス（存在しない場合は新規作成）
+            config (str): analysis_configで作った設定の文字列
+        """
+        self.path = path
+        self.config = config
+        self.lock = threading.Lock()
+        # パイプラインでは複数のステージが同時に書き込むため、ロックの解放を長めに待つ
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS review_scores ('
+            ' fingerprint TEXT PRIMARY KEY,'
+            ' score REAL NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS texts ('
+            ' config TEXT NOT NULL,'
+            ' university TEXT NOT NULL,'
+            ' fingerprint TEXT NOT NULL,'
+            ' occurrences INTEGER NOT NULL,'
+            ' score REAL NOT NULL,'
+            ' token_counts TEXT NOT NULL,'
+            ' PRIMARY KEY (config, university, fingerprint))'
+        )
+        # 以前の状態ファイルにある大学ごとの単語出現頻度の集計は、textsの単語数から作るようになったため使わない
+        self.conn.execute('DROP TABLE IF EXISTS word_counts')
+        self.conn.commit()
+        self.seen_reviews = set()
+        self.seen_universities = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def review_fingerprint(self, texts):
+        return fingerprint(self.config, texts)
+
+    def get_review_scores(self, fingerprints):
+        """
+        保存済みの口コミのスコアを返す（問い合わせた指紋は今回の入力にある口コミとして記録する）
+
+        Returns:
+            dict: 指紋 -> スコア（保存されていない指紋は含まない）
+        """
+        fingerprints = list(set(fingerprints))
+        found = {}
+        with self.lock:
+            self.seen_reviews.update(fingerprints)
+            for start in range(0, len(fingerprints), QUERY_CHUNK):
+                chunk = fingerprints[start:start + QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT fingerprint, score FROM review_scores WHERE fingerprint IN ({placeholders})', chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_review_scores(self, scores):
+        """口コミのスコア（指紋 -> スコア）を保存する"""
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO review_scores (fingerprint, score) VALUES (?, ?)', list(scores.items())
+            )
+            self.conn.commit()
+
+    def text_occurrences(self, university):
+        """保存済みのテキストの指紋と出現回数を返す"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT fingerprint, occurrences FROM texts WHERE config = ? AND university = ?',
+                (self.config, university),
+            ).fetchall()
+        return Counter(dict(rows))
+
+    def text_results(self, university, fingerprints):
+        """
+        指定したテキストの保存済みの分析結果を返す
+
+        Returns:
+            dict: 指紋 -> (スコア, 単語数のCounter（テキスト内で最初に現れた順）)
+        """
+        fingerprints = list(fingerprints)
+        found = {}
+        with self.lock:
+            for start in range(0, len(fingerprints), QUERY_CHUNK):
+                chunk = fingerprints[start:start + QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    'SELECT fingerprint, score, token_counts FROM texts'
+                    f' WHERE config = ? AND university = ? AND fingerprint IN ({placeholders})',
+                    [self.config, university, *chunk],
+                ).fetchall()
+                for key, score, token_counts in rows:
+                    found[key] = (score, Counter(json.loads(token_counts)))
+        return found
+
+    def update_university(self, university, occurrences, added):
+        """
+        大学のテキストの増減を保存する
+
+        Args:
+            university (str): 大学名
+            occurrences (Counter): 現在のテキストの指紋 -> 出現回数
+            added (dict): 新しく分析したテキストの指紋 -> (スコア, 単語数のCounter)
+        """
+        with self.lock:
+            self.seen_universities.add(university)
+            stored = dict(self.conn.execute(
+                'SELECT fingerprint, occurrences FROM texts WHERE config = ? AND university = ?',
+                (self.config, university),
+            ).fetchall())
+            removed = [(self.config, university, key) for key in stored if key not in occurrences]
+            self.conn.executemany(
+                'DELETE FROM texts WHERE config = ? AND university = ? AND fingerprint = ?', removed
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO texts (config, university, fingerprint, occurrences, score, token_counts)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (self.config, university, key, occurrences[key], score, json.dumps(counts, ensure_ascii=False))
+                    for key, (score, counts) in added.items()
+                ],
+            )
+            self.conn.executemany(
+                'UPDATE texts SET occurrences = ? WHERE config = ? AND university = ? AND fingerprint = ?',
+                [
+                    (count, self.config, university, key)
+                    for key, count in occurrences.items()
+                    if key in stored and key not in added and stored[key] != count
+                ],
+            )
+            self.conn.commit()
+
+    def _delete_unseen(self, table, column, seen, where='', params=()):
+        """tableのうち、columnの値がseenに含まれない行を削除し、削除した行数を返す"""
+        with self.lock:
+            self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS seen (value TEXT PRIMARY KEY)')
+            self.conn.execute('DELETE FROM seen')
+            self.conn.executemany('INSERT INTO seen (value) VALUES (?)', [(value,) for value in seen])
+            cursor = self.conn.execute(
+                f'DELETE FROM {table} WHERE {where}{column} NOT IN (SELECT value FROM seen)', params
+            )
+            self.conn.execute('DELETE FROM seen')
+            self.conn.commit()
+            return cursor.rowcount
+
+    def prune_review_scores(self):
+        """
+        今回の実行で問い合わせなかった（入力から消えたか、テキストが変わった）口コミのスコアを削除する
+
+        入力をすべて処理した後に呼び出す。別の設定（モデル・形態素解析器）で計算したスコアも削除される
+
+        Returns:
+            int: 削除した件数
+        """
+        return self._delete_unseen('review_scores', 'fingerprint', self.seen_reviews)
+
+    def prune_universities(self):
+        """
+        現在の設定で保存した大学のうち、今回の実行で更新しなかった（入力から消えた）大学のテキストを削除する
+
+        入力をすべて処理した後に呼び出す
+
+        Returns:
+            int: 削除した件数
+        """
+        return self._delete_unseen('texts', 'university', self.seen_universities, 'config = ? AND ', (self.config,))
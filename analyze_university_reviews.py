@@ -3,12 +3,140 @@ import os
 import sys
 import argparse
 import urllib.request
+from collections import Counter
+from itertools import chain
 from tqdm import tqdm
-from janome.tokenizer import Tokenizer
-from gensim.models import KeyedVectors
 import numpy as np
 
-def analyze_university_reviews(input_file, output_file, model_path):
+from embedding_store import load_word_vectors
+from sentiment_engine import SentimentScorer, WordSentimentTable
+from morph_tokenizer import BACKENDS, DEFAULT_BACKEND
+from token_cache import CachedTokenizer, TokenCache
+from tokenizer_pool import TokenizerPool
+from analysis_state import AnalysisState, analysis_config
+from metrics import add_metrics_arguments, configure_metrics, metrics, record_analysis_metrics
+from review_io import JsonlWriter, is_jsonl, iter_aggregated_universities, progress_to_stderr
+from term_matrix import TermMatrixBuilder
+
+def analyze_university(university_name, reviews, tokenizer, scorer, terms, top_k=None):
+    """
+    1大学分の口コミテキストからネガティブスコアと単語頻度を計算する
+
+    Args:
+        university_name (str): 大学名
+        reviews (list): 口コミテキストのリスト
+        tokenizer (CachedTokenizer): 形態素解析器
+        scorer (SentimentScorer): 口コミのネガティブスコアの一括計算器
+        terms (TermMatrixBuilder): 大学×単語の頻度行列（単語の感情スコア表を持つ）
+        top_k (int): word_infoに含める単語数（Noneの場合はすべて）
+
+    Returns:
+        dict: 大学の分析結果
+    """
+    # 1) 形態素解析して口コミごとの単語リスト（空の口コミはスキップ）
+    with metrics.stage('tokenize', university=university_name):
+        token_lists = tokenizer.tokenize_many(
+            [rev for rev in reviews if rev and not rev.isspace()], desc=f"{university_name}の形態素解析"
+        )
+    count_tokens(token_lists)
+    
+    # 2) 口コミごとのネガティブ度合い = cos(平均ベクトル, axis) を一括計算
+    with metrics.stage('score', university=university_name):
+        neg_scores = scorer.score_token_lists(token_lists)
+    
+    # 大学全体のネガティブ度合い = レビューごとの平均
+    uni_neg = float(np.mean(neg_scores)) if len(neg_scores) else 0.0
+    
+    # 単語出現頻度をまとめて数える
+    word_counts = Counter(chain.from_iterable(token_lists))
+    
+    return {
+        "university_name": university_name,
+        "negative_score": uni_neg,
+        "word_info": build_word_info(university_name, word_counts, terms, top_k),
+        "review_count": len(reviews),
+        "analyzed_review_count": len(neg_scores)
+    }
+
+def count_tokens(token_lists):
+    """形態素解析したテキスト数とトークン数を計測器に加算する"""
+    metrics.inc('texts_total', len(token_lists))
+    metrics.inc('tokens_total', sum(len(tokens) for tokens in token_lists))
+
+def build_word_info(university_name, word_counts, terms, top_k=None):
+    """
+    単語出現頻度を頻度行列の行として追加し、感情スコア付きの単語情報を頻度順に作る
+
+    Args:
+        university_name (str): 大学名
+        word_counts (dict): 単語 -> 出現回数（同じ回数の単語はこの順に並ぶ）
+        terms (TermMatrixBuilder): 大学×単語の頻度行列（単語の感情スコアは語彙ごとに1回だけ表から引く）
+        top_k (int): 含める単語数（Noneの場合はすべて）
+
+    Returns:
+        dict: 単語 -> {count, sentiment_score, sentiment}
+    """
+    with metrics.stage('word_info'):
+        ids, counts = terms.add(university_name, word_counts)
+        return terms.word_info(ids, counts, top_k)
+
+def analyze_university_incremental(university_name, reviews, tokenizer, scorer, terms, state, top_k=None):
+    """
+    前回の分析結果を再利用して1大学分の分析結果を作る
+
+    新しく現れたテキストだけを形態素解析・スコア計算し、それ以外は保存済みのテキストごとの
+    スコアと単語数を使う。集計はanalyze_universityと同じくテキストの順に行うため、
+    ネガティブスコアも同じ出現回数の単語の並び順も全件を分析した場合と一致する
+
+    Args:
+        university_name (str): 大学名
+        reviews (list): 口コミテキストのリスト
+        tokenizer (CachedTokenizer): 形態素解析器
+        scorer (SentimentScorer): 口コミのネガティブスコアの一括計算器
+        terms (TermMatrixBuilder): 大学×単語の頻度行列（単語の感情スコア表を持つ）
+        state (AnalysisState): 差分分析の状態
+        top_k (int): word_infoに含める単語数（Noneの場合はすべて）
+
+    Returns:
+        tuple: (大学の分析結果, 新しく分析したテキスト数)
+    """
+    texts = [rev for rev in reviews if rev and not rev.isspace()]
+    keys = [state.review_fingerprint([text]) for text in texts]
+    occurrences = Counter(keys)
+    previous = state.text_occurrences(university_name)
+    
+    # 新しいテキストだけを解析する
+    first_text = {}
+    for key, text in zip(keys, texts):
+        first_text.setdefault(key, text)
+    new_keys = [key for key in occurrences if key not in previous]
+    with metrics.stage('tokenize', university=university_name):
+        token_lists = tokenizer.tokenize_many([first_text[key] for key in new_keys], desc=f"{university_name}の形態素解析")
+    count_tokens(token_lists)
+    with metrics.stage('score', university=university_name):
+        scores = scorer.score_token_lists(token_lists)
+    added = {key: (float(score), Counter(tokens)) for key, score, tokens in zip(new_keys, scores, token_lists)}
+    with metrics.stage('state'):
+        results = {**state.text_results(university_name, [key for key in occurrences if key not in added]), **added}
+        state.update_university(university_name, occurrences, added)
+    
+    # テキストの順に集計し、単語はanalyze_universityと同じく最初に現れた順に並べる
+    word_counts = Counter()
+    for key in keys:
+        word_counts.update(results[key][1])
+    neg_scores = np.array([results[key][0] for key in keys])
+    result = {
+        "university_name": university_name,
+        "negative_score": float(np.mean(neg_scores)) if len(neg_scores) else 0.0,
+        "word_info": build_word_info(university_name, word_counts, terms, top_k),
+        "review_count": len(reviews),
+        "analyzed_review_count": len(neg_scores)
+    }
+    return result, len(new_keys)
+
+def analyze_university_reviews(input_file, output_file, model_path, sentiment_cache_dir='.sentiment_cache',
+                               token_cache_path='.token_cache.sqlite3', workers=1,
+                               tokenizer_backend=DEFAULT_BACKEND, state_path=None, term_matrix_path=None, top_k=None):
     """
     大学の口コミデータを分析し、ネガティブスコアと単語頻度を計算する
     
@@ -16,14 +144,30 @@ def analyze_university_reviews(input_file, output_file, model_path):
         input_file (str): 入力JSONファイルのパス（aggregated_reviews_by_university.json）
         output_file (str): 出力JSONファイルのパス
         model_path (str): fastTextモデルのパス
+        sentiment_cache_dir (str): 単語感情スコア表の保存先（Noneの場合は保存しない）
+        token_cache_path (str): 形態素解析結果のキャッシュファイル（Noneの場合はキャッシュしない）
+        workers (int): 形態素解析のワーカープロセス数（1の場合は同じプロセスで解析する）
+        tokenizer_backend (str): 形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+        state_path (str): 差分分析の状態ファイル（指定した場合は前回から増減したテキストの分だけを分析する）
+        term_matrix_path (str): 大学×単語の頻度行列の保存先（.npzと.vocab.json、Noneの場合は保存しない）
+        top_k (int): 大学ごとにword_infoに含める単語数（Noneの場合はすべて）
+
+    入出力がJSON Lines（.jsonl、'-'は標準入出力）の場合は大学1校分ずつ読み込み、
+    分析結果を1校1行で逐次書き出す
     """
     print("大学口コミの感情分析と単語頻度分析を開始します...")
     
     # JSONデータの読み込み
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"{len(data)}件の大学データを読み込みました")
+        if is_jsonl(input_file):
+            # JSON Linesは大学1校分ずつ読み込む
+            if input_file != '-' and not os.path.exists(input_file):
+                raise FileNotFoundError(input_file)
+            universities = iter_aggregated_universities(input_file)
+        else:
+            with metrics.stage('load'):
+                universities = list(iter_aggregated_universities(input_file))
+            print(f"{len(universities)}件の大学データを読み込みました")
     except Exception as e:
         print(f"データ読み込みエラー: {e}")
         return
@@ -31,21 +175,9 @@ def analyze_university_reviews(input_file, output_file, model_path):
     # 事前学習済み fastText 日本語ベクトルのロード
     try:
         print(f"fastTextモデルを読み込んでいます: {model_path}")
-        # fastTextモデルの読み込み方法を修正
-        from gensim.models.fasttext import load_facebook_model
-        try:
-            # まずFacebookのfastTextモデルとして読み込みを試みる
-            model = load_facebook_model(model_path)
-            model = model.wv  # word vectorsを取得
-        except Exception as e1:
-            print(f"Facebookモデルとしての読み込みに失敗しました: {e1}")
-            try:
-                # 次にWord2Vecフォーマットとして読み込みを試みる
-                model = KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='utf-8', unicode_errors='ignore')
-            except Exception as e2:
-                print(f"Word2Vecフォーマットとしての読み込みに失敗しました: {e2}")
-                # 最後にバイナリエンコーディングを変えて試みる
-                model = KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='latin1')
+        # 変換済みモデル（.kv）はメモリマップで読み込む
+        with metrics.stage('load_model'):
+            model = load_word_vectors(model_path)
         
         print("モデルの読み込みが完了しました")
         
@@ -56,91 +188,85 @@ def analyze_university_reviews(input_file, output_file, model_path):
         print(f"モデル読み込みエラー: {e}")
         return
     
-    # 形態素解析器の初期化
-    tokenizer = Tokenizer()
+    # 形態素解析器とスコア計算器の初期化
+    token_cache = TokenCache(token_cache_path) if token_cache_path else None
+    try:
+        if workers > 1:
+            tokenizer = TokenizerPool(workers, token_cache, tokenizer_backend)
+        else:
+            tokenizer = CachedTokenizer(token_cache, tokenizer_backend)
+    except ImportError as e:
+        print(f"形態素解析器の初期化エラー: {e}")
+        if token_cache:
+            token_cache.close()
+        return
+    scorer = SentimentScorer(model, axis)
+    with metrics.stage('word_table'):
+        word_table = WordSentimentTable(model, axis, sentiment_cache_dir)
+    # 頻度行列は--term-matrixを指定した場合だけ作る（指定しない場合は語彙と単語の感情スコアだけを持つ）
+    terms = TermMatrixBuilder(word_table, keep_rows=term_matrix_path is not None)
+    state = None
+    if state_path:
+        state = AnalysisState(state_path, analysis_config(WordSentimentTable.fingerprint(model, axis), tokenizer.version))
+    
+    writer = JsonlWriter(output_file) if is_jsonl(output_file) else None
     
     output = []
-    for uni in data:
-        university_name = uni['university_name']
+    for university_name, reviews in universities:
         print(f"{university_name}の分析を開始します...")
         
-        all_words = []
-        neg_scores = []
-        
-        for rev in uni['reviews']:
-            if not rev or rev.isspace():  # 空の口コミをスキップ
-                continue
-                
-            # 1) 形態素解析して単語リスト
-            tokens = [t.surface for t in tokenizer.tokenize(rev) if t.part_of_speech.startswith('名詞,一般')]
-            all_words.extend(tokens)
-            
-            # 2) レビュー全体のベクトルを平均ベクトルで近似
-            vecs = []
-            for w in tokens:
-                if w in model:
-                    vecs.append(model[w])
-            
-            if vecs:
-                review_vec = np.mean(vecs, axis=0)
-                # ネガティブ度合い = cos(review_vec, axis)
-                neg = np.dot(review_vec, axis) / (np.linalg.norm(review_vec) * np.linalg.norm(axis))
-            else:
-                neg = 0.0
-            
-            neg_scores.append(neg)
-        
-        # 大学全体のネガティブ度合い = レビューごとの平均
-        uni_neg = float(np.mean(neg_scores)) if neg_scores else 0.0
-        
-        # 単語出現頻度とネガティブ/ポジティブスコアを計算
-        word_info = {}
-        for w in all_words:
-            # 単語の出現回数をカウント
-            if w not in word_info:
-                word_info[w] = {"count": 0, "sentiment_score": 0.0}
-            word_info[w]["count"] += 1
-            
-            # 単語のネガティブ/ポジティブスコアを計算（単語ベクトルと感情軸のコサイン類似度）
-            if w in model:
-                word_vec = model[w]
-                # ベクトルのノルムが0でないことを確認
-                word_norm = np.linalg.norm(word_vec)
-                axis_norm = np.linalg.norm(axis)
-                if word_norm > 0 and axis_norm > 0:
-                    sentiment = np.dot(word_vec, axis) / (word_norm * axis_norm)
-                    # 既存のスコアと平均を取る（同じ単語が複数回出現する場合）
-                    current_count = word_info[w]["count"]
-                    current_score = word_info[w]["sentiment_score"]
-                    word_info[w]["sentiment_score"] = ((current_count - 1) * current_score + sentiment) / current_count
-        
-        # 頻度順にソート
-        sorted_word_info = {
-            k: {
-                "count": v["count"], 
-                "sentiment_score": float(v["sentiment_score"]),
-                "sentiment": "positive" if v["sentiment_score"] < -0.01 else ("negative" if v["sentiment_score"] > 0.01 else "neutral")
-            } 
-            for k, v in sorted(word_info.items(), key=lambda item: item[1]["count"], reverse=True)
-        }
-        
-        output.append({
-            "university_name": university_name,
-            "negative_score": uni_neg,
-            "word_info": sorted_word_info,
-            "review_count": len(uni['reviews']),
-            "analyzed_review_count": len(neg_scores)
-        })
+        if state:
+            result, new_count = analyze_university_incremental(university_name, reviews, tokenizer, scorer, terms, state,
+                                                               top_k)
+            print(f"{university_name}: 新しく分析したテキスト {new_count}件")
+        else:
+            result = analyze_university(university_name, reviews, tokenizer, scorer, terms, top_k)
+        if writer:
+            writer.write(result)
+        else:
+            output.append(result)
         
-        print(f"{university_name}の分析が完了しました。ネガティブスコア: {uni_neg:.4f}, 分析した口コミ数: {len(neg_scores)}")
+        print(f"{university_name}の分析が完了しました。ネガティブスコア: {result['negative_score']:.4f}, 分析した口コミ数: {result['analyzed_review_count']}")
+    
+    if state:
+        # 入力から消えた大学の保存済みのテキストを削除する
+        removed = state.prune_universities()
+        if removed:
+            print(f"入力にない大学の分析結果 {removed}件を状態ファイルから削除しました")
+    
+    if term_matrix_path:
+        save_term_matrix(terms, term_matrix_path)
+    
+    if writer:
+        writer.close()
+        print(f"分析が完了しました。結果は {output_file} に保存されました。")
+        print(f"形態素解析: キャッシュ利用 {tokenizer.hits}件, 新規解析 {tokenizer.misses}件")
+        record_analysis_metrics(tokenizer, scorer)
+        tokenizer.close()
+        if state:
+            state.close()
+        return
     
     # 結果をJSONにダンプして保存
-    with open(output_file, 'w', encoding='utf-8') as f:
+    with metrics.stage('write'), open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
     
     print(f"分析が完了しました。結果は {output_file} に保存されました。")
+    print(f"形態素解析: キャッシュ利用 {tokenizer.hits}件, 新規解析 {tokenizer.misses}件")
+    record_analysis_metrics(tokenizer, scorer)
+    tokenizer.close()
+    if state:
+        state.close()
     return output
 
+def save_term_matrix(terms, path):
+    """大学×単語の頻度行列を保存する"""
+    with metrics.stage('term_matrix'):
+        matrix = terms.build()
+        npz_path, vocab_path = matrix.save(path)
+    print(f"単語頻度行列（{matrix.shape[0]}大学 × {matrix.shape[1]}語、非ゼロ要素 {matrix.counts.nnz}件）を "
+          f"{npz_path} と {vocab_path} に保存しました")
+
 def download_fasttext_model(model_url, model_path):
     """
     fastTextモデルをダウンロードする
@@ -181,13 +307,32 @@ if __name__ == "__main__":
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description='大学口コミの感情分析と単語頻度分析')
     parser.add_argument('--input', '-i', default='aggregated_reviews_by_university.json',
-                        help='入力JSONファイルのパス（デフォルト: aggregated_reviews_by_university.json）')
+                        help='入力JSONファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: aggregated_reviews_by_university.json）')
     parser.add_argument('--output', '-o', default='university_sentiment_analysis.json',
-                        help='出力JSONファイルのパス（デフォルト: university_sentiment_analysis.json）')
+                        help='出力JSONファイルのパス（.jsonlまたは-でJSON Lines、デフォルト: university_sentiment_analysis.json）')
     parser.add_argument('--model', '-m', default='cc.ja.300.bin',
-                        help='fastTextモデルのパス（デフォルト: cc.ja.300.bin）')
+                        help='fastTextモデルのパス（embedding_store.pyで変換した.kvも可、デフォルト: cc.ja.300.bin）')
+    parser.add_argument('--sentiment-cache-dir', default='.sentiment_cache',
+                        help='単語感情スコア表の保存先（デフォルト: .sentiment_cache）')
+    parser.add_argument('--token-cache', default='.token_cache.sqlite3',
+                        help='形態素解析結果のキャッシュファイル（デフォルト: .token_cache.sqlite3）')
+    parser.add_argument('--no-token-cache', action='store_true',
+                        help='形態素解析結果をキャッシュしない')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='形態素解析のワーカープロセス数（デフォルト: 1）')
+    parser.add_argument('--tokenizer', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f'形態素解析器（デフォルト: {DEFAULT_BACKEND}）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='前回の分析から増減したテキストの分だけを分析する')
+    parser.add_argument('--state-file', default='.analysis_state.sqlite3',
+                        help='差分分析の状態ファイル（デフォルト: .analysis_state.sqlite3）')
+    parser.add_argument('--term-matrix', type=str,
+                        help='大学×単語の頻度行列を保存する（PATH.npzとPATH.vocab.json、term_matrix.pyで参照）')
+    parser.add_argument('--top-k', type=int,
+                        help='大学ごとにword_infoに含める単語数（デフォルト: すべて、0の場合は含めない）')
     parser.add_argument('--download', '-d', action='store_true',
                         help='fastTextモデルをダウンロードする')
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
     
@@ -201,7 +346,7 @@ if __name__ == "__main__":
         sys.exit(0)
     
     # 入力ファイルの存在確認
-    if not os.path.exists(args.input):
+    if args.input != '-' and not os.path.exists(args.input):
         print(f"エラー: 入力ファイルが見つかりません: {args.input}")
         sys.exit(1)
     
@@ -213,4 +358,7 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # 分析の実行
-    analyze_university_reviews(args.input, args.output, args.model)
+    with progress_to_stderr(args.output), configure_metrics(args, 'analyze_university_reviews'):
+        analyze_university_reviews(args.input, args.output, args.model, args.sentiment_cache_dir,
+                                   None if args.no_token_cache else args.token_cache, args.workers, args.tokenizer,
+                                   args.state_file if args.incremental else None, args.term_matrix, args.top_k)
@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+# umaskは設定しないと取得できないため、読み込み時に一度だけ設定して元に戻す
+# （書き込みのたびに変更すると、他のスレッドが作成するファイルのパーミッションに影響する）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def target_mode(path):
+    """pathに書き込むファイルのパーミッション（既存のファイルのもの、なければ0666からumaskを除いたもの）"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def atomic_open(path, mode='w', encoding='utf-8', **kwargs):
+    """
+    一時ファイルに書き込み、完了時にpathへアトミックに置き換える
+
+    書き込み中に例外が発生した場合は一時ファイルを削除し、既存のファイルは変更しない。
+    パーミッションは既存のファイルと同じにする（新規作成の場合はopenと同じくumaskに従う）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstempは0600で作成するため、置き換える前に通常のファイルと同じパーミッションにする
+        os.chmod(tmp_path, target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=2, default=None):
+    """JSONファイルをアトミックに書き込む（defaultはjson.dumpと同じ）"""
+    with atomic_open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, default=default)
@@ -0,0 +1,324 @@
+import glob
+import gzip
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import scrape_reviews
+from benchmark_tokenizers import load_texts
+from mock_server import load_schools, render_review_page
+
+# ページ解析のベンチマークに使うHTMLページ（gzip圧縮）を置くディレクトリ。
+# 同梱のページは実サイトから保存したものではなく、mock_server.render_review_pageで生成した合成ページ
+FIXTURES_DIR = os.path.join('benchmark_fixtures', 'pages')
+
+
+def generate_fixtures(data_dir='reviews_data', fixtures_dir=FIXTURES_DIR, schools=6, pages_per_school=2):
+    """
+    reviews_dataからモックサイトと同じ構造の口コミ一覧ページ（合成ページ）を生成し、ベンチマーク用に保存する
+
+    Returns:
+        int: 保存したページ数
+    """
+    os.makedirs(fixtures_dir, exist_ok=True)
+    count = 0
+    for school_id, university_data in sorted(load_schools(data_dir).items())[:schools]:
+        for page in range(1, pages_per_school + 1):
+            html_content = render_review_page(university_data, page)
+            if html_content is None:
+                break
+            path = os.path.join(fixtures_dir, f'{school_id}_page{page}.html.gz')
+            # 生成日時が入らないようにmtime=0で圧縮し、再生成しても同じファイルになるようにする
+            with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(html_content.encode('utf-8'))
+            count += 1
+    return count
+
+
+def load_fixture_pages(fixtures_dir=FIXTURES_DIR):
+    """ベンチマーク用のHTMLページ（.html / .html.gz）を読み込む"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.html*'))):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+
+def parse_page_legacy(html_content):
+    """従来の処理（正規表現 + html.parserでの2回の解析）を再現する"""
+    from bs4 import BeautifulSoup
+
+    reviews_json = scrape_reviews.extract_json_reviews(html_content)
+    reviews_html = scrape_reviews.extract_review_ratings(BeautifulSoup(html_content, 'html.parser'))
+    reviews = reviews_html or reviews_json
+    has_next = BeautifulSoup(html_content, 'html.parser').select_one('li.next a') is not None
+    return {'reviews': reviews, 'has_next': has_next}
+
+
+def normalize_newlines(reviews):
+    """lxmlは改行コード（CRLF）をLFに正規化するため、比較前に揃える"""
+    return [
+        {k: v.replace('\r\n', '\n') if isinstance(v, str) else v for k, v in review.items()}
+        for review in reviews
+    ]
+
+
+def check_parse_results(pages):
+    """parse_review_pageの解析結果が従来の処理と一致しないページ数を返す"""
+    mismatches = 0
+    for html_content in pages:
+        legacy = parse_page_legacy(html_content)
+        current = scrape_reviews.parse_review_page(html_content)
+        if (normalize_newlines(legacy['reviews']) != normalize_newlines(current['reviews'])
+                or legacy['has_next'] != current['has_next']):
+            mismatches += 1
+    return mismatches
+
+
+def percentile(sorted_values, p):
+    """昇順に並んだ値のpパーセンタイル（線形補間）"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def run_benchmark(func, items, repeat=3, unit='item'):
+    """
+    itemsの各要素についてfuncを呼び出し、スループット・レイテンシ・ピークメモリを計測する
+
+    スループットはrepeat回のうち最も速い回の値、レイテンシは全回の呼び出しの分布を使う。
+    ピークメモリはtracemallocで計測すると遅くなるため、別に1回だけ実行して計測する
+
+    Returns:
+        dict: 計測結果
+    """
+    latencies = []
+    best = None
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                t0 = time.perf_counter()
+                func(item)
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        for item in items:
+            func(item)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'unit': unit,
+        'items': len(items),
+        'repeat': repeat,
+        'throughput': len(items) / best if best else 0.0,
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': latencies[-1] * 1000 if latencies else 0.0,
+        },
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def build_benchmarks(args, work_dir):
+    """
+    ベンチマークの一覧を作る
+
+    Returns:
+        list: (名前, 関数, 要素のリスト, 単位) のリスト（準備に時間のかかるものは関数の中で用意する）
+    """
+    from bs4 import BeautifulSoup
+
+    from aggregate_reviews_by_university import aggregate_reviews_by_university
+    from merge_reviews import merge_reviews
+    from review_io import iter_university_data
+
+    pages = load_fixture_pages(args.fixtures_dir)
+    if not pages:
+        raise FileNotFoundError(f"ベンチマーク用のHTMLページがありません: {args.fixtures_dir}（generateサブコマンドで作成できます）")
+    mismatches = check_parse_results(pages)
+    if mismatches:
+        print(f"警告: 従来の処理と解析結果が一致しないページが{mismatches}件あります")
+
+    # process_rating_itemsは口コミ1件分の評価項目を単位に計測する
+    rating_groups = []
+    for html_content in pages:
+        soup = scrape_reviews.make_soup(html_content)
+        for item in soup.select('.mod-reviewList li[id^="answer_"]'):
+            rating_groups.append(item.select('.schMod-reviewList-titleTop'))
+
+    merged_file = os.path.join(work_dir, 'merged_reviews.jsonl')
+    merged_json_file = os.path.join(work_dir, 'merged_reviews.json')
+    aggregated_file = os.path.join(work_dir, 'aggregated_reviews_by_university.jsonl')
+    with redirect_stdout(io.StringIO()):
+        merge_reviews(args.data_dir, merged_file)
+        merge_reviews(args.data_dir, merged_json_file)
+
+    def load_json(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    benchmarks = [
+        ('parse.extract_json_reviews', scrape_reviews.extract_json_reviews, pages, 'page'),
+        ('parse.extract_review_ratings', scrape_reviews.extract_review_ratings, pages, 'page'),
+        ('parse.extract_review_ratings[html.parser]',
+         lambda html_content: scrape_reviews.extract_review_ratings(BeautifulSoup(html_content, 'html.parser')), pages, 'page'),
+        ('parse.process_rating_items', lambda items: scrape_reviews.process_rating_items(items, {}), rating_groups, 'review'),
+        ('parse.parse_review_page', scrape_reviews.parse_review_page, pages, 'page'),
+        # 1ページを3回解析していた従来の処理（parse.parse_review_pageとの比で高速化率がわかる）
+        ('parse.legacy[html.parser]', parse_page_legacy, pages, 'page'),
+        ('merge', lambda _: merge_reviews(args.data_dir, merged_file), [None], 'run'),
+        # 口コミを辞書で読み込む場合とReviewRecordで読み込む場合のメモリ使用量（ピーク）の比較
+        ('load.merged[dict]', load_json, [merged_json_file], 'run'),
+        ('load.merged[compact]', lambda path: list(iter_university_data(path)), [merged_json_file], 'run'),
+        ('aggregate', lambda _: aggregate_reviews_by_university(merged_file, aggregated_file), [None], 'run'),
+    ]
+    if args.skip_analysis:
+        return benchmarks
+
+    from embedding_store import build_synthetic_model, load_word_vectors
+    from sentiment_engine import SentimentScorer, WordSentimentTable
+    from token_cache import CachedTokenizer
+
+    texts = load_texts(args.data_dir, args.max_texts)
+    tokenizer = CachedTokenizer()
+    # 小さな合成モデルをコーパスから学習する（乱数シード固定・1スレッドなので毎回同じモデルになる）
+    model_path = os.path.join(work_dir, 'synthetic.bin')
+    with redirect_stdout(io.StringIO()):
+        build_synthetic_model(model_path, texts)
+    model = load_word_vectors(model_path)
+    axis = model['悪い'] - model['良い']
+    scorer = SentimentScorer(model, axis)
+    word_table = WordSentimentTable(model, axis)
+    token_lists = [tokenizer.analyze(text) for text in texts]
+    batch_size = 100
+    batches = [token_lists[i:i + batch_size] for i in range(0, len(token_lists), batch_size)]
+    words = [w for tokens in token_lists for w in tokens]
+
+    benchmarks += [
+        ('tokenize', tokenizer.analyze, texts, 'text'),
+        (f'score.batch{batch_size}', scorer.score_token_lists, batches, 'batch'),
+        ('score.word_table', word_table.score, words, 'word'),
+    ]
+    return benchmarks
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare_results(current, baseline, threshold):
+    """
+    前回の結果とスループットを比べ、threshold（割合）を超えて遅くなったベンチマーク名を返す
+    """
+    regressions = []
+    for name, result in current['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous or not previous['throughput']:
+            continue
+        ratio = result['throughput'] / previous['throughput']
+        mark = ''
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            mark = '  ← 低下'
+        print(f"  {name}: {ratio:.2f}倍{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スクレイピングと分析の主要処理のベンチマーク')
+    subparsers = parser.add_subparsers(dest='command')
+
+    generate_parser = subparsers.add_parser('generate', aliases=['record'],
+                                            help='reviews_dataからベンチマーク用の合成HTMLページを生成する')
+    generate_parser.add_argument('--data-dir', default='reviews_data', help='ページ生成元の口コミJSONディレクトリ')
+    generate_parser.add_argument('--fixtures-dir', default=FIXTURES_DIR, help=f'保存先（デフォルト: {FIXTURES_DIR}）')
+    generate_parser.add_argument('--schools', type=int, default=6, help='生成する大学数（デフォルト: 6）')
+    generate_parser.add_argument('--pages', type=int, default=2, help='1大学あたりのページ数（デフォルト: 2）')
+
+    run_parser = subparsers.add_parser('run', help='ベンチマークを実行する（デフォルト）')
+    for p in (parser, run_parser):
+        p.add_argument('--data-dir', default='reviews_data', help='マージ・集約・形態素解析に使う口コミJSONディレクトリ')
+        p.add_argument('--fixtures-dir', default=FIXTURES_DIR,
+                       help=f'ページ解析に使うHTMLページのディレクトリ（デフォルト: 合成ページの{FIXTURES_DIR}。'
+                            '実サイトから保存したページも指定できる）')
+        p.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数（デフォルト: 3）')
+        p.add_argument('--max-texts', type=int, default=500, help='形態素解析・スコア計算に使うテキスト数（デフォルト: 500）')
+        p.add_argument('--only', nargs='+', help='名前がこの文字列で始まるベンチマークだけを実行する')
+        p.add_argument('--skip-analysis', action='store_true', help='形態素解析・スコア計算のベンチマークを実行しない')
+        p.add_argument('--output', '-o', default='benchmark_results.json', help='結果の保存先（デフォルト: benchmark_results.json）')
+        p.add_argument('--compare', type=str, help='比較する前回の結果ファイル')
+        p.add_argument('--threshold', type=float, default=0.2,
+                       help='スループットがこの割合を超えて低下したら終了コード1にする（デフォルト: 0.2）')
+    args = parser.parse_args()
+
+    if args.command in ('generate', 'record'):
+        count = generate_fixtures(args.data_dir, args.fixtures_dir, args.schools, args.pages)
+        print(f"{count}ページの合成ページを {args.fixtures_dir} に生成しました")
+        return
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'html_parser': scrape_reviews.HTML_PARSER,
+        'fixtures_dir': args.fixtures_dir,
+        'benchmarks': {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            benchmarks = build_benchmarks(args, work_dir)
+        except FileNotFoundError as e:
+            print(f"エラー: {e}")
+            sys.exit(1)
+        for name, func, items, unit in benchmarks:
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            result = run_benchmark(func, items, args.repeat, unit)
+            results['benchmarks'][name] = result
+            latency = result['latency_ms']
+            print(f"{name}: {result['throughput']:,.1f} {unit}/秒, "
+                  f"p50 {latency['p50']:.2f}ms / p90 {latency['p90']:.2f}ms / p99 {latency['p99']:.2f}ms, "
+                  f"ピークメモリ {result['peak_memory_kb']:,.0f}KB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"結果を {args.output} に保存しました")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"前回の結果（{baseline.get('git_revision')}）とのスループットの比:")
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"警告: {len(regressions)}件のベンチマークで{args.threshold:.0%}を超える低下がありました")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
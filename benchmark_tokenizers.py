@@ -0,0 +1,109 @@
+import glob
+import json
+import os
+import time
+import argparse
+
+import numpy as np
+
+from morph_tokenizer import BACKENDS, DEFAULT_BACKEND, create_tokenizer
+from review_io import TEXT_FIELDS
+
+
+def load_texts(data_dir='reviews_data', max_texts=None):
+    """
+    reviews_dataの口コミから、分析と同じ単位（フィールドごと、重複なし）のテキストを読み込む
+    """
+    texts = {}
+    for file_path in sorted(glob.glob(os.path.join(data_dir, '*.json'))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            university_data = json.load(f)
+        for review in university_data.get('reviews', []):
+            for field in TEXT_FIELDS:
+                text = review.get(field)
+                if text and text.strip():
+                    texts[text.strip()] = None
+    texts = list(texts)
+    return texts[:max_texts] if max_texts else texts
+
+
+def measure(tokenizer, texts, repeat):
+    """
+    全テキストをrepeat回解析し、1秒あたりの形態素数と解析結果（一般名詞のリスト）を返す
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        morpheme_count = 0
+        for text in texts:
+            morpheme_count += len(tokenizer.morphemes(text))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    nouns = [tokenizer.nouns(text) for text in texts]
+    return morpheme_count / best, nouns
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='形態素解析器のベンチマーク')
+    parser.add_argument('--data-dir', type=str, default='reviews_data', help='口コミJSONディレクトリ')
+    parser.add_argument('--max-texts', type=int, default=2000, help='解析するテキスト数の上限（デフォルト: 2000）')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数（最良値を採用）')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS),
+                        help='計測する形態素解析器（インストールされていないものは飛ばす）')
+    parser.add_argument('--model', '-m', type=str,
+                        help='スコアの一致を確認する単語ベクトルモデル（.bin / .kv、省略時は確認しない）')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help=f'{DEFAULT_BACKEND}とのスコアの平均絶対誤差の許容値（デフォルト: 0.05）')
+    args = parser.parse_args()
+
+    texts = load_texts(args.data_dir, args.max_texts)
+    print(f"{len(texts)}件のテキストを読み込みました")
+
+    scorer = None
+    if args.model:
+        from embedding_store import load_word_vectors
+        from sentiment_engine import SentimentScorer
+        model = load_word_vectors(args.model)
+        scorer = SentimentScorer(model, model['悪い'] - model['良い'])
+
+    results = {}
+    for backend in args.backends:
+        try:
+            tokenizer = create_tokenizer(backend)
+        except ImportError as e:
+            print(f"{backend}: 利用できません（{e}）")
+            continue
+        rate, nouns = measure(tokenizer, texts, args.repeat)
+        results[backend] = {'rate': rate, 'nouns': nouns}
+        print(f"{backend}: {rate:,.0f}形態素/秒, 一般名詞 {sum(len(n) for n in nouns)}語")
+
+    baseline = results.get(DEFAULT_BACKEND)
+    if baseline is None:
+        return
+
+    # 基準（janome）との比較
+    baseline_vocabulary = {w for nouns in baseline['nouns'] for w in nouns}
+    baseline_scores = scorer.score_token_lists(baseline['nouns']) if scorer else None
+    candidates = []
+    for backend, result in results.items():
+        vocabulary = {w for nouns in result['nouns'] for w in nouns}
+        line = f"{backend}: 速度 {result['rate'] / baseline['rate']:.2f}倍, 名詞の語彙の一致率 {jaccard(vocabulary, baseline_vocabulary):.3f}"
+        within_tolerance = True
+        if scorer:
+            diff = np.abs(scorer.score_token_lists(result['nouns']) - baseline_scores)
+            within_tolerance = float(diff.mean()) <= args.tolerance
+            line += f", スコアの誤差 平均 {diff.mean():.4f} / 最大 {diff.max():.4f}（{'許容範囲内' if within_tolerance else '許容範囲外'}）"
+        print(line)
+        if within_tolerance:
+            candidates.append(backend)
+
+    fastest = max(candidates, key=lambda b: results[b]['rate'])
+    print(f"推奨: {fastest}" + ("" if scorer else "（--modelを指定するとスコアの一致も確認します）"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import json
+import sys
+import argparse
+from datetime import date
+
+from scrape_reviews import RATING_NAME_MAP
+from review_io import UNIVERSITY_FIELDS, is_columnar, iter_review_records, progress_to_stderr, write_review_records
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 口コミの列（RATING_NAME_MAPの各フィールドと、対応表にないが頻出する「講義・授業」）
+REVIEW_COLUMNS = list(dict.fromkeys(
+    ['review_id', 'post_date', *RATING_NAME_MAP.values(), '講義・授業', '講義・授業_detail']
+))
+
+# 上記以外のフィールドはJSON文字列としてこの列にまとめ、往復変換で失われないようにする
+EXTRA_COLUMN = 'extra'
+
+SCORE_COLUMN = 'negative_score'
+
+BATCH_SIZE = 10000
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("列指向ストアにはpyarrowが必要です: pip install pyarrow")
+
+
+def build_schema():
+    require_pyarrow()
+    fields = [pa.field(name, pa.string()) for name in UNIVERSITY_FIELDS]
+    fields += [pa.field(name, pa.string()) for name in REVIEW_COLUMNS]
+    fields.append(pa.field(SCORE_COLUMN, pa.float64()))
+    fields.append(pa.field(EXTRA_COLUMN, pa.string()))
+    return pa.schema(fields)
+
+
+def _format_of(path):
+    return 'parquet' if path.endswith('.parquet') else 'ipc'
+
+
+def _to_row(record, known_columns):
+    row = {name: record.get(name) for name in known_columns}
+    extra = {k: v for k, v in record.items() if k not in known_columns}
+    row[EXTRA_COLUMN] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row
+
+
+def _iter_batches(records, schema):
+    known_columns = set(schema.names) - {EXTRA_COLUMN}
+    rows = []
+    for record in records:
+        rows.append(_to_row(record, known_columns))
+        if len(rows) >= BATCH_SIZE:
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def export_columnar(input_path, output_path):
+    """
+    口コミレコードを列指向形式に書き出す
+
+    Args:
+        input_path (str): 入力ファイル（merged_reviews.json / .jsonl など）
+        output_path (str): 出力ファイル（.parquet、または .arrow / .feather のArrow IPC）
+
+    Returns:
+        int: 書き出した口コミ数
+    """
+    require_pyarrow()
+    schema = build_schema()
+    count = 0
+    if _format_of(output_path) == 'parquet':
+        writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+    else:
+        writer = ipc.new_file(output_path, schema)
+    try:
+        for batch in _iter_batches(iter_review_records(input_path), schema):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        writer.close()
+    return count
+
+
+def build_filter(university=None, since=None, until=None):
+    """
+    大学名・投稿日による絞り込み条件を作る
+
+    Args:
+        university (str or list): 大学名（複数指定可）
+        since (str): この日付以降（YYYY-MM-DD）
+        until (str): この日付以前（YYYY-MM-DD）
+    """
+    require_pyarrow()
+    expression = None
+    conditions = []
+    if university:
+        names = [university] if isinstance(university, str) else list(university)
+        conditions.append(pc.field('university_name').isin(names))
+    if since:
+        conditions.append(pc.field('post_date') >= since)
+    if until:
+        conditions.append(pc.field('post_date') <= until)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_columnar(path, columns=None, filter=None):
+    """
+    列指向ファイルから必要な列・行だけを読み込む
+
+    Parquetは列の射影と行グループ単位の条件の押し下げを行い、
+    Arrow IPCはメモリマップで読み込んでから絞り込む
+
+    Args:
+        path (str): .parquet / .arrow / .feather ファイル
+        columns (list): 読み込む列（省略時は全列）
+        filter (pyarrow.compute.Expression): build_filterで作った絞り込み条件
+
+    Returns:
+        pyarrow.Table: 読み込んだテーブル
+    """
+    require_pyarrow()
+    if _format_of(path) == 'parquet':
+        dataset = ds.dataset(path, format='parquet')
+        if columns is not None:
+            columns = [c for c in columns if c in dataset.schema.names]
+        return dataset.to_table(columns=columns, filter=filter)
+    # テーブルはマップされた領域を直接参照するため、ファイルは閉じずにGCに任せる
+    table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if columns is not None:
+        columns = [c for c in columns if c in table.schema.names]
+    if filter is not None:
+        table = table.filter(filter)
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def iter_columnar_records(path, columns=None, filter=None):
+    """
+    列指向ファイルから口コミ1件ずつのレコードを復元して返す
+
+    値がない列は省略し、extra列に退避したフィールドを元に戻す
+    """
+    table = read_columnar(path, columns, filter)
+    for batch in table.to_batches():
+        for row in batch.to_pylist():
+            extra = row.pop(EXTRA_COLUMN, None)
+            record = {k: v for k, v in row.items() if v is not None}
+            if extra:
+                record.update(json.loads(extra))
+            yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='口コミデータの列指向（Parquet / Arrow IPC）形式への変換')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='口コミデータを列指向形式に書き出す')
+    export_parser.add_argument('--input', '-i', default='merged_reviews.json', help='入力ファイル（.json / .jsonl）')
+    export_parser.add_argument('--output', '-o', default='merged_reviews.parquet',
+                               help='出力ファイル（.parquet / .arrow / .feather）')
+
+    import_parser = subparsers.add_parser('import', help='列指向形式から口コミデータを書き出す')
+    import_parser.add_argument('--input', '-i', default='merged_reviews.parquet', help='入力ファイル（.parquet / .arrow / .feather）')
+    import_parser.add_argument('--output', '-o', default='-', help='出力ファイル（.json / .jsonl、-で標準出力）')
+    import_parser.add_argument('--university', nargs='+', help='大学名で絞り込む')
+    import_parser.add_argument('--since', type=date.fromisoformat, help='この日付以降の口コミに絞り込む（YYYY-MM-DD）')
+    import_parser.add_argument('--until', type=date.fromisoformat, help='この日付以前の口コミに絞り込む（YYYY-MM-DD）')
+    import_parser.add_argument('--columns', nargs='+', help='読み込む列（省略時は全列）')
+
+    args = parser.parse_args()
+
+    try:
+        require_pyarrow()
+    except ImportError as e:
+        print(f"エラー: {e}")
+        sys.exit(1)
+
+    if args.command == 'export':
+        count = export_columnar(args.input, args.output)
+        print(f"{count}件の口コミを {args.output} に書き出しました")
+    else:
+        with progress_to_stderr(args.output):
+            expression = build_filter(
+                args.university,
+                args.since.isoformat() if args.since else None,
+                args.until.isoformat() if args.until else None,
+            )
+            records = iter_columnar_records(args.input, args.columns, expression)
+            count = write_review_records(args.output, records)
+            print(f"{count}件の口コミを書き出しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# URLの種類（大学一覧ページと大学ページ）
+INDEX = 'index'
+SCHOOL = 'school'
+
+# 取り出す順序（値が小さいほど先）。一覧ページを先に辿って大学を列挙してから大学ページを取得する
+INDEX_PRIORITY = 0
+SCHOOL_PRIORITY = 1
+
+# URLの状態
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+FrontierEntry = namedtuple('FrontierEntry', ['id', 'url', 'kind', 'depth', 'attempts'])
+
+
+class CrawlFrontier:
+    """
+    ディスク上のSQLiteに置く、重複のない優先度付きのURLフロンティア（スレッドセーフ）
+
+    URLは重複判定用のキー（大学ページは学校ID）で一意に管理し、優先度・発見順に取り出す。
+    状態はすべてファイルに保存されるため、URLの数が増えてもメモリ使用量は変わらず、
+    中断後に同じファイルで再実行すると取得中だったURLから再開できる
+    """
+
+    def __init__(self, path='.crawl_frontier.sqlite3'):
+        """
+        Args:
+            path (str): フロンティアのファイルパス（存在しない場合は新規作成）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS frontier ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' key TEXT NOT NULL UNIQUE,'
+            ' url TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            ' depth INTEGER NOT NULL DEFAULT 0,'
+            f" state TEXT NOT NULL DEFAULT '{PENDING}',"
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' output_file TEXT,'
+            ' discovered_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS frontier_next ON frontier (state, priority, id)')
+        # 前回の実行で取得中のまま中断したURLは未取得に戻す
+        self.conn.execute('UPDATE frontier SET state = ? WHERE state = ?', (PENDING, IN_PROGRESS))
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add_many(self, entries):
+        """
+        URLをまとめて追加する（同じキーのURLは無視される）
+
+        Args:
+            entries (iterable): (キー, URL, 種類, 優先度, 深さ) のタプル
+
+        Returns:
+            int: 新しく追加したURL数
+        """
+        now = time.time()
+        rows = [(key, url, kind, priority, depth, now, now) for key, url, kind, priority, depth in entries]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO frontier (key, url, kind, priority, depth, discovered_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def add(self, key, url, kind, priority=None, depth=0):
+        """URLを1件追加し、新しく追加した場合はTrueを返す"""
+        if priority is None:
+            priority = INDEX_PRIORITY if kind == INDEX else SCHOOL_PRIORITY
+        return self.add_many([(key, url, kind, priority, depth)]) > 0
+
+    def claim(self, limit=1):
+        """
+        優先度の高い順（同じ優先度では発見順）に未取得のURLを取り出し、取得中にする
+
+        Returns:
+            list: FrontierEntryのリスト（未取得のURLがなければ空）
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, url, kind, depth, attempts FROM frontier WHERE state = ?'
+                ' ORDER BY priority, id LIMIT ?', (PENDING, limit)
+            ).fetchall()
+            self.conn.executemany('UPDATE frontier SET state = ?, updated_at = ? WHERE id = ?',
+                                  [(IN_PROGRESS, time.time(), row[0]) for row in rows])
+            self.conn.commit()
+        return [FrontierEntry(*row) for row in rows]
+
+    def release(self, entry_id):
+        """取り出したURLを取得せずに未取得に戻す"""
+        with self.lock:
+            self.conn.execute('UPDATE frontier SET state = ?, updated_at = ? WHERE id = ?', (PENDING, time.time(), entry_id))
+            self.conn.commit()
+
+    def complete(self, entry_id, output_file=None):
+        """取得が完了したことを記録する"""
+        with self.lock:
+            self.conn.execute('UPDATE frontier SET state = ?, output_file = ?, error = NULL, updated_at = ? WHERE id = ?',
+                              (DONE, output_file, time.time(), entry_id))
+            self.conn.commit()
+
+    def fail(self, entry_id, error, max_attempts=3):
+        """
+        取得に失敗したことを記録する
+
+        失敗がmax_attempts回に達するまでは未取得に戻し、後で再び取り出す
+
+        Returns:
+            bool: 再試行する場合はTrue
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT attempts FROM frontier WHERE id = ?', (entry_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            retry = attempts < max_attempts
+            self.conn.execute('UPDATE frontier SET state = ?, attempts = ?, error = ?, updated_at = ? WHERE id = ?',
+                              (PENDING if retry else FAILED, attempts, str(error), time.time(), entry_id))
+            self.conn.commit()
+        return retry
+
+    def counts(self):
+        """
+        種類・状態ごとのURL数を返す
+
+        Returns:
+            dict: (種類, 状態) -> URL数
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT kind, state, COUNT(*) FROM frontier GROUP BY kind, state').fetchall()
+        return {(kind, state): count for kind, state, count in rows}
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM frontier WHERE state = ?', (PENDING,)).fetchone()[0]
+
+    def failed_entries(self):
+        """最大回数まで失敗したURLを (URL, エラー) のリストで返す"""
+        with self.lock:
+            return self.conn.execute('SELECT url, error FROM frontier WHERE state = ? ORDER BY id', (FAILED,)).fetchall()
+
+    def clear(self):
+        """すべてのURLを削除する"""
+        with self.lock:
+            self.conn.execute('DELETE FROM frontier')
+            self.conn.commit()
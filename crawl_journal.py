@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import threading
+
+from review_record import encode_review
+
+
+class CrawlJournal:
+    """
+    クロールの進捗をページ単位でディスクに記録するジャーナル
+
+    各大学の取得済みページを pages/<学校ID>.jsonl に1ページ1行で追記し、
+    保存まで完了した大学を completed.jsonl に記録する。
+    中断後に同じジャーナルで再実行すると、完了済みの大学は飛ばし、
+    途中の大学は最後に記録したページの次から再開できる
+    """
+
+    def __init__(self, journal_dir='.crawl_journal'):
+        self.journal_dir = journal_dir
+        self.pages_dir = os.path.join(journal_dir, 'pages')
+        self.completed_path = os.path.join(journal_dir, 'completed.jsonl')
+        self.lock = threading.Lock()
+        os.makedirs(self.pages_dir, exist_ok=True)
+        self.completed = self._load_completed()
+
+    def _load_completed(self):
+        completed = {}
+        if os.path.exists(self.completed_path):
+            for record in self._read_jsonl(self.completed_path):
+                completed[record['school_id']] = record
+        return completed
+
+    @staticmethod
+    def _read_jsonl(path):
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された最終行は無視する
+                    break
+        return records
+
+    @staticmethod
+    def _append_jsonl(path, record):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=encode_review) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _pages_path(self, school_id):
+        return os.path.join(self.pages_dir, f"{school_id}.jsonl")
+
+    def has_progress(self):
+        """記録済みの進捗があるかどうか"""
+        return bool(self.completed) or bool(os.listdir(self.pages_dir))
+
+    def is_completed(self, school_id):
+        return school_id in self.completed
+
+    def load_pages(self, school_id):
+        """大学の取得済みページをページ番号順に返す"""
+        path = self._pages_path(school_id)
+        if not os.path.exists(path):
+            return []
+        return self._read_jsonl(path)
+
+    def record_page(self, school_id, page, university_name, reviews, has_next):
+        """取得したページの口コミを記録する"""
+        record = {
+            'page': page,
+            'university_name': university_name,
+            'reviews': reviews,
+            'has_next': has_next,
+        }
+        self._append_jsonl(self._pages_path(school_id), record)
+
+    def mark_completed(self, school_id, output_file=None):
+        """大学の保存が完了したことを記録し、ページの記録を削除する"""
+        record = {'school_id': school_id, 'output_file': output_file}
+        with self.lock:
+            self._append_jsonl(self.completed_path, record)
+            self.completed[school_id] = record
+        path = self._pages_path(school_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def clear(self):
+        """ジャーナルを削除して空の状態に戻す"""
+        with self.lock:
+            shutil.rmtree(self.journal_dir, ignore_errors=True)
+            os.makedirs(self.pages_dir, exist_ok=True)
+            self.completed = {}
@@ -0,0 +1,380 @@
+import os
+import socket
+import sys
+import threading
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from http_client import DEFAULT_TIMEOUT, FetchStats, create_session, fetch
+from metrics import add_metrics_arguments, configure_metrics, metrics
+from review_output_store import ReviewOutputStore
+from review_record import compact_review
+from scrape_reviews import (
+    DEFAULT_DISCOVERY_SEED, build_review_base_url, extract_discovery_links, extract_school_id,
+    extract_university_name, load_urls, make_soup, parse_review_page, record_fetch_metrics, request_headers,
+    save_university_json,
+)
+from work_queue import DONE, FAILED, LEASED, PENDING, open_queue
+
+# タスクの種類（大学一覧ページ、大学ページ、口コミ一覧ページ）
+INDEX = 'index'
+SCHOOL = 'school'
+PAGE = 'page'
+
+# リースする順序（値が小さいほど先）。取得中の大学のページを先に処理し、途中の大学が増えすぎないようにする
+TASK_PRIORITIES = {PAGE: 0, INDEX: 1, SCHOOL: 2}
+
+DEFAULT_QUEUE = 'crawl_queue.sqlite3'
+DEFAULT_STORE = 'crawl_output.sqlite3'
+
+
+def index_task(url, max_reviews):
+    return f'index:{url}', INDEX, {'url': url, 'max_reviews': max_reviews}, TASK_PRIORITIES[INDEX]
+
+
+def school_task(url, max_reviews):
+    return f'school:{extract_school_id(url)}', SCHOOL, {'url': url, 'max_reviews': max_reviews}, TASK_PRIORITIES[SCHOOL]
+
+
+def page_task(school_id, review_url, page, max_reviews):
+    payload = {'school_id': school_id, 'review_url': review_url, 'page': page, 'max_reviews': max_reviews}
+    return f'page:{school_id}:{page}', PAGE, payload, TASK_PRIORITIES[PAGE]
+
+
+def get_page(url, session=None, stats=None, rate_limiter=None):
+    """ページを取得し、ステータスを検査したレスポンスを返す"""
+    with metrics.stage('fetch', url=url):
+        response = fetch(session, url, headers=request_headers(), stats=stats, rate_limiter=rate_limiter)
+    response.raise_for_status()
+    return response
+
+
+def process_task(task, queue, store, **fetch_options):
+    """
+    タスクを1件処理する
+
+    処理中に見つけた次のタスク（一覧ページの大学、次の口コミページ）は完了を記録する前にキューに登録する。
+    完了の記録の前に停止して同じタスクが再配信されても、タスクはキーで、口コミは口コミIDで重複が除かれる
+
+    Returns:
+        str: 処理結果の説明
+    """
+    payload = task.payload
+    max_reviews = payload.get('max_reviews', 0)
+
+    if task.kind == INDEX:
+        response = get_page(payload['url'], **fetch_options)
+        with metrics.stage('parse'):
+            school_urls, index_urls = extract_discovery_links(response.text, payload['url'])
+        metrics.inc('index_pages_total')
+        new_schools = queue.put_many(school_task(url, max_reviews) for url in school_urls.values())
+        new_index_pages = queue.put_many(index_task(url, max_reviews) for url in index_urls)
+        return f"新しい大学 {new_schools}校, 新しい一覧ページ {new_index_pages}件"
+
+    if task.kind == SCHOOL:
+        url = payload['url']
+        response = get_page(url, **fetch_options)
+        with metrics.stage('parse'):
+            soup = make_soup(response.text)
+        university_name = extract_university_name(soup.title.text if soup.title else '')
+        school_id = extract_school_id(url)
+        review_url = build_review_base_url(url)
+        store.add_school(school_id, university_name, url, review_url, max_reviews)
+        queue.put_many([page_task(school_id, review_url, 1, max_reviews)])
+        return university_name
+
+    if task.kind == PAGE:
+        page = payload['page']
+        review_url = payload['review_url'] if page == 1 else f"{payload['review_url']}page={page}#reviewlist"
+        response = get_page(review_url, **fetch_options)
+        with metrics.stage('parse'):
+            parsed_page = parse_review_page(response.text)
+        reviews = [compact_review(r) for r in parsed_page['reviews']]
+        metrics.inc('pages_total')
+        with metrics.stage('save'):
+            added = store.add_reviews(payload['school_id'], page, reviews)
+        metrics.inc('reviews_total', added)
+        # scrape_reviewsと同じく1ページ10件としてmax_reviewsに必要なページまで取得する（余分な口コミは書き出し時に除く）
+        max_pages = (max_reviews + 9) // 10 if max_reviews else None
+        if reviews and parsed_page['has_next'] and (max_pages is None or page < max_pages):
+            queue.put_many([page_task(payload['school_id'], payload['review_url'], page + 1, max_reviews)])
+        return f"{len(reviews)}件（新規 {added}件）"
+
+    raise ValueError(f"未対応のタスクの種類です: {task.kind}")
+
+
+def run_worker(queue, store, worker_id, threads=1, lease_timeout=120.0, max_attempts=3, retry_delay=30.0,
+               poll_interval=1.0, **fetch_options):
+    """
+    キューが空になるまでタスクをリースして処理する
+
+    処理中のタスクのリースは別スレッドで期限の1/3ごとに延長する。
+    ワーカーが停止した場合は延長が止まり、期限が過ぎたタスクは他のワーカーに再配信される
+
+    Args:
+        queue (WorkQueue): 作業キュー
+        store (ReviewOutputStore): 口コミの出力先
+        worker_id (str): ワーカーの識別子
+        threads (int): このワーカーで同時に処理するタスク数
+        lease_timeout (float): リースの期限（秒）
+        max_attempts (int): 1つのタスクの最大配信回数
+        retry_delay (float): 失敗したタスクを再びリースできるようにするまでの秒数
+        poll_interval (float): リースできるタスクがない場合の待機時間（秒）
+        **fetch_options: fetchに渡すsession, stats, rate_limiter
+
+    Returns:
+        dict: 状態ごとのタスク数（done, retry, failed, lost）
+    """
+    results = {'done': 0, 'retry': 0, 'failed': 0, 'lost': 0}
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+    stop = threading.Event()
+
+    def keep_leases():
+        while not stop.wait(lease_timeout / 3):
+            with in_flight_lock:
+                tasks = list(in_flight.values())
+            for task in tasks:
+                queue.extend(task, lease_timeout)
+
+    keeper = threading.Thread(target=keep_leases, daemon=True)
+    keeper.start()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            while True:
+                if len(in_flight) < threads:
+                    for task in queue.lease(worker_id, threads - len(in_flight), lease_timeout, max_attempts):
+                        if task.attempts > 1:
+                            metrics.inc('tasks_redelivered_total', kind=task.kind)
+                        future = executor.submit(process_task, task, queue, store, **fetch_options)
+                        with in_flight_lock:
+                            in_flight[future] = task
+                if not in_flight:
+                    if queue.is_drained():
+                        break
+                    # 他のワーカーが処理中のタスク（停止していれば期限後に再配信される）や、その後続のタスクを待つ
+                    time.sleep(poll_interval)
+                    continue
+                done, _ = wait(list(in_flight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    with in_flight_lock:
+                        task = in_flight.pop(future)
+                    try:
+                        description = future.result()
+                    except Exception as e:
+                        retry = queue.fail(task, e, max_attempts, retry_delay)
+                        results['retry' if retry else 'failed'] += 1
+                        metrics.inc('tasks_total', kind=task.kind, status='retry' if retry else 'failed')
+                        print(f"失敗: {task.key}（{task.attempts}回目） - {e}{'（後で再試行します）' if retry else ''}")
+                        continue
+                    if queue.ack(task):
+                        results['done'] += 1
+                        metrics.inc('tasks_total', kind=task.kind, status='done')
+                        print(f"完了: {task.key} - {description}")
+                    else:
+                        # 期限切れで他のワーカーに再配信されていた（書き込みは冪等なので結果は重複しない）
+                        results['lost'] += 1
+                        metrics.inc('tasks_total', kind=task.kind, status='lost')
+                        print(f"リースの期限が切れていました: {task.key}")
+    except KeyboardInterrupt:
+        # 処理中のタスクはすぐに他のワーカーがリースできるように返す
+        with in_flight_lock:
+            tasks = list(in_flight.values())
+        for task in tasks:
+            queue.release(task)
+        print(f"中断しました: 処理中の{len(tasks)}件のタスクをキューに戻しました")
+        raise
+    finally:
+        stop.set()
+    return results
+
+
+def seed_queue(queue, urls=(), seeds=(), max_reviews=20):
+    """
+    大学ページと大学一覧ページをキューに登録する
+
+    Returns:
+        int: 新しく登録したタスク数
+    """
+    return (queue.put_many(school_task(url, max_reviews) for url in urls)
+            + queue.put_many(index_task(url, max_reviews) for url in seeds))
+
+
+def print_status(queue, store):
+    """キューの種類・状態ごとのタスク数と、出力先の大学数・口コミ数を表示する"""
+    counts = queue.counts()
+    for kind, label in ((INDEX, '一覧ページ'), (SCHOOL, '大学'), (PAGE, '口コミページ')):
+        states = {state: count for (k, state), count in counts.items() if k == kind}
+        if states:
+            print(f"{label}: 未処理 {states.get(PENDING, 0)}, リース中 {states.get(LEASED, 0)}, "
+                  f"完了 {states.get(DONE, 0)}, 失敗 {states.get(FAILED, 0)}")
+    schools, reviews = store.count()
+    print(f"出力先: {schools}校, {reviews}件の口コミ")
+
+
+def incomplete_schools(queue):
+    """
+    口コミページのタスクが完了していない（未処理・リース中・失敗）大学を返す
+
+    Returns:
+        dict: 学校ID -> エラーの説明
+    """
+    schools = {}
+    for payload, state, error in queue.unfinished_tasks(PAGE):
+        if state == FAILED:
+            description = f"口コミページ {payload['page']} の取得に失敗しました: {error}"
+        else:
+            description = f"口コミページ {payload['page']} の取得が完了していません"
+        schools.setdefault(payload['school_id'], description)
+    return schools
+
+
+def export_store(store, output_dir, queue):
+    """
+    出力先の口コミを、大学ごとにscrape_reviews.pyと同じ形式のJSONファイルに書き出す
+
+    口コミページのタスクが完了していない大学は、scrape_reviews.pyでエラーになった大学と同じくerrorを付けて書き出す。
+    merge_reviews.pyは途中までの口コミしか含まないファイルを全件スナップショットとして扱わない
+
+    Returns:
+        tuple: (書き出したファイル数, そのうちerrorを付けたファイル数)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    incomplete = incomplete_schools(queue)
+    count = errors = 0
+    for university_data in store.iter_university_data():
+        error = incomplete.get(extract_school_id(university_data['url']))
+        if error:
+            university_data['error'] = error
+            errors += 1
+        save_university_json(university_data, output_dir, timestamp)
+        count += 1
+    return count, errors
+
+
+def print_export_result(count, errors, output_dir):
+    print(f"{count}校分のJSONファイルを {output_dir} に書き出しました")
+    if errors:
+        print(f"{errors}校は口コミページの取得が完了していないため、errorを付けて書き出しました")
+
+
+def run_coordinator(args, queue, store):
+    """タスクを登録し、--waitの場合はすべてのタスクが終わるまで進捗を表示して結果を書き出す"""
+    if args.fresh:
+        queue.clear()
+        store.clear()
+    queue.rate_limiter().configure(args.rate, args.per_host_rate, args.burst)
+    print(f"全ワーカー合計のレート: {args.rate}件/秒, ホスト単位{args.per_host_rate or args.rate}件/秒")
+
+    urls = load_urls(args.urls) if args.urls else []
+    seeds = [] if args.discover is None else (args.discover or [DEFAULT_DISCOVERY_SEED])
+    added = seed_queue(queue, urls, seeds, args.max_reviews)
+    print(f"{added}件のタスクを登録しました")
+    print_status(queue, store)
+    if not args.wait:
+        return 0
+
+    while not queue.is_drained():
+        time.sleep(args.poll_interval)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}]")
+        print_status(queue, store)
+    print_export_result(*export_store(store, args.output, queue), args.output)
+    failed = queue.failed_tasks()
+    for key, error in failed:
+        print(f"失敗したタスク: {key} - {error}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='作業キューを共有する複数のワーカーで分散してクロールする')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE,
+                        help=f'作業キュー（<バックエンド>:<場所>、パスだけの場合はSQLite。デフォルト: {DEFAULT_QUEUE}）')
+    parser.add_argument('--store', default=DEFAULT_STORE, help=f'口コミの出力先（デフォルト: {DEFAULT_STORE}）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    coordinator_parser = subparsers.add_parser('coordinator', help='タスクを登録し、全ワーカー共通のレートを設定する')
+    coordinator_parser.add_argument('--urls', type=str, help='大学ページのURLリストのJSONファイル')
+    coordinator_parser.add_argument('--discover', nargs='*', metavar='SEED_URL',
+                                    help=f'大学一覧ページから大学を探す（起点を省略すると{DEFAULT_DISCOVERY_SEED}）')
+    coordinator_parser.add_argument('--max-reviews', type=int, default=20,
+                                    help='1大学あたりの最大取得口コミ数（デフォルト: 20件、0の場合は全件）')
+    coordinator_parser.add_argument('--rate', type=float, default=1.0, help='全ワーカー合計の最大リクエスト数/秒（デフォルト: 1.0）')
+    coordinator_parser.add_argument('--per-host-rate', type=float, help='1ホストあたりの最大リクエスト数/秒（デフォルト: --rateと同じ）')
+    coordinator_parser.add_argument('--burst', type=float, help='バースト許容リクエスト数')
+    coordinator_parser.add_argument('--fresh', action='store_true', help='キューと出力先を空にしてから登録する')
+    coordinator_parser.add_argument('--wait', action='store_true',
+                                    help='すべてのタスクが終わるまで進捗を表示し、終わったら--outputに書き出す')
+    coordinator_parser.add_argument('--output', type=str, default='reviews_data', help='--waitで書き出すディレクトリ')
+    coordinator_parser.add_argument('--poll-interval', type=float, default=10.0, help='--waitで進捗を表示する間隔（秒）')
+
+    worker_parser = subparsers.add_parser('worker', help='キューが空になるまでタスクを処理する')
+    worker_parser.add_argument('--worker-id', type=str, default=f'{socket.gethostname()}-{os.getpid()}',
+                               help='ワーカーの識別子（デフォルト: ホスト名-プロセスID）')
+    worker_parser.add_argument('--threads', type=int, default=1, help='このワーカーで同時に処理するタスク数（デフォルト: 1）')
+    worker_parser.add_argument('--lease-timeout', type=float, default=120.0,
+                               help='リースの期限（秒）。停止したワーカーのタスクはこの時間の後に再配信される（デフォルト: 120）')
+    worker_parser.add_argument('--max-attempts', type=int, default=3, help='1つのタスクの最大配信回数（デフォルト: 3回）')
+    worker_parser.add_argument('--retry-delay', type=float, default=30.0, help='失敗したタスクを再試行するまでの秒数（デフォルト: 30）')
+    worker_parser.add_argument('--poll-interval', type=float, default=1.0, help='タスクがない場合の待機時間（秒）')
+    worker_parser.add_argument('--timeout', type=float, nargs=2, default=list(DEFAULT_TIMEOUT), metavar=('CONNECT', 'READ'),
+                               help=f'接続・読み込みタイムアウト（秒、デフォルト: {DEFAULT_TIMEOUT[0]} {DEFAULT_TIMEOUT[1]}）')
+    worker_parser.add_argument('--retries', type=int, default=3, help='一時的なエラー時の最大再試行回数（デフォルト: 3回）')
+    add_metrics_arguments(worker_parser)
+
+    subparsers.add_parser('status', help='キューと出力先の状態を表示する')
+
+    export_parser = subparsers.add_parser('export', help='出力先の口コミを大学ごとのJSONファイルに書き出す')
+    export_parser.add_argument('--output', type=str, default='reviews_data', help='書き出すディレクトリ')
+
+    subparsers.add_parser('requeue', help='失敗したタスクを未処理に戻す')
+
+    args = parser.parse_args()
+
+    try:
+        queue = open_queue(args.queue)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        sys.exit(1)
+    store = ReviewOutputStore(args.store)
+    exit_code = 0
+    with queue, store:
+        if args.command == 'coordinator':
+            if not args.urls and args.discover is None:
+                parser.error('coordinatorには--urlsか--discoverを指定してください')
+            exit_code = run_coordinator(args, queue, store)
+        elif args.command == 'worker':
+            rate_limiter = queue.rate_limiter()
+            if rate_limiter.rates()[0] is None:
+                print(f"エラー: 全ワーカー共通のレートが設定されていません。先にcoordinatorを実行してください: {args.queue}")
+                sys.exit(1)
+            session = create_session(pool_size=args.threads, max_retries=args.retries, timeout=args.timeout)
+            stats = FetchStats()
+            print(f"ワーカー {args.worker_id}: {args.threads}スレッド, リースの期限 {args.lease_timeout:g}秒")
+            with configure_metrics(args, 'distributed_crawl'):
+                with metrics.stage('worker'):
+                    results = run_worker(
+                        queue, store, args.worker_id, args.threads, args.lease_timeout, args.max_attempts,
+                        args.retry_delay, args.poll_interval,
+                        session=session, stats=stats, rate_limiter=rate_limiter,
+                    )
+                record_fetch_metrics(stats)
+            print(f"完了 {results['done']}件, 再試行 {results['retry']}件, 失敗 {results['failed']}件, "
+                  f"期限切れ {results['lost']}件")
+            stats.print_summary()
+            exit_code = 1 if results['failed'] else 0
+        elif args.command == 'status':
+            print_status(queue, store)
+            for key, error in queue.failed_tasks():
+                print(f"失敗したタスク: {key} - {error}")
+        elif args.command == 'export':
+            print_export_result(*export_store(store, args.output, queue), args.output)
+        elif args.command == 'requeue':
+            print(f"{queue.requeue_failed()}件のタスクを未処理に戻しました")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
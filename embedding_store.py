@@ -0,0 +1,218 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+from gensim.models import FastText, KeyedVectors
+from gensim.models.fasttext import load_facebook_model, save_facebook_model
+
+from morph_tokenizer import BACKENDS, DEFAULT_BACKEND, create_tokenizer
+from review_io import iter_aggregated_universities, iter_review_records, review_text
+
+# 「良い」⇔「悪い」軸を定義する単語（枝刈りしても必ず残す）
+AXIS_WORDS = ('良い', '悪い')
+
+# 変換済みモデル（KeyedVectors.saveの形式）の拡張子
+CONVERTED_SUFFIX = '.kv'
+
+# 合成モデルの学習に使う文（コーパスを指定しない場合）
+SAMPLE_SENTENCES = [
+    '授業 の 内容 が 良い',
+    '設備 が 古く て 悪い',
+    '先生 は 親切 で 良い 大学',
+    '立地 が 悪い ので 通学 が 大変',
+    '就職 の サポート が 良い',
+    '学食 が 狭く て 悪い',
+]
+
+
+def is_converted(model_path):
+    """変換済み（メモリマップで読み込める）モデルかどうか"""
+    return model_path.endswith(CONVERTED_SUFFIX)
+
+
+def load_word_vectors(model_path, mmap=True):
+    """
+    単語ベクトルを読み込む
+
+    変換済みモデル（.kv）はベクトルの配列をメモリマップで読み込むため、すぐに使い始められ、
+    複数のプロセスでページキャッシュ上の同じ領域を共有する。それ以外はfastTextのバイナリとして
+    読み込み、失敗した場合はWord2Vec形式として読み込む
+
+    Args:
+        model_path (str): モデルのパス（.kv / cc.ja.300.bin など）
+        mmap (bool): 変換済みモデルをメモリマップで読み込むかどうか
+
+    Returns:
+        KeyedVectors: 単語ベクトル
+    """
+    if is_converted(model_path):
+        return KeyedVectors.load(model_path, mmap='r' if mmap else None)
+    try:
+        # まずFacebookのfastTextモデルとして読み込みを試みる
+        return load_facebook_model(model_path).wv  # word vectorsを取得
+    except Exception as e1:
+        print(f"Facebookモデルとしての読み込みに失敗しました: {e1}")
+        try:
+            # 次にWord2Vecフォーマットとして読み込みを試みる
+            return KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='utf-8', unicode_errors='ignore')
+        except Exception as e2:
+            print(f"Word2Vecフォーマットとしての読み込みに失敗しました: {e2}")
+            # 最後にバイナリエンコーディングを変えて試みる
+            return KeyedVectors.load_word2vec_format(model_path, binary=True, encoding='latin1')
+
+
+def iter_corpus_texts(corpus_files=(), aggregated_files=()):
+    """
+    コーパスの口コミテキストを順に返す
+
+    Args:
+        corpus_files (list): 口コミ単位のファイル（merged_reviews.json / .jsonl / .parquet など）
+        aggregated_files (list): 大学別に集約したファイル（aggregated_reviews_by_university.json / .jsonl）
+    """
+    for path in corpus_files:
+        for record in iter_review_records(path):
+            # add_negative_scores_to_reviews.pyがスコアを計算するテキストと同じもの
+            text = review_text(record)
+            if text:
+                yield text
+    for path in aggregated_files:
+        for _, reviews in iter_aggregated_universities(path):
+            for text in reviews:
+                if text and not text.isspace():
+                    yield text
+
+
+def collect_corpus_vocabulary(texts, backend=DEFAULT_BACKEND):
+    """
+    コーパスに出現する一般名詞の集合を返す（分析スクリプトと同じ形態素解析器・品詞の絞り込み）
+
+    解析器によって単語の区切り方が異なるため、分析で使う解析器（--tokenizer）と同じものを指定する
+
+    Args:
+        texts (iterable): コーパスのテキスト
+        backend (str): 形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+    """
+    tokenizer = create_tokenizer(backend)
+    vocabulary = set()
+    for text in texts:
+        vocabulary.update(tokenizer.nouns(text))
+    return vocabulary
+
+
+def prune_word_vectors(model, words):
+    """
+    指定した単語だけを持つKeyedVectorsを作る
+
+    fastTextで語彙外の単語もサブワードから合成したベクトルをそのまま保存するため、
+    枝刈り後のモデルでも指定した単語のスコアは元のモデルと一致する。モデルにない単語は除く
+
+    Args:
+        model (KeyedVectors): 元の単語ベクトル
+        words (iterable): 残す単語
+
+    Returns:
+        KeyedVectors: 枝刈りした単語ベクトル
+    """
+    words = sorted(w for w in set(words) if w in model)
+    pruned = KeyedVectors(model.vector_size, dtype=np.float32)
+    if words:
+        pruned.add_vectors(words, np.vstack([model[w] for w in words]).astype(np.float32))
+    return pruned
+
+
+def convert_model(model_path, output_path, vocabulary=None):
+    """
+    モデルをメモリマップで読み込める形式に変換して保存する
+
+    Args:
+        model_path (str): 変換元のモデル（cc.ja.300.bin など）
+        output_path (str): 保存先（.kv、配列は同じ場所に.npyとして保存される）
+        vocabulary (set): 残す単語（Noneの場合は枝刈りせず、fastTextのサブワードも含めて保存する）
+
+    Returns:
+        KeyedVectors: 保存した単語ベクトル
+    """
+    model = load_word_vectors(model_path, mmap=False)
+    if vocabulary is not None:
+        model = prune_word_vectors(model, set(vocabulary) | set(AXIS_WORDS))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    # 大きな配列は別ファイルの.npyとして保存され、読み込み時にメモリマップできる
+    model.save(output_path, sep_limit=0)
+    return model
+
+
+def build_synthetic_model(output_path, texts=None, vector_size=16, seed=0, backend=DEFAULT_BACKEND):
+    """
+    動作確認用の小さなfastTextモデルを学習してFacebook形式で保存する
+
+    Args:
+        output_path (str): 保存先（.bin）
+        texts (iterable): 学習に使うテキスト（Noneの場合は組み込みの例文）
+        vector_size (int): ベクトルの次元数
+        seed (int): 乱数シード
+        backend (str): textsを分かち書きする形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+    """
+    if texts is None:
+        sentences = [s.split() for s in SAMPLE_SENTENCES]
+    else:
+        tokenizer = create_tokenizer(backend)
+        sentences = [[surface for surface, _ in tokenizer.morphemes(text)] for text in texts]
+    # 軸の単語は必ず語彙に含める
+    sentences.append(list(AXIS_WORDS))
+    model = FastText(vector_size=vector_size, min_count=1, bucket=2000, seed=seed, workers=1)
+    model.build_vocab(corpus_iterable=sentences)
+    model.train(corpus_iterable=sentences, total_examples=len(sentences), epochs=5)
+    save_facebook_model(model, output_path)
+    return model.wv
+
+
+def main():
+    parser = argparse.ArgumentParser(description='単語ベクトルモデルの変換（メモリマップ形式・語彙の枝刈り）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='モデルをメモリマップで読み込める形式に変換する')
+    convert_parser.add_argument('--model', '-m', default='cc.ja.300.bin', help='変換元のモデル（デフォルト: cc.ja.300.bin）')
+    convert_parser.add_argument('--output', '-o', default='cc.ja.300.kv', help='保存先（.kv、デフォルト: cc.ja.300.kv）')
+    convert_parser.add_argument('--corpus', nargs='+', default=[],
+                                help='枝刈りに使う口コミ単位のファイル（merged_reviews.json など）')
+    convert_parser.add_argument('--aggregated', nargs='+', default=[],
+                                help='枝刈りに使う大学別に集約したファイル（aggregated_reviews_by_university.json など）')
+    convert_parser.add_argument('--tokenizer', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                                help=f'枝刈りの語彙の収集に使う形態素解析器。分析と同じものを指定する（デフォルト: {DEFAULT_BACKEND}）')
+
+    synthetic_parser = subparsers.add_parser('synthetic', help='動作確認用の小さなfastTextモデルを作る')
+    synthetic_parser.add_argument('--output', '-o', default='tiny.bin', help='保存先（デフォルト: tiny.bin）')
+    synthetic_parser.add_argument('--corpus', nargs='+', default=[], help='学習に使う口コミ単位のファイル')
+    synthetic_parser.add_argument('--aggregated', nargs='+', default=[], help='学習に使う大学別に集約したファイル')
+    synthetic_parser.add_argument('--vector-size', type=int, default=16, help='ベクトルの次元数（デフォルト: 16）')
+    synthetic_parser.add_argument('--tokenizer', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                                  help=f'学習に使うファイルを分かち書きする形態素解析器（デフォルト: {DEFAULT_BACKEND}）')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        if not is_converted(args.output):
+            print(f"エラー: 保存先の拡張子は{CONVERTED_SUFFIX}にしてください: {args.output}")
+            sys.exit(1)
+        if not os.path.exists(args.model):
+            print(f"エラー: モデルファイルが見つかりません: {args.model}")
+            sys.exit(1)
+        vocabulary = None
+        if args.corpus or args.aggregated:
+            print("コーパスの語彙を収集しています...")
+            vocabulary = collect_corpus_vocabulary(iter_corpus_texts(args.corpus, args.aggregated), args.tokenizer)
+            print(f"{len(vocabulary)}語を収集しました")
+        print(f"モデルを変換しています: {args.model}")
+        model = convert_model(args.model, args.output, vocabulary)
+        print(f"{len(model.key_to_index)}語のモデルを {args.output} に保存しました")
+    else:
+        texts = None
+        if args.corpus or args.aggregated:
+            texts = list(iter_corpus_texts(args.corpus, args.aggregated))
+        model = build_synthetic_model(args.output, texts, args.vector_size, backend=args.tokenizer)
+        print(f"{len(model.key_to_index)}語の合成モデルを {args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
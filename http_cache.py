@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# キャッシュに保存するレスポンスヘッダー
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Date')
+
+# 参照時刻の更新をまとめて書き込むまでに溜める件数と秒数
+ACCESS_FLUSH_SIZE = 100
+ACCESS_FLUSH_INTERVAL = 30.0
+
+# 1回のDELETEで削除するエントリ数の上限（書き込みロックを長く保持しないようにする）
+EVICT_BATCH_SIZE = 500
+
+
+class CacheMissError(requests.exceptions.ConnectionError):
+    """オフラインモードでキャッシュに存在しないURLを要求した"""
+
+
+class HttpCache:
+    """
+    URLをキーにレスポンス本文を圧縮して保存するディスクキャッシュ（スレッドセーフ）
+
+    ETag/Last-Modifiedを保持し、再取得時はIf-None-Match/If-Modified-Sinceで再検証する。
+    サイズと経過時間の上限を超えたエントリは古いものから削除する。
+    本文の合計サイズは開いたときに1回だけ集計し、以降は保存・削除のたびに差分で更新する。
+    getによる参照時刻の更新はメモリに溜めておき、一定件数・一定時間ごとにまとめて書き込む
+    """
+
+    def __init__(self, cache_dir='.http_cache', max_size_mb=500, max_age_hours=24 * 30, ttl=0, offline=False):
+        """
+        Args:
+            cache_dir (str): キャッシュを保存するディレクトリ
+            max_size_mb (float): 圧縮後の本文の合計サイズ上限（MB）
+            max_age_hours (float): 保存から削除されるまでの時間（時間）
+            ttl (float): 再検証せずにキャッシュをそのまま返す期間（秒、0の場合は常に再検証）
+            offline (bool): ネットワークに接続せず、キャッシュからのみ返すかどうか
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'responses.sqlite3')
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_hours * 3600
+        self.ttl = ttl
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' url TEXT PRIMARY KEY,'
+            ' status INTEGER NOT NULL,'
+            ' headers TEXT NOT NULL,'
+            ' body BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_stored_at ON responses (stored_at)')
+        self.conn.commit()
+        self.total_size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        # 書き込み待ちの参照時刻（URL -> 時刻）
+        self.pending_access = {}
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self._flush_access()
+            self.conn.commit()
+            self.conn.close()
+
+    def _flush_access(self):
+        """溜めておいた参照時刻を書き込む（ロックを保持した状態で呼び出し、コミットは呼び出し側で行う）"""
+        if self.pending_access:
+            self.conn.executemany('UPDATE responses SET accessed_at = ? WHERE url = ?',
+                                  [(accessed_at, url) for url, accessed_at in self.pending_access.items()])
+            self.pending_access.clear()
+        self.flushed_at = time.monotonic()
+
+    def get(self, url):
+        """
+        キャッシュ済みのエントリを返す（存在しない場合はNone）
+
+        Returns:
+            dict: status, headers, body, stored_at
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT status, headers, body, stored_at FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.pending_access[url] = time.time()
+            if (len(self.pending_access) >= ACCESS_FLUSH_SIZE
+                    or time.monotonic() - self.flushed_at >= ACCESS_FLUSH_INTERVAL):
+                self._flush_access()
+                self.conn.commit()
+        status, headers, body, stored_at = row
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+            'stored_at': stored_at,
+        }
+
+    def put(self, url, response):
+        """成功したレスポンスを保存する"""
+        headers = {k: response.headers[k] for k in STORED_HEADERS if k in response.headers}
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (url, status, headers, body, size, stored_at, accessed_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(headers), body, len(body), now, now),
+            )
+            self.pending_access.pop(url, None)
+            self.conn.commit()
+            self.total_size += len(body) - (old[0] if old else 0)
+        self.evict()
+
+    def touch(self, url):
+        """304で再検証できたエントリの保存時刻を更新する"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            self.pending_access.pop(url, None)
+            self.conn.commit()
+
+    def evict(self):
+        """期限切れのエントリと、サイズ上限を超えた分の参照が古いエントリを削除する"""
+        with self.lock:
+            expires_before = time.time() - self.max_age
+            while self._delete_batch('SELECT url, size FROM responses WHERE stored_at < ? LIMIT ?',
+                                     (expires_before, EVICT_BATCH_SIZE)) == EVICT_BATCH_SIZE:
+                pass
+            if self.total_size > self.max_size:
+                # 参照の新しさで削除する順を決めるため、溜めておいた参照時刻を先に書き込む
+                self._flush_access()
+            while self.total_size > self.max_size:
+                if not self._delete_batch('SELECT url, size FROM responses ORDER BY accessed_at LIMIT ?',
+                                          (EVICT_BATCH_SIZE,), self.total_size - self.max_size):
+                    break
+
+    def _delete_batch(self, query, params, excess=None):
+        """
+        queryで選んだエントリを削除してコミットし、削除した件数を返す（ロックを保持した状態で呼び出す）
+
+        excessを指定した場合は、削除したサイズの合計がexcessに達したところで止める
+        """
+        expired = []
+        for url, size in self.conn.execute(query, params).fetchall():
+            if excess is not None and excess <= 0:
+                break
+            expired.append((url,))
+            self.total_size -= size
+            if excess is not None:
+                excess -= size
+        self.conn.executemany('DELETE FROM responses WHERE url = ?', expired)
+        self.conn.commit()
+        return len(expired)
+
+    def is_fresh(self, entry):
+        return self.ttl > 0 and time.time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def validation_headers(entry):
+        """再検証用の条件付きリクエストヘッダーを返す"""
+        headers = {}
+        if 'ETag' in entry['headers']:
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if 'Last-Modified' in entry['headers']:
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    @staticmethod
+    def build_response(url, entry):
+        """キャッシュのエントリからrequests.Responseを組み立てる"""
+        response = requests.Response()
+        response.url = url
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['body']
+        response.from_cache = True
+        return response
@@ -0,0 +1,228 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+from http_cache import CacheMissError
+
+# (接続タイムアウト, 読み込みタイムアウト) 秒
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# 一時的なエラーとみなして再試行するステータスコード
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class FetchStats:
+    """リクエストごとのレイテンシ・転送量・ステータスを集計する（スレッドセーフ）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.revalidated = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.latencies = []
+        self.status_counts = {}
+
+    def record(self, status, elapsed, content_bytes, wire_bytes, retries=0):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.bytes += content_bytes
+            self.wire_bytes += wire_bytes
+            self.latencies.append(elapsed)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def record_cache_hit(self, revalidated=False):
+        with self.lock:
+            self.cache_hits += 1
+            if revalidated:
+                self.revalidated += 1
+
+    def summary(self):
+        """集計結果を辞書で返す"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            count = len(latencies)
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'cache_hits': self.cache_hits,
+                'revalidated': self.revalidated,
+                'bytes': self.bytes,
+                'wire_bytes': self.wire_bytes,
+                'latency_mean': sum(latencies) / count if count else 0.0,
+                'latency_p50': latencies[int(count * 0.5)] if count else 0.0,
+                'latency_p95': latencies[min(count - 1, int(count * 0.95))] if count else 0.0,
+                'status_counts': dict(self.status_counts),
+            }
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"HTTP統計: {s['requests']}リクエスト, 再試行{s['retries']}回, "
+              f"キャッシュ利用{s['cache_hits']}件（うち304再検証{s['revalidated']}件）, "
+              f"受信{s['bytes'] / 1024:.1f}KB（転送{s['wire_bytes'] / 1024:.1f}KB）, "
+              f"平均{s['latency_mean'] * 1000:.0f}ms, p95 {s['latency_p95'] * 1000:.0f}ms, "
+              f"ステータス別: {s['status_counts']}")
+
+
+# fetch中のリクエストの状態（urllib3の再試行はfetchを呼び出したスレッドで行われる）
+_current = threading.local()
+
+
+class _Attempt:
+    """fetchの1回の呼び出しで送る各リクエスト（再試行を含む）を、レート制限器に通知する"""
+
+    def __init__(self, url, rate_limiter):
+        self.url = url
+        self.rate_limiter = rate_limiter
+        self.observe = getattr(rate_limiter, 'observe', None)
+        self.started = None
+
+    def begin(self):
+        """リクエストの送信が許可されるまで待つ"""
+        if self.rate_limiter:
+            self.rate_limiter.wait(self.url)
+        self.started = time.perf_counter()
+
+    def finish(self, status):
+        """応答（接続エラー・タイムアウトの場合はNone）をレート制限器に通知する"""
+        if self.observe:
+            self.observe(self.url, status, time.perf_counter() - self.started)
+
+
+class RateLimitedRetry(Retry):
+    """
+    再試行するリクエストも、fetchに渡したレート制限器の予算に数えるRetry
+
+    失敗した応答をレート制限器に通知し、バックオフ（Retry-After）の後に改めて送信の許可を待つ
+    """
+
+    def sleep(self, response=None):
+        attempt = getattr(_current, 'attempt', None)
+        if attempt is not None:
+            attempt.finish(response.status if response is not None else None)
+        super().sleep(response)
+        if attempt is not None:
+            attempt.begin()
+
+
+def _build_retry(max_retries, backoff_factor, backoff_jitter):
+    options = dict(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return RateLimitedRetry(backoff_jitter=backoff_jitter, **options)
+    except TypeError:
+        # urllib3 1.x にはbackoff_jitterがない
+        return RateLimitedRetry(**options)
+
+
+def create_session(pool_size=10, max_retries=3, backoff_factor=1.0, backoff_jitter=1.0, timeout=DEFAULT_TIMEOUT):
+    """
+    コネクションプール・圧縮・再試行を設定したセッションを生成する
+
+    Args:
+        pool_size (int): ホストごとに保持する接続数（並行数以上を指定する）
+        max_retries (int): 一時的なエラー時の最大再試行回数
+        backoff_factor (float): 指数バックオフの基準秒数
+        backoff_jitter (float): バックオフに加えるランダムな揺らぎの最大秒数
+        timeout (tuple): fetchで使用する既定の (接続, 読み込み) タイムアウト秒
+
+    Returns:
+        requests.Session: 設定済みのセッション
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=_build_retry(max_retries, backoff_factor, backoff_jitter),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # gzip/deflateに加え、brotliがインストールされていればbrも要求する
+    session.headers.update(make_headers(accept_encoding=True, keep_alive=True))
+    session.request_timeout = tuple(timeout)
+    return session
+
+
+def fetch(session, url, headers=None, timeout=None, stats=None, rate_limiter=None, cache=None):
+    """
+    セッション経由でGETリクエストを送り、統計を記録する
+
+    Args:
+        session (requests.Session): create_sessionで生成したセッション
+        url (str): 取得するURL
+        headers (dict): 追加のリクエストヘッダー
+        timeout (tuple): (接続, 読み込み) タイムアウト秒（省略時はセッションの既定値）
+        stats (FetchStats): 統計の記録先
+        rate_limiter (RateLimiter): 送信前に許可を待つレート制限器。再試行の前にも許可を待ち、
+            observeを持つ場合は再試行を含む各リクエストの応答を通知する
+        cache (HttpCache): レスポンスキャッシュ（条件付きGETで再検証する）
+
+    Returns:
+        requests.Response: レスポンス（ステータスの検査は呼び出し側で行う）。
+            キャッシュから返した場合はfrom_cache属性がTrueになる
+    """
+    entry = cache.get(url) if cache else None
+    if cache and (cache.offline or (entry and cache.is_fresh(entry))):
+        if entry is None:
+            raise CacheMissError(f"オフラインモードでキャッシュに存在しないURLです: {url}")
+        if stats:
+            stats.record_cache_hit()
+        return cache.build_response(url, entry)
+
+    if entry:
+        headers = {**(headers or {}), **cache.validation_headers(entry)}
+
+    if timeout is None:
+        timeout = getattr(session, 'request_timeout', DEFAULT_TIMEOUT)
+
+    attempt = _Attempt(url, rate_limiter)
+    attempt.begin()
+    start = attempt.started
+    _current.attempt = attempt
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        content_bytes = len(response.content)
+    except requests.RequestException:
+        attempt.finish(None)
+        raise
+    finally:
+        _current.attempt = None
+    elapsed = time.perf_counter() - start
+    attempt.finish(response.status_code)
+
+    retries = getattr(response.raw, 'retries', None)
+
+    if stats:
+        retry_count = len(retries.history) if retries else 0
+        try:
+            wire_bytes = response.raw.tell()
+        except Exception:
+            wire_bytes = content_bytes
+        stats.record(response.status_code, elapsed, content_bytes, wire_bytes or content_bytes, retry_count)
+
+    if cache:
+        if response.status_code == 304 and entry:
+            cache.touch(url)
+            if stats:
+                stats.record_cache_hit(revalidated=True)
+            return cache.build_response(url, entry)
+        if response.status_code == 200:
+            cache.put(url, response)
+
+    return response
@@ -1,28 +1,169 @@
+import hashlib
 import json
 import os
+import re
 import glob
+import argparse
 
-def merge_reviews():
-    # reviews_dataディレクトリ内のすべてのJSONファイルを取得
-    json_files = glob.glob('reviews_data/*.json')
-    
-    # 結果を格納するリスト
-    merged_data = []
-    
-    # 各JSONファイルを読み込んでマージ
+from metrics import add_metrics_arguments, configure_metrics, metrics
+from review_record import UniversityTable, review_object_hook
+from review_io import TEXT_FIELDS, JsonArrayWriter, JsonlWriter, is_jsonl, progress_to_stderr, to_review_record
+
+# スクレイパーが保存するファイル名（{大学名}_{YYYYmmdd}_{HHMMSS}.json）
+SNAPSHOT_PATTERN = re.compile(r'^(?P<name>.+)_(?P<timestamp>\d{8}_\d{6})\.json$')
+
+def group_snapshots(json_files):
+    """
+    ファイル名から大学ごとのスナップショットをまとめる
+
+    ファイル名が{大学名}_{タイムスタンプ}.jsonの形式でないファイルは、それぞれ1校分として扱う
+
+    Returns:
+        dict: 大学名 -> 古い順のファイルパスのリスト（大学の順序はファイル名順で最初に現れた順）
+    """
+    groups = {}
     for file_path in json_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                merged_data.append(data)
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-    
-    # マージしたデータを新しいJSONファイルに書き込む
-    with open('merged_reviews.json', 'w', encoding='utf-8') as outfile:
-        json.dump(merged_data, outfile, ensure_ascii=False, indent=2)
-    
-    print(f"マージが完了しました。{len(merged_data)}件の大学データが merged_reviews.json に保存されました。")
+        match = SNAPSHOT_PATTERN.match(os.path.basename(file_path))
+        name = match.group('name') if match else file_path
+        timestamp = match.group('timestamp') if match else ''
+        groups.setdefault(name, []).append((timestamp, file_path))
+    return {name: [path for _, path in sorted(files)] for name, files in groups.items()}
+
+def normalize_text(value):
+    """改行コードと前後の空白の違いを無視して比較できるようにする"""
+    return str(value or '').replace('\r\n', '\n').replace('\r', '\n').strip()
+
+def review_key(review):
+    """
+    口コミの重複判定に使うキーを返す
+
+    review_idがあればそれを使い、なければ投稿日と本文のフィールドのハッシュを使う
+    （lxmlとhtml.parserで改行コードが異なっても同じ口コミとみなす）
+    """
+    review_id = review.get('review_id')
+    if review_id:
+        return f'id:{review_id}'
+    h = hashlib.sha1()
+    for field in ('post_date', *TEXT_FIELDS):
+        h.update(normalize_text(review.get(field)).encode('utf-8'))
+        h.update(b'\0')
+    return f'sha1:{h.hexdigest()}'
+
+def iter_merged_universities(input_dir, all_snapshots=False, stats=None):
+    """
+    大学ごとに最新のスナップショットと差分ファイルを重複なくまとめ、1校分ずつ返す
+
+    新しいファイルから順に読み込み、差分取得（incremental）で保存されたファイルや取得中にエラーになった
+    ファイル（error）の口コミを加えながら、エラーなく全件取得したスナップショットに達した時点で
+    それより古いファイルは読まずに打ち切る。同じキー（review_key）の口コミは新しいファイルのものだけを残す
+
+    Args:
+        input_dir (str): 各大学のJSONファイルがあるディレクトリ
+        all_snapshots (bool): Trueの場合は古いスナップショットも読み込み、重複を除いてすべての口コミを残す
+        stats (dict): 読み込んだファイル数・スキップしたファイル数・重複した口コミ数の集計先
+
+    Yields:
+        dict: 大学データ（メタデータはエラーのない最新のファイルのもの。すべてエラーの場合は最新のファイルのもの）
+    """
+    # 同じ大学のファイルが隣り合うよう名前順に並べてからまとめる
+    json_files = sorted(glob.glob(os.path.join(input_dir, '*.json')))
+    for name, file_paths in group_snapshots(json_files).items():
+        merged = None
+        latest = None
+        seen = set()
+        reviews = []
+        newest_first = list(reversed(file_paths))
+        for index, file_path in enumerate(newest_first):
+            try:
+                with metrics.stage('load'), open(file_path, 'r', encoding='utf-8') as file:
+                    # 口コミはReviewRecord（コンパクトな表現）として読み込む
+                    data = json.load(file, object_pairs_hook=review_object_hook)
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+                continue
+            if stats is not None:
+                stats['files'] += 1
+            metrics.inc('files_total')
+            if latest is None:
+                latest = data
+            if merged is None and not data.get('error'):
+                merged = {key: value for key, value in data.items() if key != 'incremental'}
+            for review in data.get('reviews', []):
+                key = review_key(review)
+                if key in seen:
+                    if stats is not None:
+                        stats['duplicates'] += 1
+                    metrics.inc('duplicate_reviews_total')
+                    continue
+                seen.add(key)
+                reviews.append(review)
+            if not data.get('incremental') and not data.get('error') and not all_snapshots:
+                # エラーなく全件取得したスナップショットより古いファイルは読み込まない
+                if stats is not None:
+                    stats['skipped_files'] += len(newest_first) - index - 1
+                break
+        if latest is None:
+            continue
+        if merged is None:
+            # すべてのファイルがエラーで終わっていた場合は最新のファイルのメタデータを使う
+            merged = {key: value for key, value in latest.items() if key != 'incremental'}
+        # キーの順序は最新のファイルのまま、口コミだけを置き換える
+        merged['reviews'] = reviews
+        metrics.inc('reviews_total', len(reviews))
+        yield merged
+
+def merge_reviews(input_dir='reviews_data', output_file='merged_reviews.json', all_snapshots=False):
+    """
+    各大学のJSONファイルを1つのファイルにマージする
+
+    同じ大学のファイルが複数ある場合（繰り返しのクロールや差分取得）は、最新の全件スナップショットと
+    それ以降の差分ファイルだけを使い、review_id（なければ本文のハッシュ）で重複を除く。
+    ファイルは大学1校分ずつ読み込んで書き出すため、メモリ使用量は大学1校分に収まる
+
+    output_fileがJSON Lines（.jsonl、'-'は標準出力）の場合は口コミ1件を1行として書き出す
+
+    Args:
+        input_dir (str): 各大学のJSONファイルがあるディレクトリ
+        output_file (str): 出力ファイルのパス
+        all_snapshots (bool): 古いスナップショットの口コミも（重複を除いて）残すかどうか
+    """
+    stats = {'files': 0, 'skipped_files': 0, 'duplicates': 0}
+    universities = iter_merged_universities(input_dir, all_snapshots, stats)
+    university_count = 0
+
+    if is_jsonl(output_file):
+        university_table = UniversityTable()
+        with JsonlWriter(output_file) as writer:
+            for data in universities:
+                with metrics.stage('write'):
+                    for review in data['reviews']:
+                        writer.write(to_review_record(data, review, university_table))
+                university_count += 1
+        review_count = writer.count
+    else:
+        # マージしたデータを大学1校分ずつ新しいJSONファイルに書き込む
+        review_count = 0
+        with JsonArrayWriter(output_file) as writer:
+            for data in universities:
+                with metrics.stage('write'):
+                    writer.write(data)
+                university_count += 1
+                review_count += len(data['reviews'])
+
+    print(f"マージが完了しました。{university_count}件の大学データ（{review_count}件の口コミ）が {output_file} に保存されました。")
+    if stats['skipped_files'] or stats['duplicates']:
+        print(f"古いスナップショット {stats['skipped_files']}件を除外し、重複した口コミ {stats['duplicates']}件を除きました。")
 
 if __name__ == "__main__":
-    merge_reviews()
+    parser = argparse.ArgumentParser(description='各大学の口コミJSONファイルを1つにマージする')
+    parser.add_argument('--input-dir', default='reviews_data',
+                        help='各大学のJSONファイルがあるディレクトリ（デフォルト: reviews_data）')
+    parser.add_argument('--output', '-o', default='merged_reviews.json',
+                        help='出力ファイルのパス。.jsonlの場合は1行1口コミで逐次書き出す（デフォルト: merged_reviews.json）')
+    parser.add_argument('--all-snapshots', action='store_true',
+                        help='最新の全件スナップショットより古いファイルの口コミも重複を除いて残す')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with progress_to_stderr(args.output), configure_metrics(args, 'merge_reviews'):
+        merge_reviews(args.input_dir, args.output, args.all_snapshots)
@@ -0,0 +1,315 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from atomic_io import atomic_open
+
+try:
+    import resource
+except ImportError:
+    # Windowsにはresourceモジュールがない
+    resource = None
+
+# Prometheus形式で出力するメトリクス名の接頭辞
+METRIC_PREFIX = 'kuchikomi_'
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def peak_rss_bytes(children=False):
+    """
+    プロセス（children=Trueの場合は終了した子プロセスの最大値）のピーク常駐メモリ量を返す
+
+    Returns:
+        int: バイト数（取得できない環境ではNone）
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrssはLinuxではKB、macOSではバイト単位
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class Metrics:
+    """
+    ステージごとの処理時間とカウンターを集計する（スレッドセーフ）
+
+    スクリプトはモジュール変数metricsのstage()・inc()で計測し、終了時にJSON Lines形式のログと
+    Prometheusのテキスト形式のファイルに書き出す。出力先を指定しない場合は集計だけを行う
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.log_path = None
+        self.log_file = None
+        self.prometheus_path = None
+        self.profiler = None
+        self.profile_stages = None
+        self.profile_dir = '.profiles'
+        self.profiles = {}
+        # cProfile・pyinstrumentは同時に1つしか有効にできないため、プロファイル中のステージを1つに限る
+        self.profile_lock = threading.Lock()
+
+    def configure(self, script=None, log_path=None, prometheus_path=None, profiler=None, profile_stages=None,
+                  profile_dir='.profiles'):
+        """
+        出力先とプロファイラーを設定する
+
+        Args:
+            script (str): メトリクスのラベルに使うスクリプト名
+            log_path (str): JSON Lines形式のログの出力先（'-'は標準エラー出力）
+            prometheus_path (str): Prometheusのテキスト形式のファイルの出力先
+            profiler (str): 'cprofile' / 'pyinstrument'（Noneの場合はプロファイルしない）
+            profile_stages (list): プロファイルするステージ名（空の場合はすべてのステージ）
+            profile_dir (str): プロファイル結果の保存先
+        """
+        if profiler == 'pyinstrument':
+            import pyinstrument  # noqa: F401  インストールされていなければここでImportError
+        if script:
+            self.script = script
+        self.log_path = log_path
+        if log_path == '-':
+            self.log_file = sys.stderr
+        elif log_path:
+            self.log_file = open(log_path, 'a', encoding='utf-8')
+        self.prometheus_path = prometheus_path
+        self.profiler = profiler
+        self.profile_stages = set(profile_stages) if profile_stages else None
+        self.profile_dir = profile_dir
+        self.started = time.perf_counter()
+        self.log('start', argv=sys.argv[1:])
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def enabled(self):
+        return bool(self.log_file or self.prometheus_path or self.profiler)
+
+    def log(self, event, **fields):
+        """JSON Lines形式のログに1行書き出す（ログの出力先がない場合は何もしない）"""
+        if not self.log_file:
+            return
+        record = {'time': datetime.now().isoformat(timespec='milliseconds'), 'script': self.script,
+                  'event': event, **fields}
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.log_file.write(line + '\n')
+            self.log_file.flush()
+
+    def inc(self, name, value=1, **labels):
+        """カウンターにvalueを加算する"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ゲージに値を設定する"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def stage_seconds(self, name):
+        return self.stages.get(name, {}).get('seconds', 0.0)
+
+    def throughput(self, counter, stage=None):
+        """
+        カウンターの1秒あたりの値を返す
+
+        stageを指定した場合はそのステージの合計時間、省略した場合は開始からの経過時間で割る
+        """
+        seconds = self.stage_seconds(stage) if stage else time.perf_counter() - self.started
+        return self.counter(counter) / seconds if seconds > 0 else 0.0
+
+    def _start_profile(self, name):
+        if not self.profiler or (self.profile_stages is not None and name not in self.profile_stages):
+            return None
+        if not self.profile_lock.acquire(blocking=False):
+            # 別のステージ（入れ子のステージや他のスレッド）をプロファイル中の場合は時間だけを計測する
+            return None
+        profile = self.profiles.get(name)
+        if profile is None:
+            if self.profiler == 'pyinstrument':
+                from pyinstrument import Profiler
+                profile = Profiler(async_mode='disabled')
+            else:
+                import cProfile
+                profile = cProfile.Profile()
+            self.profiles[name] = profile
+        if self.profiler == 'pyinstrument':
+            profile.start()
+        else:
+            profile.enable()
+        return profile
+
+    def _stop_profile(self, profile):
+        if self.profiler == 'pyinstrument':
+            profile.stop()
+        else:
+            profile.disable()
+        self.profile_lock.release()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        withブロックの処理時間をステージnameの時間として加算する
+
+        ログの出力先がある場合は、終了時にステージ名・所要時間とfieldsを1行書き出す
+        """
+        profile = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                self._stop_profile(profile)
+            with self.lock:
+                stat = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                stat['seconds'] += elapsed
+                stat['calls'] += 1
+            self.log('stage', stage=name, seconds=round(elapsed, 6), **fields)
+
+    def summary(self):
+        """集計結果を辞書で返す"""
+        with self.lock:
+            return {
+                'elapsed_seconds': time.perf_counter() - self.started,
+                'stages': {name: dict(stat) for name, stat in self.stages.items()},
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                'peak_rss_bytes': peak_rss_bytes(),
+                'children_peak_rss_bytes': peak_rss_bytes(children=True),
+            }
+
+    def print_summary(self):
+        s = self.summary()
+        stages = sorted(s['stages'].items(), key=lambda item: -item[1]['seconds'])
+        print(f"処理時間: 合計{s['elapsed_seconds']:.2f}秒 / "
+              + ", ".join(f"{name} {stat['seconds']:.2f}秒（{stat['calls']}回）" for name, stat in stages))
+        if s['peak_rss_bytes']:
+            print(f"ピークメモリ（RSS）: {s['peak_rss_bytes'] / 1024 / 1024:.1f}MB")
+
+    def prometheus_text(self):
+        """集計結果をPrometheusのテキスト形式で返す"""
+        s = self.summary()
+        base = {'script': self.script}
+        lines = []
+
+        def metric(name, kind, samples):
+            name = METRIC_PREFIX + name
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in {**base, **labels}.items())
+                lines.append(f'{name}{{{label_text}}} {value}')
+
+        metric('elapsed_seconds', 'gauge', [({}, s['elapsed_seconds'])])
+        metric('stage_seconds_total', 'counter', [({'stage': n}, st['seconds']) for n, st in s['stages'].items()])
+        metric('stage_calls_total', 'counter', [({'stage': n}, st['calls']) for n, st in s['stages'].items()])
+        for kind, items in (('counter', s['counters']), ('gauge', s['gauges'])):
+            by_name = {}
+            for item in items:
+                by_name.setdefault(item['name'], []).append((item['labels'], item['value']))
+            for name, samples in by_name.items():
+                metric(name, kind, samples)
+        for name in ('peak_rss_bytes', 'children_peak_rss_bytes'):
+            if s[name] is not None:
+                metric(name, 'gauge', [({}, s[name])])
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """ログに集計結果を書き出し、Prometheus形式のファイルとプロファイル結果を保存する"""
+        if self.prometheus_path:
+            with atomic_open(self.prometheus_path, 'w') as f:
+                f.write(self.prometheus_text())
+        if self.profiles:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for name, profile in self.profiles.items():
+                path = os.path.join(self.profile_dir, f'{self.script}.{name}')
+                if self.profiler == 'pyinstrument':
+                    path += '.html'
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(profile.output_html())
+                else:
+                    path += '.prof'
+                    profile.dump_stats(path)
+                self.log('profile', stage=name, path=path)
+            self.profiles = {}
+        if self.enabled:
+            self.log('summary', **self.summary())
+            self.print_summary()
+        if self.log_file and self.log_file is not sys.stderr:
+            self.log_file.close()
+        self.log_file = None
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# スクリプト全体で共有する計測器（from metrics import metrics で使う）
+metrics = Metrics()
+
+
+def record_analysis_metrics(tokenizer, scorer):
+    """
+    形態素解析器（CachedTokenizer）とスコア計算器（SentimentScorer）の集計を計測器に書き出す
+
+    tokens_per_secondはtokenizeステージの時間あたりのトークン数（キャッシュから返した分を含む）
+    """
+    metrics.inc('token_cache_lookups_total', tokenizer.hits, result='hit')
+    metrics.inc('token_cache_lookups_total', tokenizer.misses, result='miss')
+    metrics.inc('scored_tokens_total', scorer.token_count)
+    metrics.inc('oov_tokens_total', scorer.oov_count)
+    metrics.set('tokens_per_second', metrics.throughput('tokens_total', 'tokenize'))
+    metrics.set('oov_rate', scorer.oov_count / scorer.token_count if scorer.token_count else 0.0)
+
+
+def add_metrics_arguments(parser):
+    """計測・プロファイル用のコマンドラインオプションを追加する"""
+    group = parser.add_argument_group('計測・プロファイル')
+    group.add_argument('--metrics-log', type=str,
+                       help='ステージごとの処理時間と集計結果をJSON Lines形式で追記するファイル（-は標準エラー出力）')
+    group.add_argument('--metrics-file', type=str,
+                       help='集計結果をPrometheusのテキスト形式で書き出すファイル（node_exporterのtextfile collector向け）')
+    group.add_argument('--profile', nargs='*', metavar='STAGE',
+                       help='ステージをプロファイルする（ステージ名を省略するとすべてのステージ）')
+    group.add_argument('--profiler', choices=PROFILERS, default='cprofile',
+                       help='プロファイラー（デフォルト: cprofile、pyinstrumentは別途インストールが必要）')
+    group.add_argument('--profile-dir', type=str, default='.profiles',
+                       help='プロファイル結果の保存先（デフォルト: .profiles）')
+
+
+def configure_metrics(args, script):
+    """
+    add_metrics_argumentsで追加したオプションから共有の計測器を設定する
+
+    Returns:
+        Metrics: withブロックの終了時に結果を書き出す計測器
+    """
+    return metrics.configure(
+        script=script,
+        log_path=args.metrics_log,
+        prometheus_path=args.metrics_file,
+        profiler=args.profiler if args.profile is not None else None,
+        profile_stages=args.profile,
+        profile_dir=args.profile_dir,
+    )
@@ -0,0 +1,326 @@
+import json
+import glob
+import hashlib
+import random
+import os
+import re
+import html
+import time
+import threading
+import argparse
+from bisect import bisect_left
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from scrape_reviews import RATING_NAME_MAP
+
+REVIEWS_PER_PAGE = 10
+
+# 大学一覧ページの1ページあたりの大学数
+SCHOOLS_PER_INDEX_PAGE = 20
+
+# --capacityで負荷を模擬する場合の、負荷がないときの応答時間（--latencyを指定しない場合）
+BASE_LOAD_LATENCY = 0.01
+
+# 英語キー → 日本語タイトルの逆引き（詳細フィールドは除く）
+TITLE_MAP = {v: k for k, v in RATING_NAME_MAP.items() if not k.endswith('_詳細')}
+
+
+def load_schools(data_dir):
+    """
+    reviews_dataのスナップショットを学校ID別に読み込む
+
+    Returns:
+        dict: 学校ID → 大学データ
+    """
+    schools = {}
+    for file_path in sorted(glob.glob(os.path.join(data_dir, '*.json'))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        school_id = data['url'].rstrip('/').split('/')[-1]
+        schools[school_id] = data
+    return schools
+
+
+def clone_schools(schools, clones):
+    """
+    大学をclones倍に複製する（探索モードで大量の大学を扱う検証用）
+
+    複製した大学は元の学校IDに連番を付けたIDと、連番付きの大学名を持ち、口コミは元の大学と共有する
+    """
+    cloned = dict(schools)
+    for school_id, data in schools.items():
+        for k in range(1, clones):
+            cloned[f'{school_id}{k:04d}'] = {
+                **data,
+                'university_name': f"{data['university_name']}{k}",
+                'url': data['url'].replace(f'/{school_id}/', f'/{school_id}{k:04d}/'),
+            }
+    return cloned
+
+
+def render_index_page(schools, page, per_page=SCHOOLS_PER_INDEX_PAGE):
+    """大学一覧ページ（1ページ分）のHTMLを生成する"""
+    school_ids = sorted(schools)
+    start = (page - 1) * per_page
+    page_ids = school_ids[start:start + per_page]
+    if not page_ids:
+        return None
+    items = ''.join(
+        f'<li><a href="/university/school/{school_id}/">{html.escape(schools[school_id]["university_name"])}</a>'
+        f' <a href="/university/school/review/{school_id}/">口コミ</a></li>'
+        for school_id in page_ids
+    )
+    next_link = ''
+    if start + per_page < len(school_ids):
+        next_link = f'<ul class="pager"><li class="next"><a href="/university/search/page={page + 1}/">次へ</a></li></ul>'
+    return (
+        "<html><head><title>大学一覧｜みんなの大学情報</title></head>"
+        f'<body><ul class="schoolList">{items}</ul>{next_link}'
+        '<a href="https://example.com/university/school/1/">外部サイト</a></body></html>'
+    )
+
+
+def render_school_page(university_data):
+    """大学トップページのHTMLを生成する"""
+    name = html.escape(university_data['university_name'])
+    return (
+        f"<html><head><title>{name}の情報満載｜みんなの大学情報</title></head>"
+        f"<body><h1>{name}</h1></body></html>"
+    )
+
+
+def render_review_item(review):
+    """口コミ1件分の<li>要素を生成する"""
+    parts = [f'<li id="{html.escape(review.get("review_id", ""))}"><div class="js-mod-reviewList-list">']
+    for key, value in review.items():
+        if key in ('review_id', 'review_content', 'post_date') or key.endswith('_detail'):
+            continue
+        title = TITLE_MAP.get(key, key)
+        parts.append(
+            '<div class="schMod-reviewList-titleTop">'
+            f'<span class="schMod-reviewList-title">{html.escape(title)}</span>'
+            f'<span class="schMod-reviewList-ic">{html.escape(str(value))}</span>'
+            '</div>'
+        )
+        detail = review.get(f'{key}_detail')
+        if detail is not None:
+            parts.append(f'<div class="mod-reviewList-txt">{html.escape(detail)}</div>')
+    parts.append('</div></li>')
+    return ''.join(parts)
+
+
+def render_review_page(university_data, page, per_page=REVIEWS_PER_PAGE):
+    """口コミ一覧ページ（1ページ分）のHTMLを生成する"""
+    reviews = university_data['reviews']
+    start = (page - 1) * per_page
+    page_reviews = reviews[start:start + per_page]
+    if not page_reviews:
+        return None
+
+    answers = [
+        {'@type': 'Answer', 'text': r.get('review_content', ''), 'dateCreated': r.get('post_date', '')}
+        for r in page_reviews
+    ]
+    name = html.escape(university_data['university_name'])
+    items = ''.join(render_review_item(r) for r in page_reviews)
+    next_link = ''
+    if start + per_page < len(reviews):
+        next_link = f'<ul class="pager"><li class="next"><a href="page={page + 1}#reviewlist">次へ</a></li></ul>'
+    return (
+        f"<html><head><title>{name}の口コミ｜みんなの大学情報</title>"
+        f'<script type="application/ld+json">{json.dumps(answers, ensure_ascii=False)}</script>'
+        f"</head><body><div class=\"mod-reviewList\"><ul>{items}</ul></div>{next_link}</body></html>"
+    )
+
+
+class MockSiteStats:
+    """モックサーバーへのリクエスト状況を記録する"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_requests = 0
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.request_times = []
+        # パスごとのリクエスト数（同じページを重複して取得していないかの確認用）
+        self.path_counts = Counter()
+
+    def begin(self, path):
+        with self.lock:
+            self.total_requests += 1
+            self.path_counts[path] += 1
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+            self.request_times.append(time.time())
+
+    def recent_rate(self, window=1.0):
+        """直近window秒間のリクエスト数/秒"""
+        with self.lock:
+            now = time.time()
+            return (len(self.request_times) - bisect_left(self.request_times, now - window)) / window
+
+    def end(self):
+        with self.lock:
+            self.active_requests -= 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'total_requests': self.total_requests,
+                'active_requests': self.active_requests,
+                'max_active_requests': self.max_active_requests,
+                'request_times': list(self.request_times),
+                'path_counts': dict(self.path_counts),
+            }
+
+
+SCHOOL_PATH = re.compile(r'^/university/school/(\d+)/?$')
+REVIEW_PATH = re.compile(r'^/university/school/review/(\d+)/(?:page=(\d+))?$')
+INDEX_PATH = re.compile(r'^/university/search/(?:page=(\d+)/?)?$')
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    """みんなの大学情報の構造を模したページを返すハンドラ"""
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        stats = self.server.stats
+        path = self.path.split('#')[0].split('?')[0]
+        stats.begin(path)
+        try:
+            if path == '/__stats':
+                self._send(200, json.dumps(stats.to_dict()), 'application/json')
+                return
+
+            latency, overloaded = self.server.latency, False
+            if self.server.capacity:
+                # 直近のリクエスト頻度が処理能力に近づくと応答が遅くなり、超えると一部のリクエストに503を返す
+                load = stats.recent_rate() / self.server.capacity
+                latency = (latency or BASE_LOAD_LATENCY) * (1 + load ** 4)
+                overloaded = load > 1 and random.random() < min(0.9, (load - 1) * 2)
+            if latency:
+                time.sleep(latency)
+
+            if overloaded or (self.server.error_rate and random.random() < self.server.error_rate):
+                # 一時的な過負荷を模擬する
+                self._send(503, '<html><body>Service Unavailable</body></html>', headers={'Retry-After': '1'})
+                return
+
+            body = self._route(path)
+            if body is None:
+                self._send(404, '<html><body>Not Found</body></html>')
+                return
+
+            etag = '"' + hashlib.md5(body.encode('utf-8')).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self._send(200, body, headers={'ETag': etag})
+        finally:
+            stats.end()
+
+    def _route(self, path):
+        schools = self.server.schools
+        match = SCHOOL_PATH.match(path)
+        if match and match.group(1) in schools:
+            return render_school_page(schools[match.group(1)])
+        match = REVIEW_PATH.match(path)
+        if match and match.group(1) in schools:
+            page = int(match.group(2) or 1)
+            return render_review_page(schools[match.group(1)], page)
+        match = INDEX_PATH.match(path)
+        if match:
+            return render_index_page(schools, int(match.group(1) or 1))
+        return None
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(data_dir='reviews_data', host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, verbose=False,
+                  clones=1, capacity=0.0):
+    """
+    モックサーバーを生成する（serve_foreverは呼び出し側で実行する）
+
+    Args:
+        data_dir (str): ページ生成元となる口コミJSONのディレクトリ
+        host (str): 待ち受けアドレス
+        port (int): 待ち受けポート（0の場合は空きポートを自動割り当て）
+        latency (float): 各レスポンスに加える遅延（秒）
+        error_rate (float): Retry-After付きの503を返す確率（0〜1）
+        verbose (bool): アクセスログを出力するかどうか
+        clones (int): 大学を何倍に複製するか（探索モードの検証用）
+        capacity (float): 模擬するサーバーの処理能力（リクエスト数/秒、0の場合は負荷を模擬しない）
+
+    Returns:
+        ThreadingHTTPServer: サーバーオブジェクト
+    """
+    server = ThreadingHTTPServer((host, port), MockSiteHandler)
+    server.daemon_threads = True
+    server.schools = load_schools(data_dir)
+    if clones > 1:
+        server.schools = clone_schools(server.schools, clones)
+    server.stats = MockSiteStats()
+    server.latency = latency
+    server.error_rate = error_rate
+    server.capacity = capacity
+    server.verbose = verbose
+    return server
+
+
+def start_in_thread(server):
+    """サーバーをバックグラウンドスレッドで起動し、ベースURLを返す"""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スクレイパー検証用のローカルモックサイト')
+    parser.add_argument('--data-dir', type=str, default='reviews_data', help='ページ生成元の口コミJSONディレクトリ')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='待ち受けアドレス')
+    parser.add_argument('--port', type=int, default=8000, help='待ち受けポート')
+    parser.add_argument('--latency', type=float, default=0.0, help='各レスポンスに加える遅延（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Retry-After付きの503を返す確率（0〜1）')
+    parser.add_argument('--urls-output', type=str, help='モックサイト向けのURLリストを書き出すファイル')
+    parser.add_argument('--clones', type=int, default=1, help='大学を何倍に複製するか（探索モードの検証用、デフォルト: 1）')
+    parser.add_argument('--capacity', type=float, default=0.0,
+                        help='サーバーの処理能力（リクエスト数/秒）。近づくと応答が遅くなり、超えると503を返す（デフォルト: 0=模擬しない）')
+    parser.add_argument('--verbose', action='store_true', help='アクセスログを出力する')
+    args = parser.parse_args()
+
+    server = create_server(args.data_dir, args.host, args.port, args.latency, args.error_rate, args.verbose, args.clones,
+                           args.capacity)
+    base_url = f"http://{args.host}:{server.server_address[1]}"
+
+    if args.urls_output:
+        urls = [f"{base_url}/university/school/{school_id}/" for school_id in server.schools]
+        with open(args.urls_output, 'w', encoding='utf-8') as f:
+            json.dump(urls, f, ensure_ascii=False, indent=2)
+        print(f"URLリストを保存しました: {args.urls_output}")
+
+    print(f"{len(server.schools)}校分のモックサイトを起動しました: {base_url}（大学一覧: {base_url}/university/search/）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+from abc import ABC, abstractmethod
+
+# 分析に使う品詞（正規化した表記）。品詞体系は解析器ごとに異なるため、各解析器で対応する品詞に揃える
+# （IPADICの「名詞,一般」 ≒ UniDicの「名詞,普通名詞,一般」）
+NOUN_POS = '名詞,一般'
+
+DEFAULT_BACKEND = 'janome'
+
+
+class MorphTokenizer(ABC):
+    """形態素解析器の共通インターフェース"""
+
+    name = None
+
+    @abstractmethod
+    def morphemes(self, text):
+        """
+        テキストを形態素解析する
+
+        Returns:
+            list: (表層形, 品詞のタプル) のリスト
+        """
+
+    @abstractmethod
+    def is_common_noun(self, pos):
+        """品詞のタプルが正規化した「一般名詞」に当たるかどうか"""
+
+    @property
+    @abstractmethod
+    def version(self):
+        """解析結果のキャッシュのキーに使う、解析器と品詞の絞り込みを表す文字列"""
+
+    def nouns(self, text):
+        """テキストから一般名詞の表層形を出現順に返す"""
+        return [surface for surface, pos in self.morphemes(text) if self.is_common_noun(pos)]
+
+
+class JanomeTokenizer(MorphTokenizer):
+    """Janome（IPADIC）。pure Pythonなので追加のインストールが不要"""
+
+    name = 'janome'
+
+    def __init__(self):
+        import janome
+        from janome.tokenizer import Tokenizer
+        self._version = janome.__version__
+        self.tokenizer = Tokenizer()
+
+    def morphemes(self, text):
+        return [(t.surface, tuple(t.part_of_speech.split(','))) for t in self.tokenizer.tokenize(text)]
+
+    def is_common_noun(self, pos):
+        return pos[:2] == ('名詞', '一般')
+
+    def nouns(self, text):
+        # 従来の判定と同じ文字列の前方一致で絞り込む（品詞の分割を省いて速くする）
+        return [t.surface for t in self.tokenizer.tokenize(text) if t.part_of_speech.startswith(NOUN_POS)]
+
+    @property
+    def version(self):
+        # 従来のキャッシュのキーと互換にする
+        return f'janome={self._version};pos={NOUN_POS}'
+
+
+class FugashiTokenizer(MorphTokenizer):
+    """fugashi（MeCab）。UniDic（unidic-lite または unidic）の辞書が必要"""
+
+    name = 'fugashi'
+
+    def __init__(self):
+        import fugashi
+        self._version = getattr(fugashi, '__version__', 'unknown')
+        self.tagger = fugashi.Tagger()
+
+    def morphemes(self, text):
+        return [(word.surface, (word.feature.pos1, word.feature.pos2, word.feature.pos3)) for word in self.tagger(text)]
+
+    def is_common_noun(self, pos):
+        return pos[:3] == ('名詞', '普通名詞', '一般')
+
+    @property
+    def version(self):
+        return f'fugashi={self._version};pos={NOUN_POS}'
+
+
+class SudachiTokenizer(MorphTokenizer):
+    """SudachiPy。sudachidict_core などの辞書が必要。IPADICに近い短い単位（A単位）で分割する"""
+
+    name = 'sudachi'
+
+    def __init__(self):
+        import sudachipy
+        from sudachipy import dictionary
+        try:
+            from sudachipy import SplitMode
+        except ImportError:
+            # 0.5系以前
+            from sudachipy.tokenizer import Tokenizer
+            SplitMode = Tokenizer.SplitMode
+        self._version = getattr(sudachipy, '__version__', 'unknown')
+        self.mode = SplitMode.A
+        self.tokenizer = dictionary.Dictionary().create()
+
+    def morphemes(self, text):
+        return [(m.surface(), tuple(m.part_of_speech())) for m in self.tokenizer.tokenize(text, self.mode)]
+
+    def is_common_noun(self, pos):
+        return tuple(pos[:3]) == ('名詞', '普通名詞', '一般')
+
+    @property
+    def version(self):
+        return f'sudachi={self._version};mode=A;pos={NOUN_POS}'
+
+
+BACKENDS = {
+    'janome': JanomeTokenizer,
+    'fugashi': FugashiTokenizer,
+    'sudachi': SudachiTokenizer,
+}
+
+
+def create_tokenizer(backend=DEFAULT_BACKEND):
+    """
+    形態素解析器を作る
+
+    Args:
+        backend (str): 'janome' / 'fugashi' / 'sudachi'
+
+    Returns:
+        MorphTokenizer: 形態素解析器
+
+    Raises:
+        ImportError: 解析器またはその辞書がインストールされていない場合
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未対応の形態素解析器です: {backend}（{', '.join(BACKENDS)}）")
+    try:
+        return BACKENDS[backend]()
+    except ImportError:
+        raise
+    except Exception as e:
+        # fugashiは辞書が見つからない場合にRuntimeErrorを送出する
+        raise ImportError(f"{backend}を初期化できません: {e}") from e
+
+
+def available_backends():
+    """インストールされていて使える形態素解析器の名前を返す"""
+    names = []
+    for name in BACKENDS:
+        try:
+            create_tokenizer(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
@@ -0,0 +1,314 @@
+import glob
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from atomic_io import atomic_write_json
+from morph_tokenizer import BACKENDS, DEFAULT_BACKEND
+
+# 各ステージの標準出力・標準エラー出力を保存するディレクトリ
+LOG_DIR = '.pipeline_logs'
+
+HASH_CHUNK = 1024 * 1024
+
+
+class Stage:
+    """パイプラインの1ステージ（スクリプトの実行と、その入力・出力のパス）"""
+
+    def __init__(self, name, command, inputs=(), outputs=(), deps=(), always_run=False):
+        """
+        Args:
+            name (str): ステージ名
+            command (list): 実行するコマンド
+            inputs (list): 入力のファイル・ディレクトリ（内容のハッシュでスキップを判定する）
+            outputs (list): 出力のファイル・ディレクトリ
+            deps (list): 先に実行するステージ名
+            always_run (bool): 入力のハッシュに関わらず毎回実行するかどうか
+        """
+        self.name = name
+        self.command = list(command)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.always_run = always_run
+
+
+class Pipeline:
+    """
+    ステージを依存関係（DAG）の順に実行するランナー
+
+    入力の内容のハッシュとコマンドが前回の実行と同じで、出力も前回のまま残っているステージはスキップする。
+    依存関係のないステージ（口コミごとのスコア計算と大学別の分析など）は並行して実行する
+    """
+
+    def __init__(self, stages, state_path='.pipeline_state.json', log_dir=LOG_DIR):
+        """
+        Args:
+            stages (list): Stageのリスト
+            state_path (str): 前回の実行結果（ハッシュ）を保存するファイル
+            log_dir (str): ステージごとのログの保存先
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"{stage.name}の依存ステージ{dep}が定義されていません")
+        self.state_path = state_path
+        self.log_dir = log_dir
+        self.lock = threading.Lock()
+        self.state = {'stages': {}, 'files': {}}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def _save_state(self):
+        atomic_write_json(self.state_path, self.state)
+
+    def _file_hash(self, path):
+        """ファイルの内容のハッシュ（サイズと更新時刻が前回と同じなら保存済みの値を使う）"""
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.state['files'].get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self.lock:
+            self.state['files'][path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def content_hash(self, path):
+        """ファイルまたはディレクトリ（配下の全ファイル）の内容のハッシュ。存在しない場合はNone"""
+        if os.path.isfile(path):
+            return self._file_hash(path)
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for file_path in sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True)):
+                if os.path.isfile(file_path):
+                    h.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                    h.update(self._file_hash(file_path).encode('ascii'))
+            return h.hexdigest()
+        return None
+
+    def signature(self, stage):
+        """コマンドと入力の内容から、ステージの実行内容を表すハッシュを計算する"""
+        h = hashlib.sha256(json.dumps(stage.command).encode('utf-8'))
+        for path in stage.inputs:
+            h.update(f'{path}={self.content_hash(path)}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def is_up_to_date(self, stage, signature):
+        previous = self.state['stages'].get(stage.name)
+        if not previous or previous['signature'] != signature:
+            return False
+        return all(self.content_hash(path) == previous['outputs'].get(path) for path in stage.outputs)
+
+    def select(self, targets=None):
+        """targetsとその依存ステージの名前を定義順に返す（Noneの場合は全ステージ）"""
+        if targets is None:
+            return list(self.stages)
+        selected = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"ステージ{name}が定義されていません")
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in selected]
+
+    def _run_stage(self, stage, signature):
+        """ステージのコマンドを実行し、成功したかどうかを返す"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = os.path.join(self.log_dir, f'{stage.name}.log')
+        started = time.time_ns()
+        with open(log_path, 'w', encoding='utf-8') as log:
+            returncode = subprocess.run(stage.command, stdout=log, stderr=subprocess.STDOUT).returncode
+        # 各スクリプトはエラー時にメッセージを表示して終了するため、出力が書き直されたかどうかも確認する
+        missing = [
+            path for path in stage.outputs
+            if not os.path.exists(path) or os.stat(path).st_mtime_ns < started
+        ]
+        if returncode != 0 or missing:
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                tail = f.readlines()[-10:]
+            print(f"[{stage.name}] 失敗しました（終了コード: {returncode}、ログ: {log_path}）")
+            for line in tail:
+                print(f"[{stage.name}]   {line.rstrip()}")
+            return False
+        outputs = {path: self.content_hash(path) for path in stage.outputs}
+        with self.lock:
+            self.state['stages'][stage.name] = {'signature': signature, 'outputs': outputs, 'finished_at': time.time()}
+            self._save_state()
+        return True
+
+    def run(self, targets=None, force=False, dry_run=False, jobs=2):
+        """
+        ステージを依存関係の順に実行する
+
+        Args:
+            targets (list): 実行するステージ（依存ステージも含める。Noneの場合は全ステージ）
+            force (bool): 入力が変わっていなくても実行するかどうか
+            dry_run (bool): 実行せず、実行・スキップの予定だけを表示するかどうか
+            jobs (int): 同時に実行するステージ数の上限
+
+        Returns:
+            dict: ステージ名 -> 'ran' / 'skipped' / 'failed' / 'blocked' / 'planned'
+        """
+        names = self.select(targets)
+        status = {}
+        running = {}
+
+        def ready(name):
+            return all(status.get(dep) in ('ran', 'skipped', 'planned') for dep in self.stages[name].deps if dep in names)
+
+        def blocked(name):
+            return any(status.get(dep) in ('failed', 'blocked') for dep in self.stages[name].deps if dep in names)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            while len(status) < len(names):
+                for name in names:
+                    if name in status or name in running.values():
+                        continue
+                    stage = self.stages[name]
+                    if blocked(name):
+                        status[name] = 'blocked'
+                        print(f"[{name}] 依存ステージが失敗したため実行しません")
+                        continue
+                    if not ready(name):
+                        continue
+                    # 上流のステージを実行した場合は、その出力を入力としてハッシュを計算し直した上で判定する
+                    signature = self.signature(stage)
+                    upstream_planned = any(status.get(dep) == 'planned' for dep in stage.deps)
+                    if not force and not stage.always_run and not upstream_planned and self.is_up_to_date(stage, signature):
+                        status[name] = 'skipped'
+                        print(f"[{name}] 入力に変更がないためスキップします")
+                    elif dry_run:
+                        status[name] = 'planned'
+                        print(f"[{name}] 実行予定: {shlex.join(stage.command)}")
+                    else:
+                        print(f"[{name}] 実行します: {shlex.join(stage.command)}")
+                        running[executor.submit(self._run_stage, stage, signature)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        print(f"[{name}] 実行エラー: {e}")
+                        ok = False
+                    status[name] = 'ran' if ok else 'failed'
+                    if ok:
+                        print(f"[{name}] 完了しました")
+        return status
+
+
+def model_inputs(model_path):
+    """モデルのファイル（変換済みモデルの場合は配列の.npyも含める）"""
+    return [model_path, *sorted(glob.glob(glob.escape(model_path) + '.*.npy'))]
+
+
+def build_stages(args):
+    """
+    コマンドライン引数から、スクレイピングから分析までのステージを組み立てる
+
+    scrape → merge → aggregate → analyze
+                   ↘ score
+    """
+    python = sys.executable
+    here = os.path.dirname(os.path.abspath(__file__))
+    ext = 'jsonl' if args.format == 'jsonl' else 'json'
+    work = args.work_dir
+    merged = os.path.join(work, f'merged_reviews.{ext}')
+    aggregated = os.path.join(work, f'aggregated_reviews_by_university.{ext}')
+    scored = os.path.join(work, f'merged_reviews_with_scores.{ext}')
+    analysis = os.path.join(work, f'university_sentiment_analysis.{ext}')
+
+    analysis_options = ['--model', args.model, '--workers', str(args.workers), '--tokenizer', args.tokenizer]
+    if args.incremental:
+        analysis_options.append('--incremental')
+
+    stages = []
+    merge_deps = []
+    if args.scrape:
+        scrape_command = [python, os.path.join(here, 'scrape_reviews.py'), '--output', args.data_dir]
+        scrape_inputs = []
+        if args.urls:
+            scrape_command += ['--urls', args.urls]
+            scrape_inputs.append(args.urls)
+        scrape_command += shlex.split(args.scrape_args or '')
+        # サイトの内容は入力のハッシュに現れないため、指定した場合は毎回実行する
+        stages.append(Stage('scrape', scrape_command, scrape_inputs, [args.data_dir], always_run=True))
+        merge_deps.append('scrape')
+
+    stages += [
+        Stage('merge', [python, os.path.join(here, 'merge_reviews.py'), '--input-dir', args.data_dir, '--output', merged],
+              [args.data_dir], [merged], merge_deps),
+        Stage('aggregate', [python, os.path.join(here, 'aggregate_reviews_by_university.py'),
+                            '--input', merged, '--output', aggregated],
+              [merged], [aggregated], ['merge']),
+        Stage('score', [python, os.path.join(here, 'add_negative_scores_to_reviews.py'),
+                        '--input', merged, '--output', scored, *analysis_options],
+              [merged, *model_inputs(args.model)], [scored], ['merge']),
+        Stage('analyze', [python, os.path.join(here, 'analyze_university_reviews.py'),
+                          '--input', aggregated, '--output', analysis, *analysis_options],
+              [aggregated, *model_inputs(args.model)], [analysis], ['aggregate']),
+    ]
+    if args.metrics_dir:
+        # ステージごとの計測結果をPrometheusのテキスト形式で書き出す（textfile collectorでまとめて収集できる）
+        for stage in stages:
+            stage.command += ['--metrics-file', os.path.join(args.metrics_dir, f'{stage.name}.prom')]
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スクレイピングから分析までを依存関係に沿って実行するパイプライン')
+    parser.add_argument('targets', nargs='*', help='実行するステージ（merge / aggregate / score / analyze、省略時は全ステージ）')
+    parser.add_argument('--scrape', action='store_true', help='最初にスクレイピングを実行する')
+    parser.add_argument('--urls', type=str, help='スクレイピングするURLリストのJSONファイル')
+    parser.add_argument('--scrape-args', type=str, help='scrape_reviews.pyに渡す追加の引数（例: "--workers 4 --incremental"）')
+    parser.add_argument('--data-dir', type=str, default='reviews_data', help='大学ごとの口コミJSONのディレクトリ')
+    parser.add_argument('--work-dir', type=str, default='.', help='中間ファイル・結果ファイルの出力先（デフォルト: カレントディレクトリ）')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json', help='中間ファイル・結果ファイルの形式（デフォルト: json）')
+    parser.add_argument('--model', '-m', type=str, default='cc.ja.300.bin', help='fastTextモデルのパス（.kvも可）')
+    parser.add_argument('--workers', type=int, default=1, help='形態素解析のワーカープロセス数（各分析ステージ）')
+    parser.add_argument('--tokenizer', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f'形態素解析器（デフォルト: {DEFAULT_BACKEND}）')
+    parser.add_argument('--incremental', action='store_true', help='分析ステージを差分分析モードで実行する')
+    parser.add_argument('--jobs', '-j', type=int, default=2, help='同時に実行するステージ数（デフォルト: 2）')
+    parser.add_argument('--force', action='store_true', help='入力が変わっていなくても全ステージを実行する')
+    parser.add_argument('--dry-run', action='store_true', help='実行せず、実行・スキップの予定だけを表示する')
+    parser.add_argument('--state-file', type=str, default='.pipeline_state.json', help='前回の実行結果の保存先')
+    parser.add_argument('--metrics-dir', type=str, help='各ステージの計測結果（<ステージ名>.prom）の保存先')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    stages = build_stages(args)
+    pipeline = Pipeline(stages, args.state_file, os.path.join(args.work_dir, LOG_DIR))
+    try:
+        status = pipeline.run(args.targets or None, args.force, args.dry_run, args.jobs)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        sys.exit(1)
+
+    counts = {s: list(status.values()).count(s) for s in ('ran', 'skipped', 'planned', 'failed', 'blocked')}
+    print("パイプライン: " + ", ".join(f"{k} {v}" for k, v in counts.items() if v))
+    if counts['failed'] or counts['blocked']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from metrics import metrics
+
+# サーバーの過負荷・レート制限を表し、すぐにレートを下げるステータスコード（5xxも同様に扱う）
+BACKOFF_STATUS_CODES = (429, 503)
+
+# 応答時間の基準（これまでで最も速かったp50）に対して、平常とみなすp95の上限（倍率・秒数の大きい方）
+HEALTHY_LATENCY_FACTOR = 1.5
+HEALTHY_LATENCY_MARGIN = 0.05
+
+# 基準に対して、スパイクとみなすp95の下限の秒数（latency_factor倍との大きい方）
+SPIKE_LATENCY_MARGIN = 0.1
+
+
+class TokenBucket:
+    """トークンバケット方式でリクエスト頻度を制限する（スレッドセーフ）"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): 1秒あたりに補充されるトークン数（= 許可するリクエスト数/秒）
+            capacity (float): バケットの最大容量（バースト許容量）。省略時は max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError(f"rateは正の値を指定してください: {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate):
+        """補充の速さを変更する（それまでに溜まったトークンは残す）"""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1.0):
+        """トークンが得られるまで待機する。待機した秒数を返す"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """全体とホスト単位の2段階でリクエスト頻度を制限する"""
+
+    def __init__(self, global_rate, per_host_rate=None, burst=None):
+        """
+        Args:
+            global_rate (float): 全ホスト合計の最大リクエスト数/秒
+            per_host_rate (float): 1ホストあたりの最大リクエスト数/秒（省略時はglobal_rateと同じ）
+            burst (float): バースト許容量（省略時は各レートと同じ）
+        """
+        self.global_bucket = TokenBucket(global_rate, burst)
+        self.per_host_rate = per_host_rate or global_rate
+        self.burst = burst
+        self.host_buckets = {}
+        self.lock = threading.Lock()
+
+    def _host_bucket(self, host):
+        with self.lock:
+            bucket = self.host_buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.per_host_rate, self.burst)
+                self.host_buckets[host] = bucket
+            return bucket
+
+    def wait(self, url):
+        """URLのホストに対するリクエストが許可されるまで待機する。待機した秒数を返す"""
+        host = urlparse(url).netloc
+        waited = self._host_bucket(host).acquire()
+        waited += self.global_bucket.acquire()
+        return waited
+
+
+class HostThrottle:
+    """AdaptiveRateLimiterのホストごとの状態"""
+
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        # レートを上げた直後にまとめて送らないよう、バースト許容量は1にする
+        self.bucket = TokenBucket(rate, 1)
+        self.latencies = []
+        self.baseline = None
+        self.last_decrease = float('-inf')
+
+
+class AdaptiveRateLimiter:
+    """
+    サーバーの応答時間とエラーからホストごとのリクエスト頻度を調整するレート制限器（AIMD方式、スレッドセーフ）
+
+    window件の応答ごとにp95レイテンシを調べ、平常時（これまでで最も速かったp50に近い）ならレートをincreaseだけ上げ、
+    スパイク（latency_factor倍超）なら半分に下げる。429/503・5xx・接続エラーは1件でもすぐに半分に下げる。
+    レートを下げた後は、下げる前に送ったリクエストへの応答では再び下げない。
+    レートはmin_rateからmax_rateの範囲で変化し、全ホスト合計はmax_rateで制限する
+    """
+
+    def __init__(self, max_rate, per_host_max_rate=None, min_rate=0.1, initial_rate=None, increase=None,
+                 decrease=0.5, window=10, latency_factor=3.0):
+        """
+        Args:
+            max_rate (float): 全ホスト合計の最大リクエスト数/秒
+            per_host_max_rate (float): 1ホストあたりの最大リクエスト数/秒（省略時はmax_rateと同じ）
+            min_rate (float): 1ホストあたりの最小リクエスト数/秒
+            initial_rate (float): 1ホストあたりの開始時のリクエスト数/秒（省略時は最大の半分）
+            increase (float): 平常時に1回で上げるリクエスト数/秒（省略時は最大の1/10）
+            decrease (float): 過負荷時にレートに掛ける値
+            window (int): 応答時間を調べる応答数
+            latency_factor (float): 基準の応答時間の何倍を超えたらスパイクとみなすか
+        """
+        self.global_bucket = TokenBucket(max_rate)
+        self.max_rate = per_host_max_rate or max_rate
+        self.min_rate = min(min_rate, self.max_rate)
+        self.initial_rate = max(self.min_rate, initial_rate or self.max_rate / 2)
+        self.increase = increase or self.max_rate / 10
+        self.decrease = decrease
+        self.window = window
+        self.latency_factor = latency_factor
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host):
+        with self.lock:
+            throttle = self.hosts.get(host)
+            if throttle is None:
+                throttle = HostThrottle(self.initial_rate)
+                self.hosts[host] = throttle
+                metrics.set('request_rate', self.initial_rate, host=host)
+            return throttle
+
+    def wait(self, url):
+        """URLのホストに対するリクエストが許可されるまで待機する。待機した秒数を返す"""
+        host = urlparse(url).netloc
+        waited = self._host(host).bucket.acquire()
+        waited += self.global_bucket.acquire()
+        return waited
+
+    def rates(self):
+        """ホストごとの現在のリクエスト数/秒を返す"""
+        with self.lock:
+            return {host: throttle.bucket.rate for host, throttle in self.hosts.items()}
+
+    def observe(self, url, status, elapsed):
+        """
+        応答を記録し、レートを調整する（fetchが再試行を含む各リクエストの後に呼び出す）
+
+        Args:
+            url (str): リクエストしたURL
+            status (int): ステータスコード（接続エラー・タイムアウトの場合はNone）
+            elapsed (float): 応答までの秒数
+        """
+        host = urlparse(url).netloc
+        throttle = self._host(host)
+        now = time.monotonic()
+        # 応答が返るまでの間にレートを下げていた場合、この応答は下げる前の頻度の結果
+        sent_before_decrease = now - elapsed < throttle.last_decrease
+        if status is None or status >= 500 or status in BACKOFF_STATUS_CODES:
+            reason = 'error' if status is None else str(status)
+        else:
+            reason = None
+
+        with throttle.lock:
+            if reason is not None:
+                if not sent_before_decrease:
+                    self._adjust(host, throttle, self.decrease, 0.0, reason, now)
+                return
+            throttle.latencies.append(elapsed)
+            if len(throttle.latencies) < self.window:
+                return
+            latencies = sorted(throttle.latencies)
+            throttle.latencies = []
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            baseline = throttle.baseline = p50 if throttle.baseline is None else min(throttle.baseline, p50)
+            metrics.set('request_latency_p95_seconds', p95, host=host)
+            if p95 > max(baseline * self.latency_factor, baseline + SPIKE_LATENCY_MARGIN):
+                if not sent_before_decrease:
+                    self._adjust(host, throttle, self.decrease, 0.0, 'latency', now)
+            elif p95 <= max(baseline * HEALTHY_LATENCY_FACTOR, baseline + HEALTHY_LATENCY_MARGIN):
+                self._adjust(host, throttle, 1.0, self.increase, None, now)
+
+    def _adjust(self, host, throttle, factor, step, reason, now):
+        """レートをfactor倍してstepを足す（throttle.lockを持った状態で呼び出す）"""
+        old_rate = throttle.bucket.rate
+        rate = min(self.max_rate, max(self.min_rate, old_rate * factor + step))
+        if reason is not None:
+            throttle.last_decrease = now
+            throttle.latencies = []
+            print(f"{host}: 応答の悪化（{reason}）のためレートを{old_rate:.2f}→{rate:.2f}件/秒に下げました")
+        if rate == old_rate:
+            return
+        throttle.bucket.set_rate(rate)
+        metrics.set('request_rate', rate, host=host)
+        metrics.inc('rate_adjustments_total', direction='down' if rate < old_rate else 'up', reason=reason or 'healthy')
+
+
+class SharedRateLimiter:
+    """
+    複数のプロセス（ワーカー）で1つのSQLiteファイルのトークンバケットを共有し、全体とホスト単位でリクエスト頻度を制限する
+
+    レートはconfigureで設定したファイル上の値を使うため、すべてのワーカーが同じ予算の中でリクエストを送る。
+    時刻はプロセス間で共通の壁時計（time.time）を使う
+    """
+
+    # 全体のバケットと、ホスト単位のバケットの設定の名前
+    GLOBAL = '*'
+    HOST_TEMPLATE = 'host:*'
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): トークンバケットを置くSQLiteファイルのパス
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets ('
+            ' name TEXT PRIMARY KEY,'
+            ' rate REAL NOT NULL,'
+            ' capacity REAL NOT NULL,'
+            ' tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def configure(self, global_rate, per_host_rate=None, burst=None):
+        """
+        全体とホスト単位のレートを設定する（実行中のワーカーにもすぐに反映される）
+
+        Args:
+            global_rate (float): 全ワーカー合計の最大リクエスト数/秒
+            per_host_rate (float): 1ホストあたりの最大リクエスト数/秒（省略時はglobal_rateと同じ）
+            burst (float): バースト許容量（省略時は各レートと同じ）
+        """
+        if global_rate <= 0:
+            raise ValueError(f"rateは正の値を指定してください: {global_rate}")
+        per_host_rate = per_host_rate or global_rate
+        now = time.time()
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for name, rate in ((self.GLOBAL, global_rate), (self.HOST_TEMPLATE, per_host_rate)):
+                capacity = float(burst) if burst else max(1.0, rate)
+                self.conn.execute(
+                    'INSERT INTO rate_buckets (name, rate, capacity, tokens, updated_at) VALUES (?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (name) DO UPDATE SET rate = excluded.rate, capacity = excluded.capacity,'
+                    ' tokens = MIN(tokens, excluded.capacity)',
+                    (name, rate, capacity, capacity, now),
+                )
+            # 作成済みのホスト単位のバケットも新しいレートにする
+            capacity = float(burst) if burst else max(1.0, per_host_rate)
+            self.conn.execute(
+                "UPDATE rate_buckets SET rate = ?, capacity = ?, tokens = MIN(tokens, ?) WHERE name LIKE 'host:%' AND name != ?",
+                (per_host_rate, capacity, capacity, self.HOST_TEMPLATE),
+            )
+            self.conn.execute('COMMIT')
+
+    def rates(self):
+        """設定されている (全体のレート, ホスト単位のレート) を返す（未設定の場合はNone）"""
+        with self.lock:
+            rows = dict(self.conn.execute('SELECT name, rate FROM rate_buckets WHERE name IN (?, ?)',
+                                          (self.GLOBAL, self.HOST_TEMPLATE)).fetchall())
+        return rows.get(self.GLOBAL), rows.get(self.HOST_TEMPLATE)
+
+    def _try_acquire(self, name):
+        """トークンを1つ取り出す。取り出せた場合は0、足りない場合は待つべき秒数を返す"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('SELECT rate, capacity, tokens, updated_at FROM rate_buckets WHERE name = ?',
+                                        (name,)).fetchone()
+                if row is None:
+                    template = self.conn.execute('SELECT rate, capacity FROM rate_buckets WHERE name = ?',
+                                                 (self.HOST_TEMPLATE,)).fetchone()
+                    if template is None:
+                        raise RuntimeError(f"レートが設定されていません: {self.path}（configureで設定してください）")
+                    row = (template[0], template[1], template[1], now)
+                rate, capacity, tokens, updated_at = row
+                tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                if not wait:
+                    tokens -= 1
+                self.conn.execute('INSERT OR REPLACE INTO rate_buckets (name, rate, capacity, tokens, updated_at)'
+                                  ' VALUES (?, ?, ?, ?, ?)', (name, rate, capacity, tokens, now))
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return wait
+
+    def _acquire(self, name):
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(name)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def wait(self, url):
+        """URLのホストに対するリクエストが許可されるまで待機する。待機した秒数を返す"""
+        host = urlparse(url).netloc
+        waited = self._acquire(f'host:{host}')
+        waited += self._acquire(self.GLOBAL)
+        return waited
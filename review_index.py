@@ -0,0 +1,83 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+
+class ReviewIndex:
+    """学校ごとの取得済み口コミIDを記録するSQLiteインデックス（スレッドセーフ）"""
+
+    def __init__(self, path='review_index.sqlite3'):
+        """
+        Args:
+            path (str): インデックスファイルのパス（存在しない場合は新規作成）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS reviews ('
+            ' school_id TEXT NOT NULL,'
+            ' review_id TEXT NOT NULL,'
+            ' first_seen TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,'
+            ' PRIMARY KEY (school_id, review_id))'
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def count(self, school_id=None):
+        """登録済みの口コミID数を返す"""
+        with self.lock:
+            if school_id is None:
+                row = self.conn.execute('SELECT COUNT(*) FROM reviews').fetchone()
+            else:
+                row = self.conn.execute('SELECT COUNT(*) FROM reviews WHERE school_id = ?', (school_id,)).fetchone()
+        return row[0]
+
+    def known_ids(self, school_id, review_ids):
+        """review_idsのうち、登録済みのIDの集合を返す"""
+        review_ids = [r for r in review_ids if r]
+        if not review_ids:
+            return set()
+        placeholders = ','.join('?' * len(review_ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT review_id FROM reviews WHERE school_id = ? AND review_id IN ({placeholders})',
+                [school_id, *review_ids],
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add(self, school_id, review_ids):
+        """口コミIDを登録する（登録済みのIDは無視される）"""
+        rows = [(school_id, r) for r in review_ids if r]
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO reviews (school_id, review_id) VALUES (?, ?)', rows)
+            self.conn.commit()
+
+    def seed_from_dir(self, data_dir):
+        """
+        保存済みの大学データJSONから口コミIDを一括登録する
+
+        Returns:
+            int: 読み込んだファイル数
+        """
+        files = glob.glob(os.path.join(data_dir, '*.json'))
+        for file_path in files:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                school_id = data['url'].rstrip('/').split('/')[-1]
+                self.add(school_id, [r.get('review_id') for r in data.get('reviews', [])])
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+        return len(files)
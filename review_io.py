@@ -0,0 +1,335 @@
+import json
+import re
+import sys
+from contextlib import contextmanager, redirect_stdout
+from itertools import groupby
+
+from atomic_io import atomic_open
+from review_record import ReviewRecord, UniversityTable, encode_review, review_object_hook
+
+# 口コミ1件のレコードに付与する大学の情報
+UNIVERSITY_FIELDS = ('university_name', 'url', 'review_url')
+
+# 口コミの本文を含むフィールド
+TEXT_FIELDS = [
+    'review_content',
+    'overall_rating_detail',
+    '講義・授業_detail',
+    'laboratory_seminar_detail',
+    'career_detail',
+    'access_location_detail',
+    'facilities_detail',
+    'friendship_romance_detail',
+    'student_life_detail',
+    'department_curriculum_detail',
+    'gender_ratio_detail',
+    'motivation_detail',
+    'career_path_detail'
+]
+
+# JSON配列を要素ごとに読み込むときに1回に読むサイズ（文字数）
+JSON_READ_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def review_text(review):
+    """
+    口コミ1件のテキストのフィールドを空白区切りで結合した、ネガティブスコアの計算対象のテキストを返す
+
+    Returns:
+        str: 結合したテキスト（テキストがない口コミは空文字列）
+    """
+    text = ''.join(review[field] + ' ' for field in TEXT_FIELDS if review.get(field))
+    return text if text.strip() else ''
+
+
+def is_jsonl(path):
+    """JSON Lines形式（1行1レコード）のパスかどうか。'-'は標準入出力のJSON Linesとして扱う"""
+    return path == '-' or path.endswith('.jsonl') or path.endswith('.ndjson')
+
+
+def iter_jsonl(path):
+    """JSON Linesファイル（'-'の場合は標準入力）を1行ずつ読み込む"""
+    if path == '-':
+        for line in sys.stdin:
+            if line.strip():
+                yield json.loads(line)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(file, object_pairs_hook=None, read_size=JSON_READ_SIZE):
+    """
+    JSON配列の要素（オブジェクト）を1つずつ読み込んで返す
+
+    ファイル全体を文字列として読み込まず、要素1つ分ずつ解析するため、
+    メモリ使用量は読み込んだ要素と要素1つ分のテキストに収まる
+
+    Args:
+        file: テキストモードで開いたファイル
+        object_pairs_hook: json.loadと同じ（review_object_hookで口コミをReviewRecordとして読み込む）
+        read_size (int): 1回に読むサイズ（要素がこれより大きい場合は倍にしながら読み足す）
+    """
+    decoder = json.JSONDecoder(object_pairs_hook=object_pairs_hook)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read_more(size):
+        nonlocal buffer, pos, eof
+        chunk = file.read(size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char():
+        # 空白を読み飛ばして次の文字を返す（ファイルの終わりでは''）
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof or not read_more(read_size):
+                return ''
+
+    if next_char() != '[':
+        raise json.JSONDecodeError("Expecting '['", buffer, pos)
+    pos += 1
+    if next_char() == ']':
+        return
+    while True:
+        next_char()
+        size = read_size
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # 要素が途中で切れている場合は読み足して解析し直す
+                if eof or not read_more(size):
+                    raise
+                size *= 2
+        pos = end
+        yield item
+        c = next_char()
+        if c == ']':
+            return
+        if c != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        pos += 1
+
+
+def iter_university_data(path):
+    """
+    大学単位のJSON（merged_reviews.json形式）から大学データを1校分ずつ読み込む
+
+    口コミはReviewRecord（コンパクトな表現）として読み込む
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_json_array(f, review_object_hook)
+
+
+class JsonlWriter:
+    """レコードを1行ずつJSON Linesとして書き出す（'-'の場合は標準出力）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        if path == '-':
+            self._context = None
+            self.file = sys.__stdout__
+        else:
+            self._context = atomic_open(path, 'w', encoding='utf-8')
+            self.file = self._context.__enter__()
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False, default=encode_review) + '\n')
+        self.count += 1
+        if self.path == '-':
+            # 後段のプロセスがすぐに処理を始められるように都度送り出す
+            self.file.flush()
+
+    def close(self, exc_info=(None, None, None)):
+        if self._context is not None:
+            self._context.__exit__(*exc_info)
+            self._context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close(exc_info)
+
+
+class JsonArrayWriter:
+    """
+    要素を1つずつ書き出して、json.dump(list, indent=2)と同じ形式のJSON配列を作る
+
+    リスト全体をメモリに載せずに、従来のインデント付きJSONを出力するために使う
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._context = atomic_open(path, 'w', encoding='utf-8')
+        self.file = self._context.__enter__()
+        self.file.write('[')
+
+    def write(self, item):
+        text = json.dumps(item, ensure_ascii=False, indent=2, default=encode_review)
+        self.file.write(',\n' if self.count else '\n')
+        # 文字列中の改行はエスケープされるため、行単位で字下げしても内容は変わらない
+        self.file.write('\n'.join('  ' + line for line in text.split('\n')))
+        self.count += 1
+
+    def close(self, exc_info=(None, None, None)):
+        if self._context is not None:
+            if exc_info[0] is None:
+                self.file.write('\n]' if self.count else ']')
+            self._context.__exit__(*exc_info)
+            self._context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close(exc_info)
+
+
+@contextmanager
+def progress_to_stderr(output_path):
+    """出力先が標準出力の場合、進捗表示（print）を標準エラー出力に切り替える"""
+    if output_path == '-':
+        with redirect_stdout(sys.stderr):
+            yield
+    else:
+        yield
+
+
+def to_review_record(university_data, review, universities=None):
+    """
+    大学データと口コミ1件から、1行分のフラットなレコードを作る
+
+    口コミがReviewRecordの場合は値を共有し、大学の情報はuniversitiesで共有した辞書として持つ
+
+    Args:
+        university_data (dict): 大学データ
+        review (dict): 口コミ
+        universities (UniversityTable): 大学の情報を共有する表（同じ読み込み・マージの中で使い回す。
+            Noneの場合は口コミごとに大学の情報を持つ）
+    """
+    university = {field: university_data[field] for field in UNIVERSITY_FIELDS if field in university_data}
+    if isinstance(review, ReviewRecord) and review.university is None and not any(f in review for f in university):
+        return review.with_university(universities.intern(university) if universities is not None else university)
+    record = university
+    record.update(review)
+    return record
+
+
+def split_review_record(record):
+    """フラットなレコードを (大学の情報, 口コミ) に分ける"""
+    if isinstance(record, ReviewRecord) and record.university is not None:
+        return dict(record.university), record.without_university()
+    university = {field: record[field] for field in UNIVERSITY_FIELDS if field in record}
+    review = {k: v for k, v in record.items() if k not in UNIVERSITY_FIELDS}
+    return university, review
+
+
+def is_columnar(path):
+    """列指向形式（Parquet / Arrow IPC）のパスかどうか"""
+    return path.endswith('.parquet') or path.endswith('.arrow') or path.endswith('.feather')
+
+
+def iter_review_records(path, columns=None):
+    """
+    口コミ1件ずつのフラットなレコードを順に返す
+
+    JSON Linesはそのまま1行ずつ読み込み、従来の大学単位のJSON（merged_reviews.json形式）は
+    大学1校分ずつ読み込んでレコードに展開する。列指向形式（.parquet / .arrow）の場合は
+    columnsで指定した列だけを読み込む（JSON系の形式ではcolumnsは無視する）
+    """
+    if is_columnar(path):
+        from columnar_store import iter_columnar_records
+        yield from iter_columnar_records(path, columns)
+        return
+    if is_jsonl(path):
+        yield from iter_jsonl(path)
+        return
+    universities = UniversityTable()
+    for university_data in iter_university_data(path):
+        for review in university_data.get('reviews', []):
+            yield to_review_record(university_data, review, universities)
+
+
+def group_by_university(records):
+    """
+    連続する同じ大学のレコードをまとめる
+
+    Yields:
+        tuple: (大学の情報, その大学のレコードのイテレータ)
+    """
+    for key, group in groupby(records, key=lambda r: tuple(r.get(f) for f in UNIVERSITY_FIELDS)):
+        yield {f: v for f, v in zip(UNIVERSITY_FIELDS, key) if v is not None}, group
+
+
+def iter_university_reviews(path, columns=None):
+    """
+    大学ごとに (大学の情報, 口コミのイテレータ) を順に返す
+
+    JSON Linesと列指向形式は連続する同じ大学のレコードを1校分としてまとめ、
+    従来のJSONは大学データ1件を1校分として返す。
+    columnsは列指向形式の場合に読み込む列を指定する
+    """
+    if is_jsonl(path) or is_columnar(path):
+        for university, group in group_by_university(iter_review_records(path, columns)):
+            yield university, (split_review_record(r)[1] for r in group)
+        return
+    for university_data in iter_university_data(path):
+        university = {k: v for k, v in university_data.items() if k != 'reviews'}
+        yield university, iter(university_data.get('reviews', []))
+
+
+def iter_aggregated_universities(path):
+    """
+    大学別に集約した口コミテキストを (大学名, テキストのリスト) として順に返す
+
+    JSON Linesの場合は {"university_name", "review"} の行を連続する大学ごとにまとめる
+    """
+    if is_jsonl(path):
+        for name, group in groupby(iter_jsonl(path), key=lambda r: r['university_name']):
+            yield name, [r['review'] for r in group]
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for uni in iter_json_array(f):
+            yield uni['university_name'], uni['reviews']
+
+
+def write_review_records(path, records):
+    """
+    口コミレコードを書き出し、書き出した件数を返す
+
+    JSON Linesの場合は1行ずつ書き出す。それ以外は従来の大学単位のJSONに
+    まとめ直してインデント付きで書き出す
+    """
+    if is_jsonl(path):
+        with JsonlWriter(path) as writer:
+            for record in records:
+                writer.write(record)
+        return writer.count
+
+    merged_data = []
+    count = 0
+    for university, group in group_by_university(records):
+        university['reviews'] = [split_review_record(r)[1] for r in group]
+        count += len(university['reviews'])
+        merged_data.append(university)
+    with atomic_open(path, 'w', encoding='utf-8') as f:
+        json.dump(merged_data, f, ensure_ascii=False, indent=2, default=encode_review)
+    return count
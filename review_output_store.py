@@ -0,0 +1,121 @@
+import json
+import sqlite3
+import threading
+import time
+
+from merge_reviews import review_key
+from review_record import compact_review, encode_review
+
+
+class ReviewOutputStore:
+    """
+    複数のワーカーが取得した口コミを書き込む共有の出力先（SQLite、スレッドセーフ・複数プロセスで共有可能）
+
+    口コミは (学校ID, 口コミID) を主キーとして登録し、同じ口コミを2回書き込んでも1件しか残らない。
+    作業キューはタスクを少なくとも1回配信する（停止したワーカーのタスクは再配信する）ため、
+    書き込みを冪等にすることで口コミIDごとにちょうど1回の出力になる
+    """
+
+    def __init__(self, path='crawl_output.sqlite3'):
+        """
+        Args:
+            path (str): 出力先のファイルパス（存在しない場合は新規作成）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS schools ('
+            ' school_id TEXT PRIMARY KEY,'
+            ' university_name TEXT NOT NULL,'
+            ' url TEXT NOT NULL,'
+            ' review_url TEXT NOT NULL,'
+            # 書き出す最大の口コミ数（0の場合は全件）
+            ' max_reviews INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS reviews ('
+            ' school_id TEXT NOT NULL,'
+            # 口コミIDがない口コミはmerge_reviews.pyと同じく投稿日と本文のハッシュ（sha1:...）をキーにする
+            # （新しい口コミの投稿でページ内の位置がずれても、再配信したページの口コミが重複しない）
+            ' review_key TEXT NOT NULL,'
+            ' page INTEGER NOT NULL,'
+            ' position INTEGER NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' PRIMARY KEY (school_id, review_key)) WITHOUT ROWID'
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add_school(self, school_id, university_name, url, review_url, max_reviews=0):
+        """大学の情報を登録する（登録済みの場合は更新する）"""
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO schools VALUES (?, ?, ?, ?, ?, ?)',
+                              (school_id, university_name, url, review_url, max_reviews, time.time()))
+            self.conn.commit()
+
+    def add_reviews(self, school_id, page, reviews):
+        """
+        1ページ分の口コミを登録する（登録済みの口コミIDは無視される）
+
+        Returns:
+            int: 新しく登録した口コミ数
+        """
+        rows = [
+            (school_id, review.get('review_id') or review_key(review), page, position,
+             json.dumps(review, ensure_ascii=False, default=encode_review))
+            for position, review in enumerate(reviews)
+        ]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def count(self):
+        """(大学数, 口コミ数) を返す"""
+        with self.lock:
+            schools = self.conn.execute('SELECT COUNT(*) FROM schools').fetchone()[0]
+            reviews = self.conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+        return schools, reviews
+
+    def iter_university_data(self):
+        """
+        大学ごとのデータを、scrape_reviews.pyの出力と同じ形式の辞書で返す（口コミはページ順に最大max_reviews件）
+
+        Yields:
+            dict: university_name, url, review_url, reviews（ReviewRecordのリスト）
+        """
+        with self.lock:
+            schools = self.conn.execute(
+                'SELECT school_id, university_name, url, review_url, max_reviews FROM schools'
+                ' ORDER BY university_name, school_id'
+            ).fetchall()
+        for school_id, university_name, url, review_url, max_reviews in schools:
+            with self.lock:
+                rows = self.conn.execute('SELECT data FROM reviews WHERE school_id = ? ORDER BY page, position LIMIT ?',
+                                         (school_id, max_reviews or -1)).fetchall()
+            yield {
+                'university_name': university_name,
+                'url': url,
+                'review_url': review_url,
+                'reviews': [compact_review(json.loads(data)) for data, in rows],
+            }
+
+    def clear(self):
+        """すべての大学と口コミを削除する"""
+        with self.lock:
+            self.conn.execute('DELETE FROM reviews')
+            self.conn.execute('DELETE FROM schools')
+            self.conn.commit()
@@ -0,0 +1,367 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import argparse
+
+from review_io import UNIVERSITY_FIELDS, iter_review_records
+from review_record import RATING_LABELS, RATING_SCORES
+from scrape_reviews import RATING_NAME_MAP
+
+# 評価項目（RATING_NAME_MAPのうち、本文・投稿日・IDと詳細テキスト以外）
+RATING_FIELDS = [
+    field for title, field in RATING_NAME_MAP.items()
+    if not title.endswith('_詳細') and field not in ('review_content', 'post_date', 'review_id')
+]
+
+# 集計でグループ化できる列
+GROUP_COLUMNS = {
+    'university': 'u.name',
+    'year': 'substr(r.post_date, 1, 4)',
+    'month': 'substr(r.post_date, 1, 7)',
+    **{field: f'r.{field}' for field in RATING_FIELDS},
+}
+
+# 条件式（例: career<=2、overall_rating=悪い）
+CONDITION_PATTERN = re.compile(r'^\s*([^<>=!\s]+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*$')
+
+# 条件式で使える項目と演算子
+CONDITION_FIELDS = {*RATING_FIELDS, 'negative_score', 'review_id', 'post_date'}
+CONDITION_OPERATORS = {'<=', '>=', '!=', '=', '<', '>'}
+
+# FTS5のtrigramトークナイザーで検索できる最短の語の長さ
+TRIGRAM_MIN_LENGTH = 3
+
+
+def rating_score(value):
+    """評価の文字列を数値に変換する（数値の文字列はそのまま数値にし、空や不明な値はNone）"""
+    if value is None or value == '':
+        return None
+    if value in RATING_SCORES:
+        return RATING_SCORES[value]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def review_text(record):
+    """全文検索の対象とするテキスト（本文と*_detailのフィールド、重複は除く）"""
+    texts = {}
+    for field, value in record.items():
+        if (field == 'review_content' or field.endswith('_detail')) and isinstance(value, str) and value.strip():
+            texts[value.strip()] = None
+    return '\n'.join(texts)
+
+
+def parse_condition(condition):
+    """
+    'career<=2' のような条件式を (列, 演算子, 値) に分ける
+
+    評価項目の値は数値（良い=3, 普通=2, 悪い=1）で比較する
+    """
+    match = CONDITION_PATTERN.match(condition)
+    if not match:
+        raise ValueError(f"条件式を解釈できません: {condition}")
+    field, op, value = match.groups()
+    if field in RATING_FIELDS:
+        score = rating_score(value)
+        if score is None:
+            raise ValueError(f"評価の値を解釈できません: {condition}（{'/'.join(RATING_SCORES)}または数値）")
+        return field, op, score
+    if field == 'negative_score':
+        return field, op, float(value)
+    if field in ('review_id', 'post_date'):
+        return field, op, value
+    raise ValueError(f"条件に使えない項目です: {field}（評価項目: {', '.join(RATING_FIELDS)}）")
+
+
+class ReviewStore:
+    """
+    マージした口コミをSQLiteに取り込み、大学・投稿日・口コミID・評価項目のインデックスと
+    本文の全文検索（FTS5）で絞り込み・集計するクエリ層
+
+    全文検索はtrigramトークナイザーを使うため、分かち書きなしで日本語の部分一致検索ができる
+    （FTS5が使えないSQLiteや2文字以下の語はLIKEで検索する）
+    """
+
+    def __init__(self, path='reviews.sqlite3'):
+        """
+        Args:
+            path (str): データベースファイルのパス（存在しない場合はbuildで作成する）
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def has_fts(self):
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'review_fts'").fetchone()
+        return row is not None
+
+    def build(self, input_file):
+        """
+        マージした口コミファイル（.json / .jsonl / .parquet / .arrow）からデータベースを作り直す
+
+        negative_scoreを含むファイル（add_negative_scores_to_reviews.pyの出力）の場合はスコアも取り込む
+
+        Returns:
+            int: 取り込んだ口コミ数
+        """
+        conn = self.conn
+        for table in ('review_fts', 'reviews', 'universities'):
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+        rating_columns = ''.join(f' {field} NUMERIC,' for field in RATING_FIELDS)
+        conn.execute(
+            'CREATE TABLE universities ('
+            ' id INTEGER PRIMARY KEY,'
+            ' name TEXT NOT NULL UNIQUE,'
+            ' url TEXT,'
+            ' review_url TEXT)'
+        )
+        conn.execute(
+            'CREATE TABLE reviews ('
+            ' id INTEGER PRIMARY KEY,'
+            ' university_id INTEGER NOT NULL REFERENCES universities(id),'
+            ' review_id TEXT,'
+            ' post_date TEXT,'
+            f'{rating_columns}'
+            ' negative_score REAL,'
+            ' text TEXT NOT NULL,'
+            ' data TEXT NOT NULL)'
+        )
+
+        universities = {}
+        count = 0
+        with conn:
+            for record in iter_review_records(input_file):
+                record = {k: v for k, v in record.items() if v is not None}
+                name = record.get('university_name', 'Unknown')
+                if name not in universities:
+                    cursor = conn.execute(
+                        'INSERT INTO universities (name, url, review_url) VALUES (?, ?, ?)',
+                        (name, record.get('url'), record.get('review_url')),
+                    )
+                    universities[name] = cursor.lastrowid
+                review = {k: v for k, v in record.items() if k not in UNIVERSITY_FIELDS}
+                conn.execute(
+                    f'INSERT INTO reviews (university_id, review_id, post_date, {", ".join(RATING_FIELDS)},'
+                    ' negative_score, text, data)'
+                    f' VALUES (?, ?, ?, {", ".join("?" * len(RATING_FIELDS))}, ?, ?, ?)',
+                    [
+                        universities[name], review.get('review_id'), review.get('post_date'),
+                        *(rating_score(review.get(field)) for field in RATING_FIELDS),
+                        review.get('negative_score'), review_text(review), json.dumps(review, ensure_ascii=False),
+                    ],
+                )
+                count += 1
+
+            # データを入れてからインデックスを作る方が速い
+            conn.execute('CREATE INDEX idx_reviews_university_date ON reviews (university_id, post_date)')
+            conn.execute('CREATE INDEX idx_reviews_post_date ON reviews (post_date)')
+            conn.execute('CREATE INDEX idx_reviews_review_id ON reviews (review_id)')
+            for field in RATING_FIELDS:
+                conn.execute(f'CREATE INDEX idx_reviews_{field} ON reviews ({field}, university_id)')
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE review_fts USING fts5(text, content='reviews', content_rowid='id',"
+                    " tokenize='trigram')"
+                )
+                conn.execute("INSERT INTO review_fts (review_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                print(f"FTS5（trigram）が使えないため、全文検索はLIKEで行います: {e}")
+        conn.execute('ANALYZE')
+        conn.commit()
+        return count
+
+    def _where(self, university=None, since=None, until=None, conditions=(), text=()):
+        """絞り込み条件からWHERE句とパラメーターを作る"""
+        clauses = []
+        params = []
+        if university:
+            clauses.append('u.name = ?')
+            params.append(university)
+        if since:
+            clauses.append('r.post_date >= ?')
+            params.append(since)
+        if until:
+            clauses.append('r.post_date <= ?')
+            params.append(until)
+        for condition in conditions:
+            field, op, value = parse_condition(condition) if isinstance(condition, str) else condition
+            if field not in CONDITION_FIELDS or op not in CONDITION_OPERATORS:
+                raise ValueError(f"条件に使えない項目・演算子です: {field} {op}")
+            clauses.append(f'r.{field} {op} ?')
+            params.append(value)
+        fts_terms = []
+        for term in text:
+            if self.has_fts and len(term) >= TRIGRAM_MIN_LENGTH:
+                fts_terms.append('"' + term.replace('"', '""') + '"')
+            else:
+                clauses.append("r.text LIKE ? ESCAPE '\\'")
+                params.append('%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if fts_terms:
+            clauses.append('r.id IN (SELECT rowid FROM review_fts WHERE review_fts MATCH ?)')
+            params.append(' AND '.join(fts_terms))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, university=None, since=None, until=None, conditions=(), text=(), limit=None, explain=False):
+        """
+        条件に合う口コミを返す
+
+        Args:
+            university (str): 大学名（完全一致）
+            since (str): この日付以降の投稿（YYYY-MM-DD、前方一致の比較なので'2024'も可）
+            until (str): この日付以前の投稿
+            conditions (list): 'career<=2' のような条件式、または (列, 演算子, 値) のリスト
+            text (list): 本文に含まれる語（すべてを含む口コミ）
+            limit (int): 最大件数
+            explain (bool): Trueの場合は結果の代わりにSQLiteの実行計画を返す
+
+        Returns:
+            list: 口コミのレコード（大学の情報を含むフラットな辞書）
+        """
+        where, params = self._where(university, since, until, conditions, text)
+        sql = ('SELECT u.name, u.url, u.review_url, r.data FROM reviews r JOIN universities u ON u.id = r.university_id'
+               f'{where} ORDER BY r.id')
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        if explain:
+            return [row['detail'] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        results = []
+        for row in self.conn.execute(sql, params):
+            record = {field: row[column] for field, column in zip(UNIVERSITY_FIELDS, ('name', 'url', 'review_url'))
+                      if row[column] is not None}
+            record.update(json.loads(row['data']))
+            results.append(record)
+        return results
+
+    def count(self, university=None, since=None, until=None, conditions=(), text=()):
+        """条件に合う口コミの件数を返す"""
+        where, params = self._where(university, since, until, conditions, text)
+        sql = f'SELECT COUNT(*) FROM reviews r JOIN universities u ON u.id = r.university_id{where}'
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def aggregate(self, group_by='university', average=(), university=None, since=None, until=None, conditions=(),
+                  text=(), explain=False):
+        """
+        条件に合う口コミをグループごとに集計する
+
+        Args:
+            group_by (str): 'university' / 'year' / 'month' / 評価項目名
+            average (list): 平均を求める列（評価項目名またはnegative_score）
+            その他の引数はqueryと同じ
+
+        Returns:
+            list: {group, count, avg_<列>} の辞書のリスト（件数の多い順）
+        """
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"集計できない項目です: {group_by}（{', '.join(GROUP_COLUMNS)}）")
+        for field in average:
+            if field not in RATING_FIELDS and field != 'negative_score':
+                raise ValueError(f"平均を求められない項目です: {field}")
+        where, params = self._where(university, since, until, conditions, text)
+        averages = ''.join(f', AVG(r.{field}) AS avg_{field}' for field in average)
+        sql = (f'SELECT {GROUP_COLUMNS[group_by]} AS grp, COUNT(*) AS count{averages}'
+               f' FROM reviews r JOIN universities u ON u.id = r.university_id{where}'
+               ' GROUP BY grp ORDER BY count DESC, grp')
+        if explain:
+            return [row['detail'] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        labels = RATING_LABELS if group_by in RATING_FIELDS else {}
+        return [{'group': labels.get(row['grp'], row['grp']), 'count': row['count'], **{f'avg_{f}': row[f'avg_{f}'] for f in average}}
+                for row in self.conn.execute(sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='マージした口コミの検索・集計')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='マージした口コミファイルからデータベースを作る')
+    build_parser.add_argument('--input', '-i', default='merged_reviews.json',
+                              help='マージした口コミファイル（.json / .jsonl / .parquet、スコア付きも可）')
+
+    def add_filters(p):
+        p.add_argument('--university', '-u', type=str, help='大学名（完全一致）')
+        p.add_argument('--since', type=str, help='この日付以降の投稿（例: 2024-01-01）')
+        p.add_argument('--until', type=str, help='この日付以前の投稿')
+        p.add_argument('--where', '-w', action='append', default=[], metavar='CONDITION',
+                       help=f"条件式（例: 'career<=2'、'overall_rating=悪い'）。評価は{'/'.join(f'{k}={v}' for k, v in RATING_SCORES.items())}で比較する")
+        p.add_argument('--text', '-t', action='append', default=[], help='本文に含まれる語（複数指定はAND）')
+        p.add_argument('--explain', action='store_true', help='結果の代わりにSQLiteの実行計画を表示する')
+
+    query_parser = subparsers.add_parser('query', help='条件に合う口コミをJSON Linesで出力する')
+    add_filters(query_parser)
+    query_parser.add_argument('--limit', '-n', type=int, help='最大件数')
+    query_parser.add_argument('--fields', nargs='+', help='出力する項目（省略時はすべて）')
+    query_parser.add_argument('--count', action='store_true', help='件数だけを表示する')
+
+    aggregate_parser = subparsers.add_parser('aggregate', help='条件に合う口コミをグループごとに集計する')
+    add_filters(aggregate_parser)
+    aggregate_parser.add_argument('--group-by', '-g', default='university', choices=list(GROUP_COLUMNS),
+                                  help='グループ化する項目（デフォルト: university）')
+    aggregate_parser.add_argument('--avg', nargs='+', default=[], help='平均を求める項目（評価項目名またはnegative_score）')
+
+    for p in (build_parser, query_parser, aggregate_parser):
+        p.add_argument('--db', default='reviews.sqlite3', help='データベースファイル（デフォルト: reviews.sqlite3）')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.input != '-' and not os.path.exists(args.input):
+            print(f"エラー: 入力ファイルが見つかりません: {args.input}")
+            sys.exit(1)
+        start = time.perf_counter()
+        with ReviewStore(args.db) as store:
+            count = store.build(args.input)
+        print(f"{count}件の口コミを {args.db} に取り込みました（{time.perf_counter() - start:.2f}秒）")
+        return
+
+    if not os.path.exists(args.db):
+        print(f"エラー: データベースが見つかりません: {args.db}（先に build を実行してください）")
+        sys.exit(1)
+
+    filters = dict(university=args.university, since=args.since, until=args.until, conditions=args.where,
+                   text=args.text, explain=args.explain)
+    start = time.perf_counter()
+    with ReviewStore(args.db) as store:
+        try:
+            if args.command == 'query' and args.count and not args.explain:
+                filters.pop('explain')
+                results = store.count(**filters)
+            elif args.command == 'query':
+                results = store.query(limit=args.limit, **filters)
+            else:
+                results = store.aggregate(args.group_by, args.avg, **filters)
+        except (ValueError, sqlite3.OperationalError) as e:
+            print(f"エラー: {e}")
+            sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    if args.explain:
+        for detail in results:
+            print(detail)
+        return
+    if isinstance(results, int):
+        print(results)
+        print(f"{elapsed * 1000:.1f}ms", file=sys.stderr)
+        return
+    for record in results:
+        if args.command == 'query' and args.fields:
+            record = {field: record.get(field) for field in args.fields}
+        print(json.dumps(record, ensure_ascii=False))
+    print(f"{len(results)}件（{elapsed * 1000:.1f}ms）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
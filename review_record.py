@@ -0,0 +1,266 @@
+import json
+import sys
+import threading
+from collections.abc import MutableMapping
+
+# 評価の文字列と数値（数値が大きいほど良い）
+RATING_SCORES = {'悪い': 1, '普通': 2, '良い': 3}
+RATING_LABELS = {score: label for label, score in RATING_SCORES.items()}
+
+
+def is_rating_field(name):
+    """評価（良い・普通・悪い）を値に持ちうるフィールドかどうか（本文のフィールドは除く）"""
+    return not name.endswith('_detail') and name != 'review_content'
+
+
+class Layout:
+    """
+    口コミのフィールド名の並びと、評価を数値に変換した位置
+
+    同じ並びの口コミ（ほとんどの口コミは数種類の並びに収まる）で1つのオブジェクトを共有し、
+    フィールド名はsys.internした文字列を使う
+    """
+
+    __slots__ = ('fields', 'index', 'rating_mask', 'transitions')
+
+    def __init__(self, fields, rating_mask):
+        self.fields = fields
+        self.index = {name: i for i, name in enumerate(fields)}
+        self.rating_mask = rating_mask
+        # フィールドを追加・変更したときの移り先（(フィールド名, 数値に変換したかどうか) -> Layout）
+        self.transitions = {}
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def get_layout(fields, rating_mask=0):
+    """フィールド名の並びと評価の位置に対応する共有のLayoutを返す"""
+    key = (fields, rating_mask)
+    layout = _layouts.get(key)
+    if layout is None:
+        with _layouts_lock:
+            layout = _layouts.get(key)
+            if layout is None:
+                layout = Layout(tuple(sys.intern(name) for name in fields), rating_mask)
+                _layouts[key] = layout
+    return layout
+
+
+class UniversityTable:
+    """
+    大学の情報（university_name, url, review_url）の辞書を、同じ内容ごとに1つにまとめる表
+
+    フラットなレコード（1行1口コミ）では大学の情報を口コミごとに複製せず、この表の辞書を共有する。
+    表は読み込み・マージの呼び出しごとに作り、呼び出しが終われば（レコードが参照していない辞書は）解放される
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def intern(self, university):
+        """大学の情報（辞書）と同じ内容の共有の辞書を返す"""
+        key = tuple(university.items())
+        row = self.rows.get(key)
+        if row is None:
+            with self.lock:
+                row = self.rows.setdefault(key, dict(university))
+        return row
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ReviewRecord(MutableMapping):
+    """
+    口コミ1件のコンパクトな表現
+
+    フィールド名の並びは共有のLayout、値はタプルで持ち、評価（良い・普通・悪い）は1〜3の数値に変換する。
+    フラットなレコードの大学の情報は、UniversityTableで共有した辞書（university）として持つ。
+    辞書と同じように読み書きでき、to_dict()で元のJSONと同じキーの順序・値の辞書に戻せる
+    """
+
+    __slots__ = ('layout', 'values', 'university')
+
+    def __init__(self, layout, values, university=None):
+        self.layout = layout
+        self.values = values
+        self.university = university
+
+    @classmethod
+    def from_pairs(cls, pairs, university=None):
+        """
+        (フィールド名, 値) の並びから作る
+
+        Args:
+            pairs (iterable): 口コミのフィールド名と値
+            university (dict): 大学の情報（フラットなレコードの場合。変更せずに共有する）
+        """
+        names, values = tuple(zip(*pairs)) or ((), ())
+        rating_mask = 0
+        try:
+            # 同じ文字列の値（review_contentとoverall_rating_detailなど）を1つのオブジェクトにまとめる
+            canonical = dict(zip(values, values))
+            values = list(map(canonical.__getitem__, values))
+            scores = list(map(RATING_SCORES.get, values))
+        except TypeError:
+            # 値に辞書・リストが含まれる場合（通常の口コミにはない）はそのまま持つ
+            values = list(values)
+            scores = [RATING_SCORES.get(v) if v.__class__ is str else None for v in values]
+        for i, score in enumerate(scores):
+            if score is not None and values[i].__class__ is str and is_rating_field(names[i]):
+                values[i] = score
+                rating_mask |= 1 << i
+        layout = get_layout(names, rating_mask)
+        if len(layout.index) != len(names):
+            # 同じキーが重複している場合は辞書と同じく最初の位置・最後の値にまとめる
+            return cls.from_pairs(dict(zip(names, cls._decode_all(values, rating_mask))).items(), university)
+        return cls(layout, tuple(values), university)
+
+    @staticmethod
+    def _decode_all(values, rating_mask):
+        if not rating_mask:
+            return values
+        return [RATING_LABELS[v] if rating_mask >> i & 1 else v for i, v in enumerate(values)]
+
+    def _university_fields(self):
+        return self.university if self.university is not None else {}
+
+    def __getitem__(self, key):
+        i = self.layout.index.get(key)
+        if i is None:
+            return self._university_fields()[key]
+        value = self.values[i]
+        return RATING_LABELS[value] if self.layout.rating_mask >> i & 1 else value
+
+    def get(self, key, default=None):
+        i = self.layout.index.get(key)
+        if i is None:
+            return self._university_fields().get(key, default)
+        value = self.values[i]
+        return RATING_LABELS[value] if self.layout.rating_mask >> i & 1 else value
+
+    def __contains__(self, key):
+        return key in self.layout.index or key in self._university_fields()
+
+    def __iter__(self):
+        yield from self._university_fields()
+        yield from self.layout.fields
+
+    def __len__(self):
+        return len(self._university_fields()) + len(self.values)
+
+    def __setitem__(self, key, value):
+        if key not in self.layout.index and key in self._university_fields():
+            # 共有の辞書は変更せず、この口コミだけの辞書に置き換える
+            self.university = {**self._university_fields(), key: value}
+            return
+        encoded = value.__class__ is str and is_rating_field(key) and value in RATING_SCORES
+        stored = RATING_SCORES[value] if encoded else value
+        transition = (key, encoded)
+        layout = self.layout.transitions.get(transition)
+        if layout is None:
+            i = self.layout.index.get(key)
+            if i is None:
+                fields = self.layout.fields + (key,)
+                i = len(self.layout.fields)
+            else:
+                fields = self.layout.fields
+            rating_mask = self.layout.rating_mask & ~(1 << i) | (int(encoded) << i)
+            layout = get_layout(fields, rating_mask)
+            self.layout.transitions[transition] = layout
+        i = layout.index[key]
+        if i < len(self.values):
+            self.values = self.values[:i] + (stored,) + self.values[i + 1:]
+        else:
+            self.values = self.values + (stored,)
+        self.layout = layout
+
+    def __delitem__(self, key):
+        if key not in self.layout.index:
+            university = dict(self._university_fields())
+            del university[key]
+            self.university = university
+            return
+        i = self.layout.index[key]
+        fields = self.layout.fields[:i] + self.layout.fields[i + 1:]
+        mask = self.layout.rating_mask
+        rating_mask = (mask & ((1 << i) - 1)) | (mask >> (i + 1) << i)
+        self.layout = get_layout(fields, rating_mask)
+        self.values = self.values[:i] + self.values[i + 1:]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.to_dict()!r})'
+
+    def __reduce__(self):
+        return compact_review, (self.to_dict(),)
+
+    def review_items(self):
+        """大学の情報を除いた (フィールド名, 値) のリストを返す"""
+        return list(zip(self.layout.fields, self._decode_all(self.values, self.layout.rating_mask)))
+
+    def to_dict(self):
+        """元のJSONと同じキーの順序・値の辞書を返す"""
+        record = dict(self._university_fields())
+        record.update(self.review_items())
+        return record
+
+    def ratings(self):
+        """評価を数値に変換したフィールドを {フィールド名: 1〜3} として返す"""
+        mask = self.layout.rating_mask
+        return {name: value for i, (name, value) in enumerate(zip(self.layout.fields, self.values)) if mask >> i & 1}
+
+    def with_university(self, university):
+        """大学の情報（辞書）を付けたフラットなレコードを返す（値と大学の情報の辞書は共有する）"""
+        return ReviewRecord(self.layout, self.values, university)
+
+    def without_university(self):
+        """大学の情報を除いた口コミを返す（値は共有する）"""
+        return ReviewRecord(self.layout, self.values)
+
+
+def compact_review(review, university=None):
+    """
+    口コミ（辞書）をReviewRecordに変換する
+
+    Args:
+        review (dict): 口コミ（ReviewRecordの場合はそのまま返す）
+        university (dict): フラットなレコードにする場合の大学の情報（変更せずに共有する）
+    """
+    if isinstance(review, ReviewRecord):
+        return review.with_university(university) if university is not None else review
+    return ReviewRecord.from_pairs(review.items(), university)
+
+
+def review_object_hook(pairs):
+    """
+    json.loadのobject_pairs_hookとして、reviewsキーの配列にある口コミのオブジェクトをReviewRecordで読み込む
+
+    それ以外のオブジェクト（大学データや口コミの中の入れ子のオブジェクトなど）は通常の辞書のままにする。
+    口コミは大学データ1件の解析が終わった時点で変換する
+    """
+    data = dict(pairs)
+    reviews = data.get('reviews')
+    if isinstance(reviews, list):
+        data['reviews'] = [
+            ReviewRecord.from_pairs(review.items()) if review.__class__ is dict else review for review in reviews
+        ]
+    return data
+
+
+def load_reviews(file):
+    """
+    大学単位のJSON（merged_reviews.json形式・スクレイピング結果）を、口コミをReviewRecordとして読み込む
+
+    口コミは大学データ1件ごとに変換されるため、すべての口コミを辞書として持つことはない
+    """
+    return json.load(file, object_pairs_hook=review_object_hook)
+
+
+def encode_review(obj):
+    """json.dump / json.dumpsのdefaultとして、ReviewRecordを辞書に戻して書き出す"""
+    if isinstance(obj, ReviewRecord):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
@@ -1,12 +1,55 @@
-import requests
 from bs4 import BeautifulSoup
 import json
 import csv
 import time
 import os
 import random
+import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import urljoin, urlparse
+
+from http_cache import HttpCache
+from http_client import DEFAULT_TIMEOUT, FetchStats, create_session, fetch
+from atomic_io import atomic_write_json
+from crawl_frontier import INDEX, INDEX_PRIORITY, SCHOOL, SCHOOL_PRIORITY, CrawlFrontier
+from crawl_journal import CrawlJournal
+from metrics import add_metrics_arguments, configure_metrics, metrics
+from rate_limiter import AdaptiveRateLimiter, RateLimiter
+from review_index import ReviewIndex
+from review_record import compact_review, encode_review
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
+]
+
+# 探索モードで辿るリンク（大学ページと大学一覧ページ）のパス
+SCHOOL_LINK_PATTERN = re.compile(r'^/university/school/(\d+)/?$')
+INDEX_LINK_PATTERN = re.compile(r'^/university/search/')
+
+# 探索モードの起点（大学一覧ページ）
+DEFAULT_DISCOVERY_SEED = 'https://www.minkou.jp/university/search/'
+
+def request_headers():
+    """リクエストヘッダー（User-Agentはリストからランダムに選ぶ）"""
+    return {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8',
+        'Referer': 'https://www.minkou.jp/university/'
+    }
+
+def make_soup(html_content):
+    """利用可能な最速のパーサー（lxml、なければhtml.parser）でHTMLを解析する"""
+    return BeautifulSoup(html_content, HTML_PARSER)
 
 def load_urls(file_path):
     """URLリストをJSONファイルから読み込む"""
@@ -67,10 +110,8 @@ def extract_json_reviews(html_content):
     return reviews
 
 def extract_review_ratings(html_content):
-    """HTMLから評価項目を抽出する"""
-    from bs4 import BeautifulSoup
-    
-    soup = BeautifulSoup(html_content, 'html.parser')
+    """HTML（または解析済みのBeautifulSoup）から評価項目を抽出する"""
+    soup = html_content if isinstance(html_content, BeautifulSoup) else make_soup(html_content)
     
     review_list = soup.select_one('.mod-reviewList')
     if not review_list:
@@ -134,42 +175,135 @@ def process_rating_items(rating_items, review_data):
             if title == '総合評価':
                 review_data['review_content'] = txt
 
-def scrape_reviews(url, max_reviews=20):
-    """指定されたURLから口コミ情報をスクレイピングする"""
-    print(f"スクレイピング中: {url}")
-    print(f"最大取得件数: {max_reviews}件")
+def extract_school_id(url):
+    """大学ページのURLから学校IDを取り出す"""
+    return url.rstrip('/').split('/')[-1]
+
+def build_review_base_url(url):
+    """大学ページのURLから口コミ一覧ページのURLを組み立てる"""
+    parsed = urlparse(url)
+    school_id = extract_school_id(url)
+    return f"{parsed.scheme}://{parsed.netloc}/university/school/review/{school_id}/"
+
+def extract_fallback_reviews(soup):
+    """標準的な構造が見つからない場合に、汎用的なセレクタで口コミを抽出する"""
+    page_reviews = []
     
-    user_agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
-    ]
+    review_elements = soup.select('.reviewBox, .mod-reviewBox, .mod-review, .review')
     
-    headers = {
-        'User-Agent': random.choice(user_agents),
-        'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8',
-        'Referer': 'https://www.minkou.jp/university/'
-    }
+    if not review_elements:
+        print(f"警告: 口コミ要素が見つかりませんでした。別のセレクタを試します。")
+        review_elements = soup.select('[class*="review"]')
     
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+    for review_elem in review_elements:
+        review_data = {}
+        poster_info = review_elem.select_one('.reviewerInforamtion, .reviewerInformation, .mod-reviewerInfo')
+        if poster_info:
+            date_elem = poster_info.select_one('.date')
+            review_data['post_date'] = date_elem.text.strip() if date_elem else "不明"
+            
+            poster_attrs = poster_info.select('.reviewerAttribute, .mod-reviewerAttribute')
+            for attr in poster_attrs:
+                attr_text = attr.text.strip()
+                if '：' in attr_text:
+                    key, value = attr_text.split('：', 1)
+                    key_eng = RATING_NAME_MAP.get(key.strip(), key.strip())
+                    review_data[key_eng] = value.strip()
         
-        title = soup.title.text if soup.title else ""
-        university_name = extract_university_name(title)
+        review_text = review_elem.select_one('.reviewText, .mod-reviewText')
+        if review_text:
+            review_data['review_content'] = review_text.text.strip()
         
-        school_id = url.rstrip('/').split('/')[-1]
-        base_review_url = f"https://www.minkou.jp/university/school/review/{school_id}/"
+        ratings = review_elem.select('.ratingItem, .mod-ratingItem')
+        for rating in ratings:
+            rating_name = rating.select_one('.ratingName, .mod-ratingName')
+            rating_value = rating.select_one('.ratingValue, .mod-ratingValue')
+            if rating_name and rating_value:
+                key = rating_name.text.strip()
+                key_eng = RATING_NAME_MAP.get(key, key)
+                review_data[key_eng] = rating_value.text.strip()
         
-        all_reviews = []
+        if review_data:
+            page_reviews.append(review_data)
+    
+    return page_reviews
+
+def parse_review_page(html_content):
+    """
+    口コミ一覧ページを1回だけ解析し、口コミ・評価項目・次ページの有無をまとめて返す
+
+    Returns:
+        dict: reviews（口コミのリスト）、source（'html'/'json'/'fallback'）、
+              has_next（次のページへのリンクがあるかどうか）
+    """
+    soup = make_soup(html_content)
+    has_next = soup.select_one('li.next a') is not None
+    
+    reviews = extract_review_ratings(soup)
+    if reviews:
+        return {'reviews': reviews, 'source': 'html', 'has_next': has_next}
+    
+    reviews = extract_json_reviews(html_content)
+    if reviews:
+        return {'reviews': reviews, 'source': 'json', 'has_next': has_next}
+    
+    print("標準的な方法で口コミデータが見つかりませんでした。別の方法で抽出を試みます。")
+    return {'reviews': extract_fallback_reviews(soup), 'source': 'fallback', 'has_next': has_next}
+
+def scrape_reviews(url, max_reviews=20, rate_limiter=None, session=None, stats=None, review_index=None, cache=None,
+                   journal=None):
+    """
+    指定されたURLから口コミ情報をスクレイピングする
+
+    rate_limiterを指定した場合は固定の待機時間の代わりに、
+    各リクエストの前にレート制限器からの許可を待つ。
+    sessionを省略した場合は再試行付きのセッションをこの呼び出し専用に生成する。
+    review_indexを指定した場合は未取得の口コミだけを返し、
+    ページ内の口コミがすべて取得済みになった時点でページングを打ち切る。
+    cacheを指定した場合はレスポンスキャッシュを経由して取得する。
+    journalを指定した場合は取得したページを逐次記録し、記録済みのページがあればその続きから再開する
+    """
+    print(f"スクレイピング中: {url}")
+    print(f"最大取得件数: {f'{max_reviews}件' if max_reviews else '制限なし'}")
+    
+    headers = request_headers()
+    
+    if session is None:
+        session = create_session()
+    
+    school_id = extract_school_id(url)
+    university_name = None
+    all_reviews = []
+    page = 1
+    has_next = True
+    
+    resumed_pages = journal.load_pages(school_id) if journal is not None else []
+    if resumed_pages:
+        university_name = resumed_pages[-1]['university_name']
+        for record in resumed_pages:
+            all_reviews.extend(compact_review(r) for r in record['reviews'])
+        page = resumed_pages[-1]['page'] + 1
+        has_next = resumed_pages[-1]['has_next']
+        print(f"中断したクロールを再開します: {len(resumed_pages)}ページ取得済み（{len(all_reviews)}件）")
+    
+    try:
+        if university_name is None:
+            with metrics.stage('fetch', url=url):
+                response = fetch(session, url, headers=headers, stats=stats, rate_limiter=rate_limiter, cache=cache)
+            response.raise_for_status()
+            
+            with metrics.stage('parse'):
+                soup = make_soup(response.text)
+            
+            title = soup.title.text if soup.title else ""
+            university_name = extract_university_name(title)
         
-        page = 1
+        base_review_url = build_review_base_url(url)
         
-        max_pages = (max_reviews + 9) // 10
+        # max_reviewsが0の場合は最後のページまで取得する
+        max_pages = (max_reviews + 9) // 10 if max_reviews else None
         
-        while len(all_reviews) < max_reviews and page <= max_pages:
+        while has_next and (not max_reviews or len(all_reviews) < max_reviews) and (max_pages is None or page <= max_pages):
             if page == 1:
                 review_url = base_review_url
             else:
@@ -177,104 +311,302 @@ def scrape_reviews(url, max_reviews=20):
             
             print(f"口コミページ {page} にアクセス中: {review_url}")
             
-            review_response = requests.get(review_url, headers=headers)
+            with metrics.stage('fetch', url=review_url):
+                review_response = fetch(session, review_url, headers=headers, stats=stats, rate_limiter=rate_limiter,
+                                        cache=cache)
             review_response.raise_for_status()
             
             html_content = review_response.text
             
-            reviews_json = extract_json_reviews(html_content)
-            reviews_html = extract_review_ratings(html_content)
-            page_reviews = []
+            with metrics.stage('parse'):
+                parsed_page = parse_review_page(html_content)
+            # 取得した口コミはReviewRecord（コンパクトな表現）で保持する
+            page_reviews = [compact_review(r) for r in parsed_page['reviews']]
+            metrics.inc('pages_total')
             
-            if reviews_html:
-                page_reviews = reviews_html
+            if parsed_page['source'] == 'html':
                 print(f"HTMLから{len(page_reviews)}件の口コミと評価項目を取得しました")
-            elif reviews_json:
-                page_reviews = reviews_json
+            elif parsed_page['source'] == 'json':
                 print(f"JSONから{len(page_reviews)}件の口コミを取得しました")
-            else:
-                print("標準的な方法で口コミデータが見つかりませんでした。別の方法で抽出を試みます。")
-                review_soup = BeautifulSoup(html_content, 'html.parser')
-                
-                review_elements = review_soup.select('.reviewBox, .mod-reviewBox, .mod-review, .review')
-                
-                if not review_elements:
-                    print(f"警告: 口コミ要素が見つかりませんでした。別のセレクタを試します。")
-                    review_elements = review_soup.select('[class*="review"]')
-                
-                for review_elem in review_elements:
-                    review_data = {}
-                    poster_info = review_elem.select_one('.reviewerInforamtion, .reviewerInformation, .mod-reviewerInfo')
-                    if poster_info:
-                        date_elem = poster_info.select_one('.date')
-                        review_data['post_date'] = date_elem.text.strip() if date_elem else "不明"
-                        
-                        poster_attrs = poster_info.select('.reviewerAttribute, .mod-reviewerAttribute')
-                        for attr in poster_attrs:
-                            attr_text = attr.text.strip()
-                            if '：' in attr_text:
-                                key, value = attr_text.split('：', 1)
-                                key_eng = RATING_NAME_MAP.get(key.strip(), key.strip())
-                                review_data[key_eng] = value.strip()
-                    
-                    review_text = review_elem.select_one('.reviewText, .mod-reviewText')
-                    if review_text:
-                        review_data['review_content'] = review_text.text.strip()
-                    
-                    ratings = review_elem.select('.ratingItem, .mod-ratingItem')
-                    for rating in ratings:
-                        rating_name = rating.select_one('.ratingName, .mod-ratingName')
-                        rating_value = rating.select_one('.ratingValue, .mod-ratingValue')
-                        if rating_name and rating_value:
-                            key = rating_name.text.strip()
-                            key_eng = RATING_NAME_MAP.get(key, key)
-                            review_data[key_eng] = rating_value.text.strip()
-                    
-                    if review_data:
-                        page_reviews.append(review_data)
             
             if not page_reviews:
                 print(f"警告: 口コミが見つかりませんでした: {review_url}")
                 print(f"ページ構造の一部: {html_content[:500]}...")
                 break
             
+            if review_index is not None:
+                known_ids = review_index.known_ids(school_id, [r.get('review_id') for r in page_reviews])
+                new_reviews = [r for r in page_reviews if r.get('review_id') not in known_ids]
+                if known_ids:
+                    print(f"取得済みの口コミ{len(known_ids)}件をスキップしました")
+                if not new_reviews:
+                    print("このページの口コミはすべて取得済みです。スクレイピングを終了します。")
+                    if journal is not None:
+                        journal.record_page(school_id, page, university_name, [], False)
+                    break
+                page_reviews = new_reviews
+            
+            if journal is not None:
+                journal.record_page(school_id, page, university_name, page_reviews, parsed_page['has_next'])
+            
             all_reviews.extend(page_reviews)
             print(f"現在の取得件数: {len(all_reviews)}件")
             
-            next_page_link = BeautifulSoup(html_content, 'html.parser').select_one('li.next a')
-            if not next_page_link:
+            if not parsed_page['has_next']:
                 print("次のページが見つかりません。スクレイピングを終了します。")
                 break
             
-            if len(all_reviews) >= max_reviews:
+            if max_reviews and len(all_reviews) >= max_reviews:
                 print(f"最大取得件数({max_reviews}件)に達しました。")
-                all_reviews = all_reviews[:max_reviews]
                 break
             
             page += 1
             
-            delay = 1 + random.uniform(0, 1)
-            print(f"{delay:.2f}秒待機中...")
-            time.sleep(delay)
+            # キャッシュから返したページではサーバーに負荷をかけていないため待機しない
+            if not rate_limiter and not getattr(review_response, 'from_cache', False):
+                delay = 1 + random.uniform(0, 1)
+                print(f"{delay:.2f}秒待機中...")
+                time.sleep(delay)
         
+        all_reviews = all_reviews[:max_reviews or None]
         print(f"合計{len(all_reviews)}件の口コミを取得しました")
         
-        return {
+        university_data = {
             'university_name': university_name,
             'url': url,
             'review_url': base_review_url,
             'reviews': all_reviews
         }
+        if review_index is not None:
+            university_data['incremental'] = True
+        return university_data
         
     except Exception as e:
         print(f"エラーが発生しました: {url} - {str(e)}")
+        if all_reviews:
+            # 途中のページで失敗した場合は、それまでに取得した口コミを残す
+            print(f"取得済みの{len(all_reviews)}件の口コミは保持します")
         return {
-            'university_name': url.split('/')[-2] if url.endswith('/') else url.split('/')[-1],
+            'university_name': university_name or (url.split('/')[-2] if url.endswith('/') else url.split('/')[-1]),
             'url': url,
-            'reviews': [],
+            'reviews': all_reviews[:max_reviews or None],
             'error': str(e)
         }
 
+def crawl_concurrently(urls, workers, **scrape_options):
+    """
+    複数の大学を並行してスクレイピングする
+
+    Args:
+        urls (list): 大学ページのURLリスト
+        workers (int): 同時に処理する大学数
+        **scrape_options: scrape_reviewsにそのまま渡す引数
+            （max_reviews, rate_limiter, session, stats など）
+
+    Yields:
+        dict: 処理が完了した順の大学データ（完了した大学から順に保存できるよう逐次返す）
+    """
+    if scrape_options.get('session') is None:
+        scrape_options['session'] = create_session(pool_size=workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scrape_reviews, url, **scrape_options) for url in urls}
+        while futures:
+            future = next(as_completed(futures))
+            futures.remove(future)
+            yield future.result()
+
+def extract_discovery_links(html_content, page_url):
+    """
+    大学一覧ページから、同じホストの大学ページと大学一覧ページ（ページング・地域別など）のリンクを取り出す
+
+    Returns:
+        tuple: (学校ID -> 大学ページのURL, 一覧ページのURLのリスト)
+    """
+    soup = make_soup(html_content)
+    host = urlparse(page_url).netloc
+    school_urls = {}
+    index_urls = {}
+    for a in soup.find_all('a', href=True):
+        link = urlparse(urljoin(page_url, a['href']))
+        if link.netloc != host:
+            continue
+        match = SCHOOL_LINK_PATTERN.match(link.path)
+        if match:
+            school_id = match.group(1)
+            school_urls.setdefault(school_id, f"{link.scheme}://{link.netloc}/university/school/{school_id}/")
+        elif INDEX_LINK_PATTERN.match(link.path):
+            index_urls[link._replace(fragment='').geturl()] = None
+    return school_urls, list(index_urls)
+
+def discover_schools(entry, frontier, session=None, stats=None, rate_limiter=None, cache=None):
+    """
+    大学一覧ページを取得し、見つけた大学ページと一覧ページをフロンティアに追加する
+
+    Args:
+        entry (FrontierEntry): 一覧ページ
+        frontier (CrawlFrontier): URLフロンティア
+
+    Returns:
+        tuple: (新しく追加した大学数, 新しく追加した一覧ページ数)
+    """
+    with metrics.stage('fetch', url=entry.url):
+        response = fetch(session, entry.url, headers=request_headers(), stats=stats, rate_limiter=rate_limiter,
+                         cache=cache)
+    response.raise_for_status()
+    with metrics.stage('parse'):
+        school_urls, index_urls = extract_discovery_links(response.text, entry.url)
+    metrics.inc('index_pages_total')
+    depth = entry.depth + 1
+    new_schools = frontier.add_many(
+        (f'school:{school_id}', url, SCHOOL, SCHOOL_PRIORITY, depth) for school_id, url in school_urls.items()
+    )
+    new_index_pages = frontier.add_many((f'index:{url}', url, INDEX, INDEX_PRIORITY, depth) for url in index_urls)
+    return new_schools, new_index_pages
+
+def crawl_frontier(frontier, workers=1, max_schools=0, delay=None, **scrape_options):
+    """
+    フロンティアから優先度順にURLを取り出し、一覧ページからは大学を探し、大学ページからは口コミを取得する
+
+    同時に処理するURLはworkers件までで、空きができるたびに次のURLを取り出すため、
+    フロンティアの大きさにかかわらずメモリ使用量は一定に保たれる
+
+    Args:
+        frontier (CrawlFrontier): URLフロンティア
+        workers (int): 同時に処理するURL数
+        max_schools (int): この実行で取得する最大の大学数（0の場合は制限なし）
+        delay (float): workersが1の場合のURLごとの待機時間（秒、Noneの場合は待機しない）
+        **scrape_options: scrape_reviewsにそのまま渡す引数
+
+    Yields:
+        tuple: (FrontierEntry, 結果)。結果は一覧ページでは (新しい大学数, 新しい一覧ページ数)、
+               大学ページでは大学データ、一覧ページの取得に失敗した場合は例外
+    """
+    if scrape_options.get('session') is None:
+        scrape_options['session'] = create_session(pool_size=workers)
+    fetch_options = {key: scrape_options.get(key) for key in ('session', 'stats', 'rate_limiter', 'cache')}
+    started_schools = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        while True:
+            while len(futures) < workers:
+                entries = frontier.claim()
+                if not entries:
+                    break
+                entry = entries[0]
+                if entry.kind == SCHOOL:
+                    if max_schools and started_schools >= max_schools:
+                        frontier.release(entry.id)
+                        break
+                    started_schools += 1
+                    futures[executor.submit(scrape_reviews, entry.url, **scrape_options)] = entry
+                else:
+                    futures[executor.submit(discover_schools, entry, frontier, **fetch_options)] = entry
+            if not futures:
+                # 取り出せるURLがなく、処理中のURLもない（他の一覧ページから新しいURLが増えることもない）
+                break
+            future = next(as_completed(futures))
+            entry = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield entry, result
+            if workers == 1 and delay is not None:
+                wait = delay + random.uniform(0, 2)
+                print(f"{wait:.2f}秒待機中...")
+                time.sleep(wait)
+
+def run_discovery(args, frontier, scrape_options, save):
+    """
+    探索モードでクロールする
+
+    Args:
+        args: コマンドライン引数
+        frontier (CrawlFrontier): URLフロンティア
+        scrape_options (dict): crawl_frontierにそのまま渡す引数
+        save (callable): 大学データを保存し、正常に取得できたかどうかを返す関数
+
+    Returns:
+        int: 再試行の上限に達して失敗したURL数
+    """
+    seeds = args.discover or [DEFAULT_DISCOVERY_SEED]
+    added = frontier.add_many((f'index:{url}', url, INDEX, INDEX_PRIORITY, 0) for url in seeds)
+    if args.urls:
+        # URLリストを指定した場合は、その大学も探索した大学と一緒に取得する
+        added += frontier.add_many(
+            (f'school:{extract_school_id(url)}', url, SCHOOL, SCHOOL_PRIORITY, 0) for url in load_urls(args.urls)
+        )
+    print(f"探索モード: フロンティア {args.frontier}（新しく追加 {added}件）")
+    print_frontier_counts(frontier)
+
+    failed = 0
+    for entry, result in crawl_frontier(frontier, args.workers, args.max_schools, **scrape_options):
+        if entry.kind == INDEX:
+            if isinstance(result, Exception):
+                retry = frontier.fail(entry.id, result, args.max_attempts)
+                failed += not retry
+                print(f"一覧ページの取得に失敗しました: {entry.url} - {result}{'（後で再試行します）' if retry else ''}")
+                continue
+            frontier.complete(entry.id)
+            print(f"一覧ページ {entry.url}: 新しい大学 {result[0]}校, 新しい一覧ページ {result[1]}件")
+            continue
+        if save(result):
+            frontier.complete(entry.id)
+        else:
+            retry = frontier.fail(entry.id, result.get('error'), args.max_attempts)
+            failed += not retry
+
+    print_frontier_counts(frontier)
+    return failed
+
+def print_frontier_counts(frontier):
+    """フロンティアの種類・状態ごとのURL数を表示する"""
+    counts = frontier.counts()
+    for kind, label in ((INDEX, '一覧ページ'), (SCHOOL, '大学')):
+        states = {state: count for (k, state), count in counts.items() if k == kind}
+        print(f"{label}: 未取得 {states.get('pending', 0)}, 完了 {states.get('done', 0)}, 失敗 {states.get('failed', 0)}")
+
+def save_university_json(university_data, output_dir, timestamp):
+    """1大学分のデータをJSONファイルにアトミックに保存し、ファイル名を返す"""
+    filename = f"{output_dir}/{university_data['university_name']}_{timestamp}.json"
+    atomic_write_json(filename, university_data, default=encode_review)
+    print(f"保存完了: {filename}")
+    return filename
+
+def save_university_result(university_data, output_dir, timestamp, csv_file=None, review_index=None, journal=None):
+    """
+    1大学分の結果をすぐに保存し、インデックスとジャーナルを更新する
+
+    Returns:
+        bool: エラーなく取得できた場合はTrue（エラー時はジャーナルに完了を記録しない）
+    """
+    school_id = extract_school_id(university_data['url'])
+    error = university_data.get('error')
+    filename = None
+    
+    if review_index is not None and not university_data['reviews'] and not error:
+        # 差分取得で新しい口コミがない大学はファイルを作成しない
+        print(f"{university_data['university_name']}: 新しい口コミはありません")
+    else:
+        with metrics.stage('save'):
+            filename = save_university_json(university_data, output_dir, timestamp)
+            if csv_file:
+                append_to_csv(university_data, csv_file)
+    metrics.inc('reviews_total', len(university_data['reviews']))
+    metrics.inc('universities_total', status='error' if error else 'ok')
+    
+    if error:
+        return False
+    
+    if review_index is not None:
+        # 保存が完了してからインデックスに登録する
+        review_index.add(school_id, [r.get('review_id') for r in university_data['reviews']])
+    if journal is not None:
+        journal.mark_completed(school_id, filename)
+    return True
+
 def save_to_json(data, output_dir):
     """スクレイピングしたデータをJSONファイルに保存"""
     if not os.path.exists(output_dir):
@@ -283,10 +615,33 @@ def save_to_json(data, output_dir):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     for university_data in data:
-        filename = f"{output_dir}/{university_data['university_name']}_{timestamp}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(university_data, f, ensure_ascii=False, indent=2)
-        print(f"保存完了: {filename}")
+        save_university_json(university_data, output_dir, timestamp)
+
+def append_to_csv(university_data, filename):
+    """1大学分の口コミをCSVファイルに追記する（ファイルがなければヘッダー付きで作成）"""
+    is_new = not os.path.exists(filename)
+    with open(filename, 'a', encoding='utf-8-sig' if is_new else 'utf-8', newline='') as f:
+        if is_new:
+            f.write('University,URL,Date,Review\n')
+        
+        university_name = university_data['university_name']
+        url = university_data['url']
+        
+        for review in university_data['reviews']:
+            date = review.get('post_date', '')
+            content = review.get('review_content', '')
+            
+            uni_name_esc = university_name.replace('"', '""')
+            url_esc = url.replace('"', '""')
+            date_esc = date.replace('"', '""')
+            content_esc = content.replace('"', '""')
+            
+            uni_name_csv = f'"{uni_name_esc}"'
+            url_csv = f'"{url_esc}"'
+            date_csv = f'"{date_esc}"'
+            content_csv = f'"{content_esc}"'
+            
+            f.write(f'{uni_name_csv},{url_csv},{date_csv},{content_csv}\n')
 
 def save_to_csv(data, output_dir):
     """スクレイピングしたデータをCSVファイルに保存"""
@@ -295,73 +650,194 @@ def save_to_csv(data, output_dir):
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{output_dir}/university_reviews_{timestamp}.csv"
-    with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
-        f.write('University,URL,Date,Review\n')
-        
-        for university_data in data:
-            university_name = university_data['university_name']
-            url = university_data['url']
-            
-            for review in university_data['reviews']:
-                date = review.get('post_date', '')
-                content = review.get('review_content', '')
-                
-                uni_name_esc = university_name.replace('"', '""')
-                url_esc = url.replace('"', '""')
-                date_esc = date.replace('"', '""')
-                content_esc = content.replace('"', '""')
-                
-                uni_name_csv = f'"{uni_name_esc}"'
-                url_csv = f'"{url_esc}"'
-                date_csv = f'"{date_esc}"'
-                content_csv = f'"{content_esc}"'
-                
-                f.write(f'{uni_name_csv},{url_csv},{date_csv},{content_csv}\n')
+    for university_data in data:
+        append_to_csv(university_data, filename)
     
     print(f"CSVファイルに保存完了: {filename}")
 
-def main():
-    parser = argparse.ArgumentParser(description='大学の口コミ情報をスクレイピングするツール')
-    parser.add_argument('--test', action='store_true', help='テストモードで実行（少数のURLのみ）')
-    parser.add_argument('--delay', type=float, default=3.0, help='リクエスト間の遅延時間（秒）')
-    parser.add_argument('--output', type=str, default='reviews_data', help='出力ディレクトリ')
-    parser.add_argument('--csv', action='store_true', help='CSVファイルも出力する（デフォルトはJSONのみ）')
-    parser.add_argument('--max-reviews', type=int, default=20, help='1大学あたりの最大取得口コミ数（デフォルト: 20件）')
-    args = parser.parse_args()
+def record_fetch_metrics(stats):
+    """HTTP統計（FetchStats）を計測器のカウンターに書き出す"""
+    s = stats.summary()
+    for status, count in s['status_counts'].items():
+        metrics.inc('http_responses_total', count, status=status)
+    metrics.inc('http_retries_total', s['retries'])
+    metrics.inc('http_cache_hits_total', s['cache_hits'] - s['revalidated'], kind='fresh')
+    metrics.inc('http_cache_hits_total', s['revalidated'], kind='revalidated')
+    metrics.inc('http_bytes_total', s['bytes'], encoding='decoded')
+    metrics.inc('http_bytes_total', s['wire_bytes'], encoding='wire')
+    metrics.set('http_latency_seconds', s['latency_p50'], quantile='0.5')
+    metrics.set('http_latency_seconds', s['latency_p95'], quantile='0.95')
+    metrics.set('pages_per_second', metrics.throughput('pages_total'))
+
+def run(args, parser):
+    """コマンドライン引数に従ってクロールを実行する"""
+    global HTML_PARSER
     
-    url_file = 'test_urls.json' if args.test else 'urlList.json'
+    HTML_PARSER = args.parser
+    
+    url_file = args.urls or ('test_urls.json' if args.test else 'urlList.json')
     output_dir = args.output
     delay_seconds = args.delay
     output_csv = args.csv
     max_reviews = args.max_reviews
     
     print(f"実行モード: {'テスト' if args.test else '通常'}")
-    print(f"使用ファイル: {url_file}")
-    print(f"遅延時間: {delay_seconds}秒")
+    if args.discover is None or args.urls:
+        print(f"使用ファイル: {url_file}")
+    if args.throttle == 'fixed':
+        print(f"遅延時間: {delay_seconds}秒")
     print(f"出力ディレクトリ: {output_dir}")
     print(f"出力形式: {'JSON+CSV' if output_csv else 'JSONのみ'}")
-    print(f"最大取得口コミ数: {max_reviews}件/大学")
+    print(f"最大取得口コミ数: {f'{max_reviews}件/大学' if max_reviews else '制限なし'}")
     
-    urls = load_urls(url_file)
-    print(f"{len(urls)}件のURLを読み込みました")
+    discovery = args.discover is not None
+    if not discovery:
+        urls = load_urls(url_file)
+        print(f"{len(urls)}件のURLを読み込みました")
     
-    all_data = []
-    for i, url in enumerate(urls):
-        print(f"進捗: {i+1}/{len(urls)}")
-        university_data = scrape_reviews(url, max_reviews=max_reviews)
-        all_data.append(university_data)
-        
-        if i < len(urls) - 1:
-            delay = delay_seconds + random.uniform(0, 2)
-            print(f"{delay:.2f}秒待機中...")
-            time.sleep(delay)
+    session = create_session(pool_size=max(args.workers, 1), max_retries=args.retries, timeout=args.timeout)
+    stats = FetchStats()
     
-    save_to_json(all_data, output_dir)
-
-    if output_csv:
-        save_to_csv(all_data, output_dir)
+    cache = None
+    if args.cache_dir:
+        cache = HttpCache(args.cache_dir, args.cache_max_size, args.cache_max_age, args.cache_ttl, args.offline)
+        print(f"HTTPキャッシュ: {args.cache_dir}{'（オフラインモード）' if args.offline else ''}")
+    elif args.offline:
+        parser.error('--offline を使用するには --cache-dir を指定してください')
+    
+    review_index = None
+    if args.incremental:
+        review_index = ReviewIndex(args.index_file)
+        if review_index.count() == 0 and os.path.exists(output_dir):
+            seeded = review_index.seed_from_dir(output_dir)
+            print(f"既存の{seeded}件のファイルから口コミIDインデックスを作成しました（{review_index.count()}件）")
+        print(f"差分取得モード: インデックス {args.index_file}（登録済み{review_index.count()}件）")
+    
+    journal = CrawlJournal(args.journal_dir)
+    frontier = CrawlFrontier(args.frontier) if discovery else None
+    if args.fresh:
+        journal.clear()
+        if frontier is not None:
+            frontier.clear()
+    if not discovery:
+        pending_urls = [url for url in urls if not journal.is_completed(extract_school_id(url))]
+        if len(pending_urls) < len(urls):
+            print(f"前回のクロールを再開します: {len(urls) - len(pending_urls)}校は保存済みのためスキップします")
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    csv_file = f"{output_dir}/university_reviews_{timestamp}.csv" if output_csv else None
+    os.makedirs(output_dir, exist_ok=True)
+    
+    rate_limiter = None
+    if args.throttle == 'adaptive' and not args.offline:
+        # 固定の待機時間の代わりに、応答時間とエラーに応じてリクエスト頻度を調整する
+        rate_limiter = AdaptiveRateLimiter(args.rate, args.per_host_rate, args.min_rate)
+        print(f"流量制御: 自動調整（1ホストあたり{rate_limiter.min_rate}〜{rate_limiter.max_rate}件/秒、"
+              f"開始時{rate_limiter.initial_rate}件/秒、全体で最大{args.rate}件/秒）")
+    elif args.workers > 1:
+        rate_limiter = RateLimiter(args.rate, args.per_host_rate, args.burst)
+    
+    scrape_options = dict(max_reviews=max_reviews, session=session, stats=stats, rate_limiter=rate_limiter,
+                          review_index=review_index, cache=cache, journal=journal)
+    failed = 0
+    
+    if discovery:
+        if args.workers > 1:
+            print(f"並行モード: {args.workers}並列, 全体{args.rate}件/秒, ホスト単位{args.per_host_rate or args.rate}件/秒")
+        elif rate_limiter is None and not args.offline:
+            scrape_options['delay'] = delay_seconds
+        failed = run_discovery(
+            args, frontier, scrape_options,
+            lambda university_data: save_university_result(university_data, output_dir, timestamp, csv_file,
+                                                           review_index, journal)
+        )
+        frontier.close()
+    elif args.workers > 1:
+        print(f"並行モード: {args.workers}並列, 全体{args.rate}件/秒, ホスト単位{args.per_host_rate or args.rate}件/秒")
+        for university_data in crawl_concurrently(pending_urls, args.workers, **scrape_options):
+            failed += not save_university_result(university_data, output_dir, timestamp, csv_file, review_index, journal)
+    else:
+        for i, url in enumerate(pending_urls):
+            print(f"進捗: {i+1}/{len(pending_urls)}")
+            university_data = scrape_reviews(url, **scrape_options)
+            failed += not save_university_result(university_data, output_dir, timestamp, csv_file, review_index, journal)
+            
+            if i < len(pending_urls) - 1 and rate_limiter is None and not args.offline:
+                delay = delay_seconds + random.uniform(0, 2)
+                print(f"{delay:.2f}秒待機中...")
+                time.sleep(delay)
+    
+    if csv_file and os.path.exists(csv_file):
+        print(f"CSVファイルに保存完了: {csv_file}")
+    
+    if isinstance(rate_limiter, AdaptiveRateLimiter):
+        for host, rate in rate_limiter.rates().items():
+            print(f"終了時のレート: {host} {rate:.2f}件/秒")
+    
+    if failed:
+        print(f"{failed}校でエラーが発生しました。再実行すると中断した箇所から再開します（ジャーナル: {args.journal_dir}）")
+        if discovery:
+            print(f"再試行の上限（{args.max_attempts}回）に達したURLは {args.frontier} に失敗として記録されています")
+    else:
+        journal.clear()
     
+    if review_index is not None:
+        review_index.close()
+    
+    if cache is not None:
+        cache.close()
+    
+    stats.print_summary()
+    record_fetch_metrics(stats)
     print("スクレイピング完了！")
 
+def main():
+    parser = argparse.ArgumentParser(description='大学の口コミ情報をスクレイピングするツール')
+    parser.add_argument('--test', action='store_true', help='テストモードで実行（少数のURLのみ）')
+    parser.add_argument('--delay', type=float, default=3.0, help='--throttle fixedでの大学間の遅延時間（秒）')
+    parser.add_argument('--output', type=str, default='reviews_data', help='出力ディレクトリ')
+    parser.add_argument('--csv', action='store_true', help='CSVファイルも出力する（デフォルトはJSONのみ）')
+    parser.add_argument('--max-reviews', type=int, default=20, help='1大学あたりの最大取得口コミ数（デフォルト: 20件、0の場合は全件）')
+    parser.add_argument('--urls', type=str, help='URLリストのJSONファイル（指定時は--testより優先）')
+    parser.add_argument('--workers', type=int, default=1, help='同時に処理する大学数（2以上で並行モード）')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='全体の最大リクエスト数/秒（--throttle fixedでは並行モードのみ、デフォルト: 1.0）')
+    parser.add_argument('--per-host-rate', type=float, help='1ホストあたりの最大リクエスト数/秒（デフォルト: --rateと同じ）')
+    parser.add_argument('--burst', type=float, help='--throttle fixedの並行モードでのバースト許容リクエスト数')
+    parser.add_argument('--throttle', choices=['adaptive', 'fixed'], default='fixed',
+                        help='流量制御（fixed: 固定の待機時間（並行モードでは固定のレート）、'
+                             'adaptive: 応答時間とエラーに応じて--min-rate〜--per-host-rateの範囲で自動調整。デフォルト: fixed）')
+    parser.add_argument('--min-rate', type=float, default=0.1,
+                        help='--throttle adaptiveでの1ホストあたりの最小リクエスト数/秒（デフォルト: 0.1）')
+    parser.add_argument('--parser', type=str, choices=['lxml', 'html.parser'], default=HTML_PARSER,
+                        help=f'HTMLパーサー（デフォルト: {HTML_PARSER}、lxmlは改行コードをLFに正規化する）')
+    parser.add_argument('--timeout', type=float, nargs=2, default=list(DEFAULT_TIMEOUT), metavar=('CONNECT', 'READ'),
+                        help=f'接続・読み込みタイムアウト（秒、デフォルト: {DEFAULT_TIMEOUT[0]} {DEFAULT_TIMEOUT[1]}）')
+    parser.add_argument('--retries', type=int, default=3, help='一時的なエラー時の最大再試行回数（デフォルト: 3回）')
+    parser.add_argument('--cache-dir', type=str, help='HTTPレスポンスキャッシュのディレクトリ（指定時にキャッシュを有効化）')
+    parser.add_argument('--cache-ttl', type=float, default=0, help='再検証せずにキャッシュを使う期間（秒、デフォルト: 0=常に再検証）')
+    parser.add_argument('--cache-max-size', type=float, default=500, help='キャッシュの最大サイズ（MB、デフォルト: 500）')
+    parser.add_argument('--cache-max-age', type=float, default=720, help='キャッシュの保持期間（時間、デフォルト: 720）')
+    parser.add_argument('--offline', action='store_true', help='ネットワークに接続せず、キャッシュからのみ取得する（--cache-dirが必要）')
+    parser.add_argument('--incremental', action='store_true', help='取得済みの口コミをスキップし、新しい口コミだけを保存する')
+    parser.add_argument('--index-file', type=str, default='review_index.sqlite3',
+                        help='差分取得で使用する口コミIDインデックス（デフォルト: review_index.sqlite3）')
+    parser.add_argument('--journal-dir', type=str, default='.crawl_journal',
+                        help='中断・再開用のクロールジャーナルのディレクトリ（デフォルト: .crawl_journal）')
+    parser.add_argument('--fresh', action='store_true', help='前回のジャーナル（探索モードではフロンティアも）を破棄して最初からクロールする')
+    parser.add_argument('--discover', nargs='*', metavar='SEED_URL',
+                        help=f'大学一覧ページから大学を探してクロールする探索モード（起点を省略すると{DEFAULT_DISCOVERY_SEED}）')
+    parser.add_argument('--frontier', type=str, default='.crawl_frontier.sqlite3',
+                        help='探索モードのURLフロンティア（デフォルト: .crawl_frontier.sqlite3）')
+    parser.add_argument('--max-schools', type=int, default=0,
+                        help='探索モードで1回の実行で取得する最大の大学数（デフォルト: 0=制限なし）')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='探索モードで1つのURLの取得を試みる最大回数（デフォルト: 3回）')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    
+    with configure_metrics(args, 'scrape_reviews'):
+        run(args, parser)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+class SentimentScorer:
+    """
+    単語ベクトルの平均と感情軸のコサイン類似度を、複数の口コミに対してまとめて計算する
+
+    トークンを語彙の行番号に変換して埋め込み行列から一括で取り出し、
+    口コミごとの平均ベクトルをnp.add.reduceatによる区間和で求め、
+    正規化した軸ベクトルとの内積を全口コミについて一括で計算する
+    """
+
+    def __init__(self, model, axis):
+        """
+        Args:
+            model (KeyedVectors): 単語ベクトル（fastTextの場合は語彙外の単語もサブワードから合成する）
+            axis (numpy.ndarray): 「良い」⇔「悪い」軸ベクトル
+        """
+        self.model = model
+        self.vectors = model.vectors
+        self.key_to_index = model.key_to_index
+        axis = np.asarray(axis, dtype=np.float64)
+        axis_norm = np.linalg.norm(axis)
+        self.unit_axis = axis / axis_norm if axis_norm > 0 else np.zeros_like(axis)
+        # 語彙外の単語のベクトル（model[w]で合成したもの）をキャッシュする
+        self.oov_vectors = {}
+        # 計算したトークン数と、そのうち語彙外だったトークン数（OOV率の計測用）
+        self.token_count = 0
+        self.oov_count = 0
+
+    def _word_vector(self, word):
+        """語彙外の単語のベクトルを返す（モデルに存在しない場合はNone）"""
+        if word not in self.oov_vectors:
+            self.oov_vectors[word] = self.model[word] if word in self.model else None
+        return self.oov_vectors[word]
+
+    def _lookup(self, token_lists):
+        """
+        全トークンを行列の行番号に変換する
+
+        Returns:
+            tuple: (各トークンの行番号, 口コミごとの有効トークン数, 行番号に対応するベクトル行列)
+        """
+        local_index = {}
+        global_rows = []
+        oov_rows = []
+        token_ids = []
+        counts = np.zeros(len(token_lists), dtype=np.int64)
+        oov_count = 0
+
+        for i, tokens in enumerate(token_lists):
+            for w in tokens:
+                idx = local_index.get(w)
+                if idx is None:
+                    if w in self.key_to_index:
+                        idx = len(global_rows)
+                        global_rows.append(self.key_to_index[w])
+                    else:
+                        vec = self._word_vector(w)
+                        if vec is None:
+                            idx = -1
+                        else:
+                            idx = -2 - len(oov_rows)
+                            oov_rows.append(vec)
+                    local_index[w] = idx
+                if idx < 0:
+                    oov_count += 1
+                    if idx == -1:
+                        continue
+                token_ids.append(idx)
+                counts[i] += 1
+        self.token_count += sum(len(tokens) for tokens in token_lists)
+        self.oov_count += oov_count
+
+        # 語彙内の行の後ろに語彙外の行を連結する（語彙外は負の番号を後ろの行に振り直す）
+        n_global = len(global_rows)
+        matrix = self.vectors[np.asarray(global_rows, dtype=np.int64)].astype(np.float64)
+        if oov_rows:
+            matrix = np.vstack([matrix, np.asarray(oov_rows, dtype=np.float64)])
+        ids = np.asarray(token_ids, dtype=np.int64)
+        ids = np.where(ids >= 0, ids, n_global + (-2 - ids))
+        return ids, counts, matrix
+
+    def mean_vectors(self, token_lists):
+        """
+        口コミごとの平均ベクトルを計算する
+
+        Returns:
+            tuple: (平均ベクトルの行列, 有効トークンがある口コミかどうかの真偽値配列)
+        """
+        ids, counts, matrix = self._lookup(token_lists)
+        dim = self.vectors.shape[1]
+        means = np.zeros((len(token_lists), dim), dtype=np.float64)
+        has_tokens = counts > 0
+        if ids.size:
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[has_tokens]
+            sums = np.add.reduceat(matrix[ids], starts, axis=0)
+            means[has_tokens] = sums / counts[has_tokens, None]
+        return means, has_tokens
+
+    def score_token_lists(self, token_lists):
+        """
+        口コミごとのネガティブスコア（平均ベクトルと軸のコサイン類似度）を計算する
+
+        Args:
+            token_lists (list): 口コミごとのトークンのリスト
+
+        Returns:
+            numpy.ndarray: スコアの配列（有効なトークンがない口コミは0.0）
+        """
+        if not token_lists:
+            return np.zeros(0, dtype=np.float64)
+        means, has_tokens = self.mean_vectors(token_lists)
+        norms = np.linalg.norm(means, axis=1)
+        # BLASの行列ベクトル積は行数によって丸め方が変わるため、行ごとの和で計算して
+        # 同じ口コミはどのバッチで計算しても同じスコアになるようにする
+        dots = (means * self.unit_axis).sum(axis=1)
+        valid = has_tokens & (norms > 0)
+        scores = np.zeros(len(token_lists), dtype=np.float64)
+        scores[valid] = dots[valid] / norms[valid]
+        return scores
+
+
+class WordSentimentTable:
+    """
+    語彙全体の単語感情スコア（単語ベクトルと軸のコサイン類似度）の表
+
+    単語の感情スコアはモデルと軸が同じなら変わらないため、語彙全体について1回の行列ベクトル積で
+    計算し、cache_dirを指定した場合は (モデル, 軸) ごとに.npyとして保存して次回以降はメモリマップで読み込む
+    """
+
+    def __init__(self, model, axis, cache_dir=None):
+        """
+        Args:
+            model (KeyedVectors): 単語ベクトル
+            axis (numpy.ndarray): 「良い」⇔「悪い」軸ベクトル
+            cache_dir (str): 表を保存するディレクトリ（Noneの場合は保存しない）
+        """
+        self.model = model
+        self.key_to_index = model.key_to_index
+        axis = np.asarray(axis, dtype=np.float64)
+        axis_norm = np.linalg.norm(axis)
+        self.unit_axis = axis / axis_norm if axis_norm > 0 else np.zeros_like(axis)
+        self.path = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = os.path.join(cache_dir, f'word_sentiment_{self.fingerprint(model, axis)}.npy')
+        self.table = self._load_or_build()
+        # 語彙外の単語（fastTextのサブワードから合成する単語）のスコア
+        self.oov_scores = {}
+
+    @staticmethod
+    def fingerprint(model, axis):
+        """モデルと軸を識別するハッシュ値（語彙の一部と行列の一部から計算する）"""
+        vectors = model.vectors
+        h = hashlib.sha1()
+        h.update(repr((vectors.shape, str(vectors.dtype))).encode())
+        h.update(np.asarray(axis, dtype=np.float64).tobytes())
+        keys = model.index_to_key
+        h.update('\n'.join(keys[:1000] + keys[-1000:]).encode('utf-8'))
+        step = max(1, len(vectors) // 1000)
+        h.update(np.ascontiguousarray(vectors[::step]).tobytes())
+        return h.hexdigest()[:16]
+
+    def _build(self):
+        vectors = self.model.vectors
+        table = np.zeros(len(vectors), dtype=np.float64)
+        # 巨大な語彙でも一時配列が大きくなりすぎないように分割して計算する
+        chunk = 100000
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk].astype(np.float64)
+            norms = np.linalg.norm(block, axis=1)
+            dots = block @ self.unit_axis
+            valid = norms > 0
+            table[start:start + chunk][valid] = dots[valid] / norms[valid]
+        return table
+
+    def _load_or_build(self):
+        if self.path and os.path.exists(self.path):
+            table = np.load(self.path, mmap_mode='r')
+            if len(table) == len(self.model.vectors):
+                return table
+        table = self._build()
+        if self.path:
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, table)
+            os.replace(tmp_path, self.path)
+        return table
+
+    def score(self, word):
+        """
+        単語の感情スコアを返す
+
+        語彙内の単語は表を引き、語彙外でもモデルが合成できる単語は1回だけ計算して保持する。
+        モデルにない単語は0.0を返す
+        """
+        idx = self.key_to_index.get(word)
+        if idx is not None:
+            return float(self.table[idx])
+        if word not in self.oov_scores:
+            score = 0.0
+            if word in self.model:
+                vec = np.asarray(self.model[word], dtype=np.float64)
+                norm = np.linalg.norm(vec)
+                if norm > 0:
+                    score = float(vec @ self.unit_axis / norm)
+            self.oov_scores[word] = score
+        return self.oov_scores[word]
@@ -0,0 +1,404 @@
+import json
+import os
+import argparse
+
+import numpy as np
+
+from atomic_io import atomic_open, atomic_write_json
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+# 単語の感情スコアの分類のしきい値（正の値がネガティブ）
+SENTIMENT_THRESHOLD = 0.01
+
+# 出現率の比較で0回の単語を扱うための加算スムージング
+DEFAULT_ALPHA = 0.5
+
+
+def require_scipy():
+    if sparse is None:
+        raise ImportError("単語頻度行列にはscipyが必要です: pip install scipy")
+
+
+def sentiment_label(sentiment_score):
+    """単語の感情スコアを"positive" / "negative" / "neutral"に分類する"""
+    if sentiment_score < -SENTIMENT_THRESHOLD:
+        return "positive"
+    if sentiment_score > SENTIMENT_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+
+def matrix_paths(path):
+    """
+    保存先のパスから行列（.npz）と語彙（.vocab.json）のファイルパスを返す
+
+    Args:
+        path (str): 保存先（拡張子.npzは省略可）
+    """
+    base = path[:-len('.npz')] if path.endswith('.npz') else path
+    return f'{base}.npz', f'{base}.vocab.json'
+
+
+class TermMatrixBuilder:
+    """
+    大学ごとの単語出現頻度を1行ずつ追加して、コーパス全体の語彙と大学×単語の頻度行列を作る
+
+    各行の列は大学内で単語が最初に現れた順に並べるため、同じ出現回数の単語の並び順を
+    行列から再現できる。単語の感情スコアは語彙に初めて加わったときに1回だけ引く。
+    同じ大学名の行を複数回追加した場合は1行にまとめる（出現回数を合計する）
+    """
+
+    def __init__(self, word_table=None, keep_rows=True):
+        """
+        Args:
+            word_table (WordSentimentTable): 単語の感情スコア表（Noneの場合は感情スコアを持たない）
+            keep_rows (bool): 行列を作るために行を保持するかどうか（Falseの場合は語彙と感情スコアだけを持ち、
+                build()は使えない）
+        """
+        self.word_table = word_table
+        self.keep_rows = keep_rows
+        self.vocab = {}
+        self.words = []
+        self.sentiment = []
+        # 大学名 -> (列番号の配列, 出現回数の配列)（追加した順）
+        self.rows = {}
+
+    def add(self, university_name, word_counts):
+        """
+        1大学分の単語出現頻度を行として追加する
+
+        Args:
+            university_name (str): 大学名（追加済みの大学名の場合は既存の行にまとめる）
+            word_counts (dict): 単語 -> 出現回数（同じ回数の単語はこの順に並ぶ）
+
+        Returns:
+            tuple: (列番号の配列, 出現回数の配列)（このword_counts分だけの行）
+        """
+        vocab = self.vocab
+        size = len(vocab)
+        ids = np.fromiter((vocab.setdefault(w, len(vocab)) for w in word_counts), dtype=np.int64,
+                          count=len(word_counts))
+        counts = np.fromiter(word_counts.values(), dtype=np.int64, count=len(word_counts))
+        if len(vocab) > size:
+            # 新しい単語はこの行に現れた順に番号が振られている
+            new_words = [w for w, word_id in zip(word_counts, ids) if word_id >= size]
+            self.words.extend(new_words)
+            if self.word_table is not None:
+                self.sentiment.extend(self.word_table.score(w) for w in new_words)
+        if self.keep_rows:
+            previous = self.rows.get(university_name)
+            self.rows[university_name] = (ids, counts) if previous is None else merge_rows(previous, (ids, counts))
+        return ids, counts
+
+    @property
+    def universities(self):
+        return list(self.rows)
+
+    def word_info(self, ids, counts, top_k=None):
+        """
+        add()が返した行から、感情スコア付きの単語情報を頻度順に作る
+
+        Args:
+            ids (numpy.ndarray): 列番号
+            counts (numpy.ndarray): 出現回数
+            top_k (int): 上位何語まで含めるか（Noneの場合はすべて）
+
+        Returns:
+            dict: 単語 -> {count, sentiment_score, sentiment}
+        """
+        return build_word_info(self.words, self.sentiment, ids, counts, top_k)
+
+    def build(self):
+        """
+        追加した行から頻度行列を作る
+
+        Returns:
+            TermMatrix: 大学×単語の頻度行列
+        """
+        require_scipy()
+        if not self.keep_rows:
+            raise ValueError("keep_rows=Falseで作ったTermMatrixBuilderからは行列を作れません")
+        rows = list(self.rows.values())
+        indices = np.concatenate([ids for ids, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        data = np.concatenate([counts for _, counts in rows]) if rows else np.zeros(0, dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum([len(ids) for ids, _ in rows], dtype=np.int64)])
+        counts = sparse.csr_matrix((data.astype(np.int32), indices.astype(np.int32), indptr),
+                                   shape=(len(rows), len(self.vocab)))
+        sentiment = np.asarray(self.sentiment, dtype=np.float64) if self.word_table is not None else None
+        return TermMatrix(self.universities, self.words, counts, sentiment)
+
+
+def merge_rows(row, other):
+    """
+    2つの行（列番号の配列, 出現回数の配列）の出現回数を合計した行を返す
+
+    列はrowの順に並べ、otherにだけある列をその後に現れた順に加える
+    """
+    merged = dict(zip(row[0].tolist(), row[1].tolist()))
+    for word_id, count in zip(other[0].tolist(), other[1].tolist()):
+        merged[word_id] = merged.get(word_id, 0) + count
+    return (np.fromiter(merged.keys(), dtype=np.int64, count=len(merged)),
+            np.fromiter(merged.values(), dtype=np.int64, count=len(merged)))
+
+
+def build_word_info(words, sentiment, ids, counts, top_k=None):
+    """
+    行（列番号と出現回数）から、感情スコア付きの単語情報を頻度順に作る
+
+    同じ出現回数の単語は行に並んでいる順（大学内で最初に現れた順）のままにする
+    """
+    order = np.argsort(-counts, kind='stable')
+    if top_k is not None:
+        order = order[:top_k]
+    word_info = {}
+    for i in order:
+        word_id = ids[i]
+        sentiment_score = float(sentiment[word_id])
+        word_info[words[word_id]] = {
+            "count": int(counts[i]),
+            "sentiment_score": sentiment_score,
+            "sentiment": sentiment_label(sentiment_score)
+        }
+    return word_info
+
+
+class TermMatrix:
+    """
+    大学×単語の出現頻度行列（CSR形式）と、コーパス全体の語彙・単語の感情スコア
+
+    行列は.npz、大学名と語彙は.vocab.jsonとして保存する。単語情報（word_info）は
+    必要なときに行列から作り、大学間の比較は疎行列の演算で求める
+    """
+
+    def __init__(self, universities, vocab, counts, sentiment=None):
+        """
+        Args:
+            universities (list): 行に対応する大学名
+            vocab (list): 列に対応する単語
+            counts (scipy.sparse.csr_matrix): 出現回数（各行の列は大学内で最初に現れた順）
+            sentiment (numpy.ndarray): 単語ごとの感情スコア（Noneの場合は持たない）
+        """
+        self.universities = list(universities)
+        self.vocab = list(vocab)
+        self.counts = counts
+        self.sentiment = sentiment
+        self.university_index = {name: i for i, name in enumerate(self.universities)}
+        if len(self.university_index) != len(self.universities):
+            duplicates = sorted({name for name in self.universities if self.universities.count(name) > 1})
+            raise ValueError(f"同じ大学名の行が複数あります: {', '.join(duplicates)}")
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def save(self, path):
+        """
+        行列を.npz、大学名と語彙を.vocab.jsonとしてアトミックに保存する
+
+        Returns:
+            tuple: (行列のパス, 語彙のパス)
+        """
+        npz_path, vocab_path = matrix_paths(path)
+        arrays = {
+            'data': self.counts.data,
+            'indices': self.counts.indices,
+            'indptr': self.counts.indptr,
+            'shape': np.asarray(self.counts.shape, dtype=np.int64),
+        }
+        if self.sentiment is not None:
+            arrays['sentiment'] = np.asarray(self.sentiment, dtype=np.float64)
+        with atomic_open(npz_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        atomic_write_json(vocab_path, {'universities': self.universities, 'vocab': self.vocab}, indent=None)
+        return npz_path, vocab_path
+
+    @classmethod
+    def load(cls, path):
+        """save()で保存した行列を読み込む"""
+        require_scipy()
+        npz_path, vocab_path = matrix_paths(path)
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        with np.load(npz_path) as arrays:
+            # 各行の列の並び（最初に現れた順）を保つため、整列・重複の統合はしない
+            counts = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                       shape=tuple(arrays['shape']))
+            sentiment = arrays['sentiment'] if 'sentiment' in arrays else None
+        return cls(names['universities'], names['vocab'], counts, sentiment)
+
+    def row_index(self, university_name):
+        if university_name not in self.university_index:
+            raise KeyError(f"大学が見つかりません: {university_name}")
+        return self.university_index[university_name]
+
+    def row(self, university_name):
+        """
+        大学の行を返す
+
+        Returns:
+            tuple: (列番号の配列, 出現回数の配列)（大学内で最初に現れた順）
+        """
+        i = self.row_index(university_name)
+        start, end = self.counts.indptr[i], self.counts.indptr[i + 1]
+        return self.counts.indices[start:end], self.counts.data[start:end]
+
+    def top_k(self, university_name, k=None):
+        """
+        大学の出現頻度上位の単語を返す
+
+        Returns:
+            list: (単語, 出現回数)のリスト（同じ回数の単語は大学内で最初に現れた順）
+        """
+        ids, counts = self.row(university_name)
+        order = np.argsort(-counts, kind='stable')[:k]
+        return [(self.vocab[ids[i]], int(counts[i])) for i in order]
+
+    def word_info(self, university_name, top_k=None):
+        """
+        大学の単語情報を分析結果（word_info）と同じ形式で返す
+
+        Args:
+            university_name (str): 大学名
+            top_k (int): 上位何語まで含めるか（Noneの場合はすべて）
+        """
+        if self.sentiment is None:
+            raise ValueError("この行列には単語の感情スコアが保存されていません")
+        ids, counts = self.row(university_name)
+        return build_word_info(self.vocab, self.sentiment, ids, counts, top_k)
+
+    def log_odds(self, alpha=DEFAULT_ALPHA):
+        """
+        大学ごとに、各単語の出現率を他の大学全体と比べた対数オッズ比のzスコアを求める
+
+        行の合計・列の合計から、行列の非ゼロ要素（大学に現れた単語）についてまとめて計算する
+
+        Args:
+            alpha (float): 加算スムージングの値
+
+        Returns:
+            scipy.sparse.csr_matrix: 大学×単語のzスコア（正の値ほどその大学で多く使われる）
+        """
+        counts = self.counts
+        vocab_size = counts.shape[1]
+        row_totals = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+        col_totals = np.asarray(counts.sum(axis=0), dtype=np.float64).ravel()
+        total = row_totals.sum()
+
+        c_u = counts.data.astype(np.float64)
+        n_u = np.repeat(row_totals, np.diff(counts.indptr))
+        c_r = col_totals[counts.indices] - c_u
+        n_r = total - n_u
+        prior = alpha * vocab_size
+        delta = (np.log((c_u + alpha) / (n_u + prior - c_u - alpha))
+                 - np.log((c_r + alpha) / (n_r + prior - c_r - alpha)))
+        variance = 1.0 / (c_u + alpha) + 1.0 / (c_r + alpha)
+        return sparse.csr_matrix((delta / np.sqrt(variance), counts.indices, counts.indptr), shape=counts.shape)
+
+    def over_represented(self, university_name, k=20, min_count=2, alpha=DEFAULT_ALPHA, scores=None):
+        """
+        他の大学と比べて、大学で特に多く使われる単語を返す
+
+        Args:
+            university_name (str): 大学名
+            k (int): 返す単語数
+            min_count (int): 大学での最小出現回数
+            alpha (float): 加算スムージングの値
+            scores (scipy.sparse.csr_matrix): log_odds()の結果（複数の大学を調べる場合に使い回す）
+
+        Returns:
+            list: {word, count, other_count, z_score}のリスト（zスコアの大きい順）
+        """
+        if scores is None:
+            scores = self.log_odds(alpha)
+        i = self.row_index(university_name)
+        start, end = self.counts.indptr[i], self.counts.indptr[i + 1]
+        ids = self.counts.indices[start:end]
+        counts = self.counts.data[start:end]
+        z = scores.data[start:end]
+        col_totals = np.asarray(self.counts.sum(axis=0)).ravel()
+
+        candidates = np.flatnonzero(counts >= min_count)
+        order = candidates[np.argsort(-z[candidates], kind='stable')][:k]
+        return [{
+            'word': self.vocab[ids[j]],
+            'count': int(counts[j]),
+            'other_count': int(col_totals[ids[j]] - counts[j]),
+            'z_score': float(z[j]),
+        } for j in order]
+
+
+def command_info(args):
+    matrix = TermMatrix.load(args.matrix)
+    npz_path, vocab_path = matrix_paths(args.matrix)
+    size = os.path.getsize(npz_path) + os.path.getsize(vocab_path)
+    print(f"大学数: {matrix.shape[0]}, 語彙数: {matrix.shape[1]}, 非ゼロ要素: {matrix.counts.nnz}, "
+          f"総単語数: {int(matrix.counts.sum())}, ファイルサイズ: {size / 1024:.1f}KB")
+
+
+def command_top(args):
+    matrix = TermMatrix.load(args.matrix)
+    for word, count in matrix.top_k(args.university, args.top_k):
+        print(f"{count}\t{word}")
+
+
+def command_distinctive(args):
+    matrix = TermMatrix.load(args.matrix)
+    scores = matrix.log_odds(args.alpha)
+    names = [args.university] if args.university else matrix.universities
+    for name in names:
+        print(f"## {name}")
+        for item in matrix.over_represented(name, args.top_k, args.min_count, scores=scores):
+            print(f"{item['z_score']:.2f}\t{item['count']}\t{item['other_count']}\t{item['word']}")
+
+
+def command_word_info(args):
+    matrix = TermMatrix.load(args.matrix)
+    names = [args.university] if args.university else matrix.universities
+    output = [{"university_name": name, "word_info": matrix.word_info(name, args.top_k)} for name in names]
+    with atomic_open(args.output, 'w') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"{len(output)}件の大学の単語情報を {args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='大学×単語の出現頻度行列（analyze_university_reviews.py --term-matrixで作成）の参照')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_matrix_argument(sub):
+        sub.add_argument('--matrix', '-m', default='university_terms',
+                         help='行列の保存先（.npzと.vocab.json、デフォルト: university_terms）')
+
+    info_parser = subparsers.add_parser('info', help='行列の大きさを表示する')
+    add_matrix_argument(info_parser)
+    info_parser.set_defaults(func=command_info)
+
+    top_parser = subparsers.add_parser('top', help='大学の出現頻度上位の単語を表示する')
+    add_matrix_argument(top_parser)
+    top_parser.add_argument('--university', '-u', required=True, help='大学名')
+    top_parser.add_argument('--top-k', '-k', type=int, default=20, help='表示する単語数（デフォルト: 20）')
+    top_parser.set_defaults(func=command_top)
+
+    distinctive_parser = subparsers.add_parser('distinctive', help='他の大学と比べて多く使われる単語を表示する')
+    add_matrix_argument(distinctive_parser)
+    distinctive_parser.add_argument('--university', '-u', help='大学名（省略した場合はすべての大学）')
+    distinctive_parser.add_argument('--top-k', '-k', type=int, default=20, help='表示する単語数（デフォルト: 20）')
+    distinctive_parser.add_argument('--min-count', type=int, default=2,
+                                    help='大学での最小出現回数（デフォルト: 2）')
+    distinctive_parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+                                    help=f'加算スムージングの値（デフォルト: {DEFAULT_ALPHA}）')
+    distinctive_parser.set_defaults(func=command_distinctive)
+
+    word_info_parser = subparsers.add_parser('word-info', help='分析結果と同じ形式の単語情報をJSONで書き出す')
+    add_matrix_argument(word_info_parser)
+    word_info_parser.add_argument('--university', '-u', help='大学名（省略した場合はすべての大学）')
+    word_info_parser.add_argument('--top-k', '-k', type=int, help='大学ごとの単語数（デフォルト: すべて）')
+    word_info_parser.add_argument('--output', '-o', default='word_info.json',
+                                  help='出力ファイルのパス（デフォルト: word_info.json）')
+    word_info_parser.set_defaults(func=command_word_info)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,80 @@
+import glob
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+# スクリプトはリポジトリ直下のモジュールを直接importするため、テストからも同じようにimportできるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_server  # noqa: E402
+from merge_reviews import merge_reviews  # noqa: E402
+
+# 同梱のreviews_dataのうちテストに使う大学数（形態素解析に時間がかかるため一部に絞る）
+SAMPLE_UNIVERSITIES = 2
+
+
+def write_site_data(data_dir, schools, reviews, first_id=1000):
+    """
+    モックサイトの生成元になる大学データを作る
+
+    学校IDはfirst_id（デフォルト: 1000）から連番、口コミIDはanswer_{学校ID}{連番}で、口コミ数はreviews件（関数の場合は学校IDごとの件数）
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    for n in range(schools):
+        school_id = str(first_id + n)
+        count = reviews(school_id) if callable(reviews) else reviews
+        data = {
+            'university_name': f'テスト大学{school_id}',
+            'url': f'https://www.minkou.jp/university/school/{school_id}/',
+            'review_url': f'https://www.minkou.jp/university/school/review/{school_id}/',
+            'reviews': [
+                {
+                    'review_id': f'answer_{school_id}{i:03d}',
+                    'post_date': '2025/01/01',
+                    'overall_rating': '良い',
+                    'overall_rating_detail': f'口コミ{i}',
+                    'review_content': f'口コミ{i}',
+                }
+                for i in range(count)
+            ],
+        }
+        with open(os.path.join(data_dir, f'{school_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def mock_site(tmp_path):
+    """
+    小さなモックサイトを起動する関数を返す
+
+    mock_site(schools, reviews, first_id=1000, **create_serverの引数) -> (サーバー, ベースURL)。サーバーはテストの終了時に停止する
+    """
+    servers = []
+
+    def start(schools, reviews, first_id=1000, **options):
+        data_dir = str(tmp_path / f'site{len(servers)}')
+        write_site_data(data_dir, schools, reviews, first_id)
+        server = mock_server.create_server(data_dir, **options)
+        servers.append(server)
+        return server, mock_server.start_in_thread(server)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def merged_sample(tmp_path):
+    """同梱のreviews_dataの一部をmerge_reviewsで統合したJSON Linesを作り、パスを返す"""
+    data_dir = tmp_path / 'reviews_data'
+    data_dir.mkdir()
+    for path in sorted(glob.glob(os.path.join(ROOT, 'reviews_data', '*.json')))[:SAMPLE_UNIVERSITIES]:
+        shutil.copy(path, data_dir)
+    merged_path = str(tmp_path / 'merged_reviews.jsonl')
+    merge_reviews(str(data_dir), merged_path)
+    return merged_path
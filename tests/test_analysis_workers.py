@@ -0,0 +1,38 @@
+import pytest
+
+from add_negative_scores_to_reviews import add_negative_scores_to_reviews
+from aggregate_reviews_by_university import aggregate_reviews_by_university
+from analyze_university_reviews import analyze_university_reviews
+from embedding_store import build_synthetic_model
+
+
+@pytest.fixture
+def synthetic_model(tmp_path):
+    path = str(tmp_path / 'tiny.bin')
+    build_synthetic_model(path)
+    return path
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_worker_pool_output_is_identical_to_serial(merged_sample, synthetic_model, tmp_path):
+    aggregated_path = str(tmp_path / 'aggregated.json')
+    aggregate_reviews_by_university(merged_sample, aggregated_path)
+
+    outputs = {}
+    for workers in (1, 3):
+        # キャッシュを使わず、どちらもすべてのテキストを形態素解析する
+        scored_path = str(tmp_path / f'scored_{workers}.json')
+        add_negative_scores_to_reviews(merged_sample, scored_path, synthetic_model, token_cache_path=None,
+                                       workers=workers)
+        analysis_path = str(tmp_path / f'analysis_{workers}.json')
+        analyze_university_reviews(aggregated_path, analysis_path, synthetic_model, sentiment_cache_dir=None,
+                                   token_cache_path=None, workers=workers)
+        outputs[workers] = (read_bytes(scored_path), read_bytes(analysis_path))
+
+    assert b'negative_score' in outputs[1][0]
+    assert b'word_info' in outputs[1][1]
+    assert outputs[3] == outputs[1]
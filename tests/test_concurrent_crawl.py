@@ -0,0 +1,68 @@
+import glob
+import json
+import sys
+from bisect import bisect_right
+
+import scrape_reviews
+from rate_limiter import RateLimiter
+from review_record import encode_review
+
+SCHOOLS = 4
+REVIEWS = 20
+
+
+def busiest_second(server):
+    """1秒間に受けた最大のリクエスト数"""
+    times = sorted(server.stats.request_times)
+    return max(bisect_right(times, t + 1.0) - i for i, t in enumerate(times))
+
+
+def school_urls(base_url, first_id=1000):
+    return [f'{base_url}/university/school/{first_id + n}/' for n in range(SCHOOLS)]
+
+
+def run_concurrent(monkeypatch, tmp_path, urls, *options):
+    """並行モードでscrape_reviews.pyを実行し、保存された大学データを大学名 -> データで返す"""
+    urls_file = tmp_path / 'urls.json'
+    urls_file.write_text(json.dumps(urls), encoding='utf-8')
+    output_dir = tmp_path / 'out'
+    monkeypatch.setattr(sys, 'argv', [
+        'scrape_reviews.py', '--urls', str(urls_file), '--output', str(output_dir), '--max-reviews', '0',
+        '--journal-dir', str(tmp_path / 'journal'), '--workers', '4', '--burst', '1', *options,
+    ])
+    scrape_reviews.main()
+    results = {}
+    for path in glob.glob(str(output_dir / '*.json')):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        results[data['url']] = data
+    return results
+
+
+def test_per_host_rate_is_respected(mock_site, monkeypatch, tmp_path):
+    server, base_url = mock_site(SCHOOLS, REVIEWS, latency=0.2)
+    results = run_concurrent(monkeypatch, tmp_path, school_urls(base_url), '--rate', '100', '--per-host-rate', '8')
+
+    assert len(results) == SCHOOLS
+    assert server.stats.max_active_requests > 1
+    # バースト許容量1で1秒あたり8件なので、どの1秒間でも8+1件まで
+    assert busiest_second(server) <= 9
+
+
+def test_global_rate_is_respected_and_output_matches_serial_crawl(mock_site, monkeypatch, tmp_path):
+    sites = [mock_site(SCHOOLS, REVIEWS, first_id, latency=0.2) for first_id in (1000, 2000)]
+    urls = [url for (_, base_url), first_id in zip(sites, (1000, 2000)) for url in school_urls(base_url, first_id)]
+    results = run_concurrent(monkeypatch, tmp_path, urls, '--rate', '10', '--per-host-rate', '100')
+
+    # 2つのホストへのリクエストを合わせて、どの1秒間でも10+1件まで
+    times = sorted(t for server, _ in sites for t in server.stats.request_times)
+    busiest = max(bisect_right(times, t + 1.0) - i for i, t in enumerate(times))
+    assert busiest <= 11
+    assert len(results) == len(urls)
+
+    # 同じ大学を1校ずつ順に取得した結果と同じ
+    serial_limiter = RateLimiter(1000)
+    for url in urls:
+        data = scrape_reviews.scrape_reviews(url, max_reviews=0, rate_limiter=serial_limiter)
+        assert 'error' not in data
+        assert results[url] == json.loads(json.dumps(data, default=encode_review))
@@ -0,0 +1,82 @@
+import glob
+import json
+import sys
+
+import pytest
+
+import mock_server
+import scrape_reviews
+
+# モックサイトの大学数（一覧ページは mock_server.SCHOOLS_PER_INDEX_PAGE 校ずつ）
+SCHOOL_COUNT = 45
+
+# 1校あたりの口コミ数（mock_server.REVIEWS_PER_PAGE 件ずつの口コミ一覧ページ）
+REVIEW_COUNT = 15
+
+
+@pytest.fixture
+def site(mock_site):
+    return mock_site(SCHOOL_COUNT, REVIEW_COUNT)
+
+
+def run_scraper(monkeypatch, tmp_path, base_url, *options):
+    """探索モードでscrape_reviews.pyを実行する（待機せずに取得する）"""
+    argv = [
+        'scrape_reviews.py', '--discover', f'{base_url}/university/search/',
+        '--frontier', str(tmp_path / 'frontier.sqlite3'), '--journal-dir', str(tmp_path / 'journal'),
+        '--output', str(tmp_path / 'out'), '--max-reviews', '0', '--throttle', 'adaptive', '--rate', '1000', *options,
+    ]
+    monkeypatch.setattr(sys, 'argv', argv)
+    scrape_reviews.main()
+
+
+def saved_schools(tmp_path):
+    """保存された大学データを大学名 -> 口コミ数で返す"""
+    schools = {}
+    for file_path in glob.glob(str(tmp_path / 'out' / '*.json')):
+        with open(file_path, encoding='utf-8') as f:
+            data = json.load(f)
+        assert data['university_name'] not in schools, f"{data['university_name']}が2回保存されました"
+        schools[data['university_name']] = len(data['reviews'])
+    return schools
+
+
+def fetched_paths(server, prefix):
+    return {path: count for path, count in server.stats.path_counts.items() if path.startswith(prefix)}
+
+
+def test_discovery_stops_at_max_schools_and_resumes_without_refetching(site, monkeypatch, tmp_path, capsys):
+    server, base_url = site
+    pages_per_school = -(-REVIEW_COUNT // mock_server.REVIEWS_PER_PAGE)
+    index_pages = -(-SCHOOL_COUNT // mock_server.SCHOOLS_PER_INDEX_PAGE)
+
+    run_scraper(monkeypatch, tmp_path, base_url, '--max-schools', '10')
+    assert len(saved_schools(tmp_path)) == 10
+    assert len(fetched_paths(server, '/university/school/review/')) == 10 * pages_per_school
+    # URLリストを読まないため、使用ファイルは表示しない
+    assert '使用ファイル' not in capsys.readouterr().out
+
+    run_scraper(monkeypatch, tmp_path, base_url)
+    schools = saved_schools(tmp_path)
+    assert len(schools) == SCHOOL_COUNT
+    assert set(schools.values()) == {REVIEW_COUNT}
+
+    # 2回の実行を通して、一覧ページ・大学ページ・口コミ一覧ページをそれぞれ1回だけ取得している
+    school_pages = {path: count for path, count in fetched_paths(server, '/university/school/').items()
+                    if not path.startswith('/university/school/review/')}
+    assert len(school_pages) == SCHOOL_COUNT
+    assert len(fetched_paths(server, '/university/school/review/')) == SCHOOL_COUNT * pages_per_school
+    assert len(fetched_paths(server, '/university/search/')) == index_pages
+    duplicates = {path: count for path, count in server.stats.path_counts.items() if count > 1}
+    assert duplicates == {}
+
+
+def test_discovery_deduplicates_schools_linked_from_several_index_pages(site, monkeypatch, tmp_path):
+    server, base_url = site
+    # 一覧ページの1ページ目は2ページ目からも「page=1」として辿れるが、同じ大学は1回だけ取得する
+    run_scraper(monkeypatch, tmp_path, base_url, '--discover', f'{base_url}/university/search/',
+                f'{base_url}/university/search/page=2/', '--workers', '4')
+
+    assert len(saved_schools(tmp_path)) == SCHOOL_COUNT
+    duplicates = {path: count for path, count in server.stats.path_counts.items() if count > 1}
+    assert duplicates == {}
@@ -0,0 +1,160 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from bisect import bisect_right
+
+import pytest
+
+from distributed_crawl import run_worker, school_task, seed_queue
+from http_client import create_session
+from review_output_store import ReviewOutputStore
+from work_queue import DONE, FAILED, LEASED, PENDING, SqliteWorkQueue, WorkQueue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    with SqliteWorkQueue(str(tmp_path / 'queue.sqlite3')) as queue:
+        yield queue
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ReviewOutputStore(str(tmp_path / 'output.sqlite3')) as store:
+        yield store
+
+
+def school_urls(base_url, schools):
+    return [f'{base_url}/university/school/{1000 + n}/' for n in range(schools)]
+
+
+def run_in_process(queue, store, worker_id, **options):
+    """このプロセスでワーカーを実行する（キューが空になるまで）"""
+    options = {'threads': 2, 'lease_timeout': 1.0, 'retry_delay': 0.0, 'poll_interval': 0.05, **options}
+    return run_worker(queue, store, worker_id, session=create_session(pool_size=options['threads']),
+                      rate_limiter=queue.rate_limiter(), **options)
+
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+
+def test_expired_lease_is_redelivered_and_stale_token_is_rejected(queue):
+    queue.put_many([('a', 'page', {'n': 1}, 0)])
+    [first] = queue.lease('worker-a', timeout=0.1)
+    # 期限内は他のワーカーにリースされない
+    assert queue.lease('worker-b', timeout=0.1) == []
+
+    time.sleep(0.15)
+    [second] = queue.lease('worker-b', timeout=10)
+    assert (second.key, second.attempts) == ('a', 2)
+    assert second.token != first.token
+
+    # 期限切れのリースでは完了・失敗・延長を記録できない
+    assert not queue.ack(first)
+    queue.fail(first, 'stale', max_attempts=5)
+    assert not queue.extend(first)
+    assert queue.counts() == {('page', LEASED): 1}
+
+    assert queue.ack(second)
+    assert queue.counts() == {('page', DONE): 1}
+    assert queue.is_drained()
+
+
+def test_task_fails_after_max_attempts(queue):
+    queue.put_many([('expired', 'page', {}, 0), ('error', 'page', {}, 1)])
+
+    # 何度もリースの期限が切れたタスクは、max_attempts回配信した後は配信しない
+    for _ in range(2):
+        [task] = queue.lease('worker', timeout=0.05, max_attempts=2)
+        assert task.key == 'expired'
+        time.sleep(0.1)
+    [task] = queue.lease('worker', timeout=10, max_attempts=2)
+    assert task.key == 'error'
+
+    # 失敗を記録したタスクはmax_attemptsに達するまで再試行する
+    assert queue.fail(task, 'boom', max_attempts=2)
+    [task] = queue.lease('worker', timeout=10, max_attempts=2)
+    assert not queue.fail(task, 'boom', max_attempts=2)
+
+    assert queue.lease('worker', max_attempts=2) == []
+    assert dict(queue.failed_tasks()) == {'expired': 'リースの期限切れ', 'error': 'boom'}
+    assert queue.requeue_failed() == 2
+    assert queue.counts() == {('page', PENDING): 2}
+
+
+def test_store_keeps_one_row_per_review(store):
+    with_id = [{'review_id': f'answer_{i}', 'review_content': f'口コミ{i}'} for i in range(3)]
+    without_id = [{'post_date': '2025/01/01', 'review_content': f'ID なし{i}'} for i in range(3)]
+    assert store.add_reviews('1', 1, with_id + without_id) == 6
+
+    # 再配信したページに新しい口コミが投稿されて位置がずれても、同じ口コミは重複しない
+    new = [{'post_date': '2025/02/01', 'review_content': '新しい口コミ'}]
+    assert store.add_reviews('1', 1, new + without_id + with_id) == 1
+    assert store.count() == (0, 7)
+
+
+def test_killed_worker_tasks_are_redelivered_and_stored_once(mock_site, queue, store, tmp_path):
+    schools, reviews = 6, 30
+    # 1リクエスト0.3秒かかるサーバーにして、ワーカーがリース中のタスクを持っている間に停止させる
+    server, base_url = mock_site(schools, reviews, latency=0.3)
+    seed_queue(queue, school_urls(base_url, schools), max_reviews=0)
+    queue.rate_limiter().configure(100)
+
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'distributed_crawl.py'), '--queue', queue.path, '--store', store.path,
+         'worker', '--worker-id', 'killed', '--threads', '2', '--lease-timeout', '1', '--poll-interval', '0.05'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 30
+        while store.count()[1] == 0 or not queue.counts().get(('page', LEASED)):
+            assert worker.poll() is None and time.time() < deadline
+            time.sleep(0.02)
+        worker.send_signal(signal.SIGKILL)
+    finally:
+        worker.wait()
+
+    results = run_in_process(queue, store, 'survivor')
+
+    assert results['failed'] == 0
+    assert queue.failed_tasks() == []
+    with queue.lock:
+        redelivered = queue.conn.execute('SELECT COUNT(*) FROM tasks WHERE attempts > 1').fetchone()[0]
+    assert redelivered >= 1
+    # 再配信したページも口コミIDごとに1件だけ保存される
+    assert store.count() == (schools, schools * reviews)
+    exported = {r['review_id'] for data in store.iter_university_data() for r in data['reviews']}
+    assert len(exported) == schools * reviews
+
+
+def test_rate_budget_is_shared_across_workers(mock_site, tmp_path):
+    schools, reviews, rate = 4, 20, 10.0
+    server, base_url = mock_site(schools, reviews)
+    path = str(tmp_path / 'queue.sqlite3')
+    with SqliteWorkQueue(path) as coordinator:
+        seed_queue(coordinator, school_urls(base_url, schools), max_reviews=0)
+        coordinator.rate_limiter().configure(rate, burst=1)
+
+    # 2つのワーカーがそれぞれ別の接続でキューとトークンバケットを使う（別プロセスと同じ）
+    def work(worker_id):
+        with SqliteWorkQueue(path) as queue, ReviewOutputStore(str(tmp_path / 'output.sqlite3')) as store:
+            run_in_process(queue, store, worker_id)
+
+    workers = [threading.Thread(target=work, args=(f'worker-{n}',)) for n in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    times = sorted(server.stats.request_times)
+    assert len(times) == schools * (1 + reviews // 10)
+    # どの1秒間でも、全ワーカー合計のリクエスト数はレート+バースト許容量以下
+    busiest = max(bisect_right(times, t + 1.0) - i for i, t in enumerate(times))
+    assert busiest <= rate + 1
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from add_negative_scores_to_reviews import score_reviews
+from embedding_store import (
+    AXIS_WORDS, build_synthetic_model, collect_corpus_vocabulary, convert_model, iter_corpus_texts, load_word_vectors,
+)
+from morph_tokenizer import create_tokenizer
+from review_io import iter_university_reviews
+from sentiment_engine import SentimentScorer
+from token_cache import CachedTokenizer, TokenCache
+
+TEXTS = [
+    '授業の内容がとても良い。先生も親切です。',
+    '設備が古くて学食も狭いので悪い。',
+    '就職のサポートが充実していて良い大学です。',
+    '立地が悪いので通学が大変です。',
+]
+
+
+@pytest.fixture
+def synthetic_model(tmp_path):
+    """小さな合成モデル（.bin）を作り、パスを返す"""
+    path = str(tmp_path / 'tiny.bin')
+    build_synthetic_model(path, TEXTS)
+    return path
+
+
+def scores(model, token_lists):
+    axis = model[AXIS_WORDS[1]] - model[AXIS_WORDS[0]]
+    return SentimentScorer(model, axis).score_token_lists(token_lists)
+
+
+def token_lists():
+    tokenizer = create_tokenizer()
+    return [tokenizer.nouns(text) for text in TEXTS]
+
+
+def test_converted_model_is_memory_mapped_and_scores_like_original(synthetic_model, tmp_path):
+    original = load_word_vectors(synthetic_model)
+    converted_path = str(tmp_path / 'tiny.kv')
+    convert_model(synthetic_model, converted_path)
+
+    converted = load_word_vectors(converted_path)
+    assert isinstance(converted.vectors, np.memmap)
+
+    # 語彙外の単語もサブワードから元のモデルと同じベクトルを合成する
+    tokens = token_lists() + [['未知語の単語', '授業'], []]
+    np.testing.assert_allclose(scores(converted, tokens), scores(original, tokens), rtol=1e-6, atol=1e-7)
+
+
+def test_pruned_model_keeps_scores_for_corpus_words(synthetic_model, tmp_path):
+    original = load_word_vectors(synthetic_model)
+    pruned_path = str(tmp_path / 'tiny.pruned.kv')
+    convert_model(synthetic_model, pruned_path, collect_corpus_vocabulary(TEXTS))
+
+    pruned = load_word_vectors(pruned_path)
+    assert isinstance(pruned.vectors, np.memmap)
+    assert set(AXIS_WORDS) <= set(pruned.key_to_index)
+
+    tokens = token_lists()
+    assert any(tokens)
+    np.testing.assert_allclose(scores(pruned, tokens), scores(original, tokens), rtol=1e-6, atol=1e-7)
+
+
+def test_pruned_model_scores_merged_reviews_like_unpruned_model(merged_sample, tmp_path):
+    merged_path = merged_sample
+    # 組み込みの例文だけで学習したモデルなので、口コミの単語の多くはサブワードから合成される
+    model_path = str(tmp_path / 'tiny.bin')
+    build_synthetic_model(model_path)
+    pruned_path = str(tmp_path / 'tiny.pruned.kv')
+    convert_model(model_path, pruned_path, collect_corpus_vocabulary(iter_corpus_texts([merged_path])))
+
+    tokenizer = CachedTokenizer(TokenCache(str(tmp_path / 'tokens.sqlite3')))
+    results = []
+    for model in (load_word_vectors(model_path), load_word_vectors(pruned_path)):
+        reviews = [review for _, reviews in iter_university_reviews(merged_path) for review in reviews]
+        score_reviews(reviews, tokenizer, SentimentScorer(model, model[AXIS_WORDS[1]] - model[AXIS_WORDS[0]]))
+        results.append([review['negative_score'] for review in reviews])
+    tokenizer.close()
+
+    assert len(results[0]) > 100
+    assert any(results[0])
+    assert results[0] == results[1]
@@ -0,0 +1,76 @@
+import os
+import time
+
+import requests
+
+import http_cache
+from http_cache import HttpCache
+
+
+def make_response(body):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['ETag'] = '"v1"'
+    response._content = body
+    return response
+
+
+def stored_sizes(cache):
+    return dict(cache.conn.execute('SELECT url, size FROM responses'))
+
+
+def test_get_batches_access_time_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, 'ACCESS_FLUSH_SIZE', 3)
+    cache = HttpCache(str(tmp_path))
+    for n in range(3):
+        cache.put(f'http://example.com/{n}', make_response(b'x'))
+
+    changes = cache.conn.total_changes
+    assert cache.get('http://example.com/0')['body'] == b'x'
+    assert cache.get('http://example.com/1')['body'] == b'x'
+    # 一定件数が溜まるまでは書き込まない
+    assert cache.conn.total_changes == changes
+    cache.get('http://example.com/2')
+    assert cache.conn.total_changes == changes + 3
+    cache.close()
+
+
+def test_evict_keeps_running_total_and_removes_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, 'EVICT_BATCH_SIZE', 2)
+    body = os.urandom(1000)
+    cache = HttpCache(str(tmp_path), max_size_mb=5500 / 1024 / 1024)
+    for n in range(5):
+        cache.put(f'http://example.com/{n}', make_response(body))
+        time.sleep(0.01)
+    # 上書きしても合計サイズを二重に数えない
+    cache.put('http://example.com/4', make_response(body))
+    assert len(stored_sizes(cache)) == 5
+    assert cache.total_size == sum(stored_sizes(cache).values())
+
+    # 参照した0番は残り、参照の古い1番と2番から削除される
+    cache.get('http://example.com/0')
+    cache.put('http://example.com/5', make_response(body))
+    cache.put('http://example.com/6', make_response(body))
+    remaining = stored_sizes(cache)
+    assert sorted(remaining) == [f'http://example.com/{n}' for n in (0, 3, 4, 5, 6)]
+    assert cache.total_size == sum(remaining.values()) <= cache.max_size
+    cache.close()
+
+    # 開き直すと合計サイズを集計し直す
+    reopened = HttpCache(str(tmp_path), max_size_mb=5500 / 1024 / 1024)
+    assert reopened.total_size == sum(remaining.values())
+    reopened.close()
+
+
+def test_evict_deletes_expired_entries_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, 'EVICT_BATCH_SIZE', 2)
+    cache = HttpCache(str(tmp_path))
+    for n in range(5):
+        cache.put(f'http://example.com/{n}', make_response(b'x'))
+    cache.conn.execute('UPDATE responses SET stored_at = 0')
+    cache.conn.commit()
+
+    cache.put('http://example.com/new', make_response(b'x'))
+    assert list(stored_sizes(cache)) == ['http://example.com/new']
+    assert cache.total_size == sum(stored_sizes(cache).values())
+    cache.close()
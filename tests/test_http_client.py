@@ -0,0 +1,51 @@
+import threading
+
+from http_client import FetchStats, create_session, fetch
+
+
+class RecordingLimiter:
+    """送信の許可と応答の通知を記録するレート制限器"""
+
+    def __init__(self):
+        self.waits = []
+        self.observed = []
+
+    def wait(self, url):
+        self.waits.append(url)
+        return 0.0
+
+    def observe(self, url, status, elapsed):
+        self.observed.append(status)
+
+
+def test_retries_wait_for_the_rate_limiter_and_are_observed(mock_site):
+    server, base_url = mock_site(1, 10)
+    url = f'{base_url}/university/school/1000/'
+    # 最初のリクエストにはRetry-After: 1の503を返し、再試行までにサーバーを回復させる
+    server.error_rate = 1.0
+    threading.Timer(0.5, lambda: setattr(server, 'error_rate', 0.0)).start()
+
+    limiter = RecordingLimiter()
+    stats = FetchStats()
+    response = fetch(create_session(max_retries=3), url, stats=stats, rate_limiter=limiter)
+
+    assert response.status_code == 200
+    assert stats.summary()['retries'] == 1
+    # 再試行したリクエストも含め、送ったリクエストごとに許可を待ち、応答を通知する
+    assert limiter.waits == [url, url]
+    assert limiter.observed == [503, 200]
+    assert server.stats.total_requests == 2
+
+
+def test_exhausted_retries_are_all_counted(mock_site):
+    server, base_url = mock_site(1, 10)
+    url = f'{base_url}/university/school/1000/'
+    server.error_rate = 1.0
+
+    limiter = RecordingLimiter()
+    session = create_session(max_retries=1, backoff_factor=0, backoff_jitter=0)
+    response = fetch(session, url, rate_limiter=limiter)
+
+    assert response.status_code == 503
+    assert len(limiter.waits) == server.stats.total_requests == 2
+    assert limiter.observed == [503, 503]
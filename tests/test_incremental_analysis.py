@@ -0,0 +1,84 @@
+import json
+import sqlite3
+
+import pytest
+
+from add_negative_scores_to_reviews import add_negative_scores_to_reviews
+from analyze_university_reviews import analyze_university_reviews
+from embedding_store import build_synthetic_model
+
+# 大学名 -> 口コミの本文のリスト
+VERSIONS = {
+    'initial': {
+        'テスト大学A': ['授業が良い。設備が悪い。', '設備と学食が狭い。', '授業が良い。設備が悪い。'],
+        'テスト大学B': ['立地が悪いので通学が大変です。'],
+    },
+    # 口コミを追加する
+    'added': {
+        'テスト大学A': ['授業が良い。設備が悪い。', '設備と学食が狭い。', '授業が良い。設備が悪い。', '先生が親切で就職も良い。'],
+        'テスト大学B': ['立地が悪いので通学が大変です。', '学食が安くて良い。'],
+    },
+    # 先頭の口コミを編集し、最初に現れる単語を変える
+    'edited': {
+        'テスト大学A': ['図書館が新しい。', '設備と学食が狭い。', '授業が良い。設備が悪い。', '先生が親切で就職も良い。'],
+        'テスト大学B': ['立地が悪いので通学が大変です。', '学食が安くて良い。'],
+    },
+    # 口コミと大学を削除する
+    'removed': {
+        'テスト大学A': ['図書館が新しい。', '先生が親切で就職も良い。'],
+    },
+}
+
+
+@pytest.fixture
+def synthetic_model(tmp_path):
+    path = str(tmp_path / 'tiny.bin')
+    build_synthetic_model(path, [text for texts in VERSIONS.values() for reviews in texts.values() for text in reviews])
+    return path
+
+
+def write_inputs(tmp_path, universities):
+    """merged_reviews.json形式と大学別に集約した形式の入力を書き出す"""
+    merged_path = str(tmp_path / 'merged.json')
+    aggregated_path = str(tmp_path / 'aggregated.json')
+    merged = [{
+        'university_name': name,
+        'url': f'https://www.minkou.jp/university/school/{n}/',
+        'review_url': f'https://www.minkou.jp/university/school/review/{n}/',
+        'reviews': [{'review_id': f'answer_{n}{i:03d}', 'review_content': text} for i, text in enumerate(texts)],
+    } for n, (name, texts) in enumerate(universities.items())]
+    with open(merged_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+    with open(aggregated_path, 'w', encoding='utf-8') as f:
+        json.dump([{'university_name': name, 'reviews': texts} for name, texts in universities.items()], f,
+                  ensure_ascii=False)
+    return merged_path, aggregated_path
+
+
+def run_both(tmp_path, universities, model_path, state_path):
+    """差分分析と全件の分析を実行し、それぞれの出力を返す"""
+    merged_path, aggregated_path = write_inputs(tmp_path, universities)
+    outputs = {}
+    for mode, state in (('incremental', state_path), ('full', None)):
+        scored_path = str(tmp_path / f'scored_{mode}.json')
+        analysis_path = str(tmp_path / f'analysis_{mode}.json')
+        add_negative_scores_to_reviews(merged_path, scored_path, model_path, token_cache_path=None, state_path=state)
+        analyze_university_reviews(aggregated_path, analysis_path, model_path, sentiment_cache_dir=None,
+                                   token_cache_path=None, state_path=state)
+        with open(scored_path, encoding='utf-8') as f1, open(analysis_path, encoding='utf-8') as f2:
+            outputs[mode] = (f1.read(), f2.read())
+    return outputs
+
+
+def test_incremental_output_equals_full_run_after_add_edit_and_remove(synthetic_model, tmp_path):
+    state_path = str(tmp_path / 'state.sqlite3')
+    for version, universities in VERSIONS.items():
+        outputs = run_both(tmp_path, universities, synthetic_model, state_path)
+        assert outputs['incremental'] == outputs['full'], version
+
+    # 消えた口コミのスコアと、消えた大学のテキストは状態ファイルに残らない
+    final = VERSIONS['removed']
+    with sqlite3.connect(state_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM review_scores').fetchone()[0] == len(final['テスト大学A'])
+        assert [row[0] for row in conn.execute('SELECT DISTINCT university FROM texts')] == ['テスト大学A']
+        assert conn.execute('SELECT COUNT(*) FROM texts').fetchone()[0] == len(final['テスト大学A'])
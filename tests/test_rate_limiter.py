@@ -0,0 +1,47 @@
+import pytest
+
+from http_client import create_session, fetch
+from rate_limiter import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def site(mock_site):
+    server, base_url = mock_site(1, 10)
+    return server, f'{base_url}/university/school/1000/'
+
+
+def fetch_many(session, url, limiter, count):
+    return [fetch(session, url, rate_limiter=limiter).status_code for _ in range(count)]
+
+
+def test_adaptive_rate_backs_off_on_overload_and_recovers(site):
+    server, url = site
+    limiter = AdaptiveRateLimiter(100, min_rate=1, initial_rate=20, window=5)
+    host = url.split('/')[2]
+    # 再試行しないセッションで、503をそのまま受け取る
+    session = create_session(max_retries=0)
+
+    assert set(fetch_many(session, url, limiter, 20)) == {200}
+    healthy_rate = limiter.rates()[host]
+    assert healthy_rate > 20
+
+    # 過負荷のサーバー（すべてのリクエストにRetry-After付きの503を返す）
+    server.error_rate = 1.0
+    assert set(fetch_many(session, url, limiter, 3)) == {503}
+    overloaded_rate = limiter.rates()[host]
+    assert overloaded_rate <= healthy_rate / 8
+
+    # 回復したサーバーでは、再び頻度を上げる
+    server.error_rate = 0.0
+    assert set(fetch_many(session, url, limiter, 30)) == {200}
+    assert limiter.rates()[host] > overloaded_rate * 2
+
+
+def test_adaptive_rate_backs_off_on_429_and_respects_min_rate():
+    limiter = AdaptiveRateLimiter(8, min_rate=1, initial_rate=4)
+    url = 'http://example.com/page'
+    for _ in range(5):
+        limiter.observe(url, 429, 0.0)
+        # 下げる前に送ったリクエストの応答とみなされないよう、時刻を進める
+        limiter.hosts['example.com'].last_decrease -= 1
+    assert limiter.rates()['example.com'] == 1
@@ -0,0 +1,72 @@
+import json
+
+from review_io import iter_review_records, write_review_records
+from review_record import ReviewRecord, encode_review, load_reviews
+
+UNIVERSITY_DATA = [
+    {
+        'university_name': 'テスト大学',
+        'url': 'https://www.minkou.jp/university/school/1000/',
+        'review_url': 'https://www.minkou.jp/university/school/review/1000/',
+        'scraped_at': {'date': '2025/01/01', 'source': 'test'},
+        'reviews': [
+            {
+                'review_id': 'answer_1000000',
+                'post_date': '2025/01/01',
+                'overall_rating': '良い',
+                'overall_rating_detail': '良い',
+                'review_content': '良い',
+                'lecture': '普通',
+                'negative_score': 0.25,
+            },
+            {
+                'review_id': 'answer_1000001',
+                'overall_rating': '悪い',
+                'review_content': '設備が古い。\r\n学食は普通。',
+                'extra': {'overall_rating': '悪い', 'tags': ['a', 'b']},
+            },
+        ],
+    },
+    {
+        'university_name': 'テスト大学2',
+        'url': 'https://www.minkou.jp/university/school/1001/',
+        'review_url': 'https://www.minkou.jp/university/school/review/1001/',
+        'reviews': [],
+    },
+]
+
+
+def test_json_round_trip_through_review_records(tmp_path):
+    path = tmp_path / 'merged.json'
+    original = json.dumps(UNIVERSITY_DATA, ensure_ascii=False)
+    path.write_text(original, encoding='utf-8')
+
+    with open(path, encoding='utf-8') as f:
+        data = load_reviews(f)
+    reviews = data[0]['reviews']
+    assert all(isinstance(review, ReviewRecord) for review in reviews)
+    # reviewsの配列にない入れ子のオブジェクトは辞書のまま
+    assert data[0]['scraped_at'].__class__ is dict
+    assert reviews[1]['extra'].__class__ is dict
+    assert reviews[0]['overall_rating'] == '良い' and reviews[0]['overall_rating_detail'] == '良い'
+
+    assert json.dumps(data, ensure_ascii=False, default=encode_review) == original
+
+
+def test_flat_records_share_university_and_round_trip(tmp_path):
+    path = tmp_path / 'merged.json'
+    path.write_text(json.dumps(UNIVERSITY_DATA[:1], ensure_ascii=False), encoding='utf-8')
+
+    records = list(iter_review_records(str(path)))
+    assert records[0].university is records[1].university
+    assert records[0]['university_name'] == 'テスト大学'
+
+    # JSON Linesを経由して大学単位のJSONに戻しても元と同じ（大学の情報はUNIVERSITY_FIELDSだけを持つ）
+    jsonl_path = str(tmp_path / 'records.jsonl')
+    json_path = str(tmp_path / 'round_trip.json')
+    write_review_records(jsonl_path, records)
+    write_review_records(json_path, iter_review_records(jsonl_path))
+    with open(json_path, encoding='utf-8') as f:
+        round_trip = json.load(f)
+    expected = {k: v for k, v in UNIVERSITY_DATA[0].items() if k != 'scraped_at'}
+    assert round_trip == [expected]
@@ -0,0 +1,38 @@
+import pytest
+
+from term_matrix import TermMatrix, TermMatrixBuilder
+
+
+def test_duplicate_university_rows_are_merged(tmp_path):
+    builder = TermMatrixBuilder()
+    builder.add('A大学', {'授業': 2, '設備': 1})
+    builder.add('B大学', {'立地': 1})
+    ids, counts = builder.add('A大学', {'学食': 3, '授業': 1})
+    # 戻り値は追加した分だけの行
+    assert [builder.words[i] for i in ids] == ['学食', '授業'] and counts.tolist() == [3, 1]
+
+    matrix = builder.build()
+    assert matrix.universities == ['A大学', 'B大学']
+    assert matrix.top_k('A大学') == [('授業', 3), ('学食', 3), ('設備', 1)]
+    assert matrix.top_k('B大学') == [('立地', 1)]
+
+    path = str(tmp_path / 'terms')
+    matrix.save(path)
+    assert TermMatrix.load(path).top_k('A大学') == matrix.top_k('A大学')
+
+
+def test_matrix_is_only_built_when_rows_are_kept():
+    builder = TermMatrixBuilder(keep_rows=False)
+    ids, counts = builder.add('A大学', {'授業': 2})
+    assert builder.words == ['授業'] and counts.tolist() == [2]
+    assert builder.rows == {}
+    with pytest.raises(ValueError):
+        builder.build()
+
+
+def test_matrix_rejects_duplicate_university_names():
+    matrix = TermMatrixBuilder()
+    matrix.add('A大学', {'授業': 1})
+    built = matrix.build()
+    with pytest.raises(ValueError):
+        TermMatrix(['A大学', 'A大学'], built.vocab, built.counts)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+from tqdm import tqdm
+
+from morph_tokenizer import DEFAULT_BACKEND, create_tokenizer
+
+# 1回のSQLで問い合わせるキーの数（SQLiteの変数の上限より小さくする）
+QUERY_CHUNK = 500
+
+
+class TokenCache:
+    """
+    テキストの内容のハッシュをキーに形態素解析の結果を保存するSQLiteキャッシュ（スレッドセーフ）
+
+    キーには形態素解析器と品詞の絞り込みのバージョン（MorphTokenizer.version）を含めるため、
+    解析器や設定が変わると別のエントリになる
+    """
+
+    def __init__(self, path='.token_cache.sqlite3'):
+        """
+        Args:
+            path (str): キャッシュファイルのパス（存在しない場合は新規作成）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # パイプラインでは複数のステージが同時に書き込むため、ロックの解放を長めに待つ
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS tokens ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens TEXT NOT NULL)'
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def key(version, text):
+        return hashlib.sha1(f'{version}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, version, texts):
+        """
+        キャッシュ済みのテキストの解析結果を返す
+
+        Args:
+            version (str): 形態素解析器と品詞の絞り込みを表す文字列
+            texts (iterable): テキスト
+
+        Returns:
+            dict: テキスト -> 単語リスト（キャッシュにないテキストは含まない）
+        """
+        keys = {self.key(version, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            for start in range(0, len(key_list), QUERY_CHUNK):
+                chunk = key_list[start:start + QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT key, tokens FROM tokens WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                for key, tokens in rows:
+                    found[keys[key]] = json.loads(tokens)
+        return found
+
+    def put_many(self, version, results):
+        """解析結果（テキスト -> 単語リスト）を保存する"""
+        rows = [(self.key(version, text), json.dumps(tokens, ensure_ascii=False)) for text, tokens in results.items()]
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)', rows)
+            self.conn.commit()
+
+
+class CachedTokenizer:
+    """形態素解析して一般名詞の単語リストを返す。cacheを指定した場合は解析済みのテキストを再解析しない"""
+
+    def __init__(self, cache=None, backend=DEFAULT_BACKEND):
+        """
+        Args:
+            cache (TokenCache): 解析結果のキャッシュ（Noneの場合は毎回解析する）
+            backend (str): 形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+        """
+        self.tokenizer = create_tokenizer(backend)
+        self.version = self.tokenizer.version
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def analyze(self, text):
+        """キャッシュを使わずにテキストを形態素解析する"""
+        return self.tokenizer.nouns(text)
+
+    def analyze_many(self, texts, desc=None):
+        """キャッシュにないテキストをまとめて形態素解析する"""
+        return [self.analyze(text) for text in tqdm(texts, desc=desc, disable=desc is None)]
+
+    def tokenize(self, text):
+        return self.tokenize_many([text])[0]
+
+    def tokenize_many(self, texts, desc=None):
+        """
+        複数のテキストを形態素解析する（キャッシュの問い合わせと保存はまとめて行う）
+
+        Args:
+            texts (list): テキストのリスト
+            desc (str): 解析が必要なテキストの進捗バーの表示名（Noneの場合は表示しない）
+
+        Returns:
+            list: テキストごとの単語リスト
+        """
+        results = self.cache.get_many(self.version, set(texts)) if self.cache is not None else {}
+        self.hits += len(results)
+        pending = [text for text in dict.fromkeys(texts) if text not in results]
+        missing = dict(zip(pending, self.analyze_many(pending, desc)))
+        if missing and self.cache is not None:
+            self.cache.put_many(self.version, missing)
+        self.misses += len(missing)
+        results.update(missing)
+        return [results[text] for text in texts]
@@ -0,0 +1,66 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+from tqdm import tqdm
+
+from morph_tokenizer import DEFAULT_BACKEND, create_tokenizer
+from token_cache import CachedTokenizer
+
+# ワーカープロセスごとの形態素解析器（initializerで1回だけ作る）
+_worker_tokenizer = None
+
+
+def _init_worker(backend):
+    global _worker_tokenizer
+    _worker_tokenizer = CachedTokenizer(backend=backend)
+
+
+def _analyze_chunk(texts):
+    return [_worker_tokenizer.analyze(text) for text in texts]
+
+
+class TokenizerPool(CachedTokenizer):
+    """
+    キャッシュにないテキストの形態素解析を複数のプロセスに分けて行うCachedTokenizer
+
+    キャッシュの問い合わせと保存は親プロセスで行い、ワーカーには解析が必要なテキストだけを
+    チャンクに分けて渡す。結果は入力の順に受け取るため、出力は1プロセスの場合と同じになる
+    """
+
+    def __init__(self, workers, cache=None, backend=DEFAULT_BACKEND, chunks_per_worker=4):
+        """
+        Args:
+            workers (int): ワーカープロセス数
+            cache (TokenCache): 解析結果のキャッシュ（Noneの場合は毎回解析する）
+            backend (str): 形態素解析器（'janome' / 'fugashi' / 'sudachi'）
+            chunks_per_worker (int): 1回の解析でワーカー1つあたりに割り当てるチャンク数の目安
+        """
+        # キャッシュのキーに使うバージョンの取得と、解析器が使えることの確認を兼ねて親プロセスでも1回作る
+        self.tokenizer = create_tokenizer(backend)
+        self.version = self.tokenizer.version
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.workers = workers
+        self.chunks_per_worker = chunks_per_worker
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend,))
+
+    def analyze(self, text):
+        return self.analyze_many([text])[0]
+
+    def analyze_many(self, texts, desc=None):
+        if not texts:
+            return []
+        chunk_size = max(1, math.ceil(len(texts) / (self.workers * self.chunks_per_worker)))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        results = []
+        with tqdm(total=len(texts), desc=desc, disable=desc is None) as progress:
+            # mapは投入した順に結果を返すので、並び順はワーカーの完了順に左右されない
+            for chunk, tokens in zip(chunks, self.executor.map(_analyze_chunk, chunks)):
+                results.extend(tokens)
+                progress.update(len(chunk))
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+        super().close()
@@ -0,0 +1,310 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from rate_limiter import SharedRateLimiter
+
+# タスクの状態
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+# リースしたタスク。tokenはリースごとに異なり、期限切れで他のワーカーに再配信された後の完了・失敗の記録を防ぐ
+Task = namedtuple('Task', ['id', 'key', 'kind', 'payload', 'attempts', 'token'])
+
+
+class WorkQueue(ABC):
+    """
+    複数のワーカーで共有する作業キューの共通インターフェース
+
+    タスクはキーで重複を除いて登録し、ワーカーは期限（可視性タイムアウト）付きでリースする。
+    期限までに完了・失敗が記録されなかったタスク（ワーカーの停止など）は、期限が過ぎると他のワーカーに再配信される
+    """
+
+    name = None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @abstractmethod
+    def put_many(self, tasks):
+        """
+        タスクをまとめて登録する（同じキーのタスクは無視される）
+
+        Args:
+            tasks (iterable): (キー, 種類, ペイロード（JSONに変換できる辞書）, 優先度) のタプル
+
+        Returns:
+            int: 新しく登録したタスク数
+        """
+
+    @abstractmethod
+    def lease(self, worker_id, limit=1, timeout=120.0, max_attempts=3):
+        """
+        優先度の高い順（値が小さい順、同じ優先度では登録順）に、未処理または期限切れのタスクをリースする
+
+        期限切れで再配信するタスクのうち、配信回数がmax_attemptsに達したものは失敗にする
+
+        Args:
+            worker_id (str): ワーカーの識別子
+            limit (int): リースする最大のタスク数
+            timeout (float): リースの期限（秒）
+
+        Returns:
+            list: Taskのリスト（リースできるタスクがなければ空）
+        """
+
+    @abstractmethod
+    def extend(self, task, timeout=120.0):
+        """リースの期限を延長する。リースを失っていた場合はFalseを返す"""
+
+    @abstractmethod
+    def ack(self, task):
+        """タスクの完了を記録する。リースを失っていた場合はFalseを返す"""
+
+    @abstractmethod
+    def fail(self, task, error, max_attempts=3, retry_delay=0.0):
+        """
+        タスクの失敗を記録する
+
+        配信回数がmax_attemptsに達するまではretry_delay秒後に再びリースできるようにする
+
+        Returns:
+            bool: 再試行する場合はTrue
+        """
+
+    @abstractmethod
+    def release(self, task):
+        """リースしたタスクを処理せずに返す（配信回数は戻す）"""
+
+    @abstractmethod
+    def counts(self):
+        """
+        種類・状態ごとのタスク数を返す
+
+        Returns:
+            dict: (種類, 状態) -> タスク数
+        """
+
+    def is_drained(self):
+        """未処理・リース中のタスクがない（すべて完了か失敗）かどうか"""
+        counts = self.counts()
+        return bool(counts) and not any(count for (_, state), count in counts.items() if state in (PENDING, LEASED))
+
+    @abstractmethod
+    def failed_tasks(self):
+        """失敗したタスクを (キー, エラー) のリストで返す"""
+
+    @abstractmethod
+    def unfinished_tasks(self, kind):
+        """
+        指定した種類のタスクのうち、完了していないもの（未処理・リース中・失敗）を返す
+
+        Returns:
+            list: (ペイロード, 状態, エラー) のリスト
+        """
+
+    @abstractmethod
+    def requeue_failed(self):
+        """失敗したタスクを未処理に戻し、戻したタスク数を返す"""
+
+    @abstractmethod
+    def clear(self):
+        """すべてのタスクを削除する"""
+
+    @abstractmethod
+    def rate_limiter(self):
+        """このキューを共有するすべてのワーカーで共通のレート制限器を返す"""
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+    SQLiteファイルの作業キュー（スレッドセーフ・複数プロセスで共有可能）
+
+    リースはファイルの書き込みロック（BEGIN IMMEDIATE）の中で行うため、同じタスクが同時に2つのワーカーに渡ることはない。
+    SQLiteのロックはネットワークファイルシステム上では信頼できないため、1台のマシンの複数プロセスで共有する
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path='crawl_queue.sqlite3'):
+        """
+        Args:
+            path (str): キューのファイルパス（存在しない場合は新規作成）
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' key TEXT NOT NULL UNIQUE,'
+            ' kind TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            f" state TEXT NOT NULL DEFAULT '{PENDING}',"
+            # 未処理のタスクではリースできるようになる時刻、リース中のタスクではリースの期限
+            ' available_at REAL NOT NULL,'
+            ' lease_owner TEXT,'
+            ' lease_token TEXT,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (state, priority, id)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _transaction(self, func, *args):
+        """書き込みロックを取ってfuncを実行する"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(*args)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return result
+
+    def put_many(self, tasks):
+        now = time.time()
+        rows = [(key, kind, json.dumps(payload, ensure_ascii=False), priority, now, now)
+                for key, kind, payload, priority in tasks]
+
+        def insert():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO tasks (key, kind, payload, priority, available_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            return self.conn.total_changes - before
+
+        return self._transaction(insert) if rows else 0
+
+    def lease(self, worker_id, limit=1, timeout=120.0, max_attempts=3):
+        def claim():
+            now = time.time()
+            tasks = []
+            while len(tasks) < limit:
+                rows = self.conn.execute(
+                    'SELECT id, key, kind, payload, attempts, state FROM tasks'
+                    ' WHERE state IN (?, ?) AND available_at <= ? ORDER BY priority, id LIMIT ?',
+                    (PENDING, LEASED, now, limit - len(tasks)),
+                ).fetchall()
+                if not rows:
+                    break
+                for task_id, key, kind, payload, attempts, state in rows:
+                    if state == LEASED and attempts >= max_attempts:
+                        # 処理中のワーカーが何度も停止したタスクは、これ以上配信しない
+                        self.conn.execute('UPDATE tasks SET state = ?, lease_token = NULL, error = ?, updated_at = ?'
+                                          ' WHERE id = ?', (FAILED, 'リースの期限切れ', now, task_id))
+                        continue
+                    token = uuid.uuid4().hex
+                    self.conn.execute(
+                        'UPDATE tasks SET state = ?, available_at = ?, lease_owner = ?, lease_token = ?,'
+                        ' attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                        (LEASED, now + timeout, worker_id, token, now, task_id),
+                    )
+                    tasks.append(Task(task_id, key, kind, json.loads(payload), attempts + 1, token))
+            return tasks
+
+        return self._transaction(claim)
+
+    def _update_leased(self, task, assignments, params):
+        def update():
+            cursor = self.conn.execute(
+                f'UPDATE tasks SET {assignments}, updated_at = ? WHERE id = ? AND state = ? AND lease_token = ?',
+                (*params, time.time(), task.id, LEASED, task.token),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(update)
+
+    def extend(self, task, timeout=120.0):
+        return self._update_leased(task, 'available_at = ?', (time.time() + timeout,))
+
+    def ack(self, task):
+        return self._update_leased(task, 'state = ?, lease_token = NULL, error = NULL', (DONE,))
+
+    def fail(self, task, error, max_attempts=3, retry_delay=0.0):
+        retry = task.attempts < max_attempts
+        self._update_leased(
+            task, 'state = ?, available_at = ?, lease_token = NULL, error = ?',
+            (PENDING if retry else FAILED, time.time() + retry_delay, str(error)),
+        )
+        return retry
+
+    def release(self, task):
+        return self._update_leased(task, 'state = ?, available_at = ?, lease_token = NULL, attempts = attempts - 1',
+                                   (PENDING, time.time()))
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state').fetchall()
+        return {(kind, state): count for kind, state, count in rows}
+
+    def failed_tasks(self):
+        with self.lock:
+            return self.conn.execute('SELECT key, error FROM tasks WHERE state = ? ORDER BY id', (FAILED,)).fetchall()
+
+    def unfinished_tasks(self, kind):
+        with self.lock:
+            rows = self.conn.execute('SELECT payload, state, error FROM tasks WHERE kind = ? AND state != ? ORDER BY id',
+                                     (kind, DONE)).fetchall()
+        return [(json.loads(payload), state, error) for payload, state, error in rows]
+
+    def requeue_failed(self):
+        def requeue():
+            cursor = self.conn.execute(
+                'UPDATE tasks SET state = ?, attempts = 0, available_at = ?, updated_at = ? WHERE state = ?',
+                (PENDING, time.time(), time.time(), FAILED),
+            )
+            return cursor.rowcount
+
+        return self._transaction(requeue)
+
+    def clear(self):
+        self._transaction(self.conn.execute, 'DELETE FROM tasks')
+
+    def rate_limiter(self):
+        # トークンバケットはキューと同じファイルに置く
+        return SharedRateLimiter(self.path)
+
+
+BACKENDS = {
+    'sqlite': SqliteWorkQueue,
+}
+
+
+def open_queue(spec):
+    """
+    作業キューを開く
+
+    Args:
+        spec (str): '<バックエンド名>:<場所>'（例: 'sqlite:crawl_queue.sqlite3'）。
+            バックエンド名を省略した場合はSQLiteファイルのパスとみなす
+
+    Returns:
+        WorkQueue: 作業キュー
+    """
+    backend, sep, location = spec.partition(':')
+    if not sep or backend not in BACKENDS:
+        if sep and '/' not in backend and '\\' not in backend and len(backend) > 1:
+            raise ValueError(f"未対応のキューのバックエンドです: {backend}（{', '.join(BACKENDS)}）")
+        backend, location = 'sqlite', spec
+    return BACKENDS[backend](location)